@@ -416,6 +416,10 @@ def subvertpy_modules():
             [source_path(n)
                 for n in ["util.c", "subr.c"]],
             libraries=["svn_subr-1"]),
+        Extension(
+            "subvertpy._delta", [source_path("_delta.c")]),
+        Extension(
+            "subvertpy._marshall", [source_path("_marshall.c")]),
         ]
 
 
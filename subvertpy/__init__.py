@@ -16,6 +16,9 @@
 
 """Python bindings for Subversion."""
 
+import os
+import sys
+
 __author__ = "Jelmer Vernooij <jelmer@jelmer.uk>"
 __version__ = (0, 11, 0)
 
@@ -69,6 +72,8 @@ ERR_RA_DAV_FORBIDDEN = 175013
 ERR_WC_SCHEDULE_CONFLICT = 155013
 ERR_RA_DAV_PROPPATCH_FAILED = 175008
 ERR_SVNDIFF_CORRUPT_WINDOW = 185001
+ERR_SVNDIFF_INVALID_HEADER = 185000
+ERR_SVNDIFF_UNEXPECTED_END = 185004
 ERR_FS_CONFLICT = 160024
 ERR_NODE_UNKNOWN_KIND = 145000
 ERR_RA_SERF_SSL_CERT_UNTRUSTED = 230001
@@ -112,22 +117,83 @@ def _check_mtime(m):
 
     :param m: Python module that is a C extension
     """
-    import os
-    (base, _) = os.path.splitext(m.__file__)
+    return _check_file_mtime(m.__file__)
+
+
+def _check_file_mtime(path):
+    """Check whether a C extension file is older than its source.
+
+    :param path: Path to the C extension
+    """
+    (base, _) = os.path.splitext(path)
     c_file = "%s.c" % base
     if not os.path.exists(c_file):
         return True
-    if os.path.getmtime(m.__file__) < os.path.getmtime(c_file):
+    if os.path.getmtime(path) < os.path.getmtime(c_file):
         return False
     return True
 
 
-try:
-    from subvertpy import client, _ra, repos, wc
-    for x in client, _ra, repos, wc:
-        if not _check_mtime(x):
+def _find_extension(name):
+    """Find the file of a C extension without loading it.
+
+    :param name: Name of the extension, e.g. "client"
+    :return: Path to the extension, or None if it can not be found
+    """
+    try:
+        from importlib.util import find_spec
+    except ImportError:  # Python < 3.4
+        import imp
+        try:
+            return imp.find_module(name, __path__)[1]
+        except ImportError:
+            return None
+    spec = find_spec(__name__ + "." + name)
+    if spec is None or not spec.has_location:
+        return None
+    return spec.origin
+
+
+def _check_extensions():
+    """Warn if any of the C extensions is older than its source."""
+    for name in _EXTENSIONS:
+        path = _find_extension(name)
+        if path is not None and not _check_file_mtime(path):
             from warnings import warn
             warn("subvertpy extensions are outdated and need to be rebuilt")
             break
-except ImportError as e:
-    raise ImportError("Unable to load subvertpy extensions: %s" % e)
+
+
+# C extensions that are loaded on first access, e.g. subvertpy.client
+_EXTENSIONS = ("client", "_ra", "repos", "subr", "wc")
+
+# Set SUBVERTPY_DEBUG to warn about extensions that are older than their
+# sources. The check runs when the package is imported, which happens
+# for every submodule import, and only stats the extension files.
+_DEBUG = bool(os.environ.get("SUBVERTPY_DEBUG"))
+
+
+def _load_extension(name):
+    import importlib
+    try:
+        return importlib.import_module("subvertpy." + name)
+    except ImportError as e:
+        raise ImportError("Unable to load subvertpy extensions: %s" % e)
+
+
+def __getattr__(name):
+    if name in _EXTENSIONS:
+        return _load_extension(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if _DEBUG:
+    _check_extensions()
+
+
+if sys.version_info < (3, 7):
+    # Module level __getattr__ is not supported, so load the extensions
+    # that have always been available as attributes up front.
+    for _name in ("client", "_ra", "repos", "wc"):
+        _load_extension(_name)
+    del _name
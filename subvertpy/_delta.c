@@ -0,0 +1,634 @@
+/*
+ * Copyright © 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+ * -*- coding: utf-8 -*-
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU Lesser General Public License as published by
+ * the Free Software Foundation; either version 2.1 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
+ */
+
+/*
+ * Accelerated versions of the svndiff0 routines in subvertpy.delta.
+ *
+ * This module does not depend on any of the Subversion libraries, and
+ * is optional: subvertpy.delta falls back to its pure-Python
+ * implementation if it is not available.
+ */
+
+#include <Python.h>
+#include <stdbool.h>
+#include <string.h>
+
+#define TXDELTA_SOURCE 0
+#define TXDELTA_TARGET 1
+#define TXDELTA_NEW 2
+
+#define MAX_ENCODED_INT_LEN 10
+/* Instruction byte, encoded length and encoded offset */
+#define MAX_INSTRUCTION_LEN (1 + 2 * MAX_ENCODED_INT_LEN)
+
+#define SVNDIFF0_HEADER "SVN\0"
+#define SVNDIFF_HEADER_LEN 4
+
+typedef unsigned long long svndiff_int_t;
+
+struct growbuf {
+    unsigned char *data;
+    Py_ssize_t len;
+    Py_ssize_t size;
+};
+
+static bool growbuf_reserve(struct growbuf *buf, Py_ssize_t extra)
+{
+    unsigned char *data;
+    Py_ssize_t size;
+
+    if (buf->len + extra <= buf->size)
+        return true;
+
+    size = buf->size * 2;
+    if (size < buf->len + extra)
+        size = buf->len + extra;
+
+    data = PyMem_Realloc(buf->data, size);
+    if (data == NULL) {
+        PyErr_NoMemory();
+        return false;
+    }
+    buf->data = data;
+    buf->size = size;
+    return true;
+}
+
+static bool growbuf_append(struct growbuf *buf, const void *data,
+                           Py_ssize_t len)
+{
+    if (!growbuf_reserve(buf, len))
+        return false;
+    memcpy(buf->data + buf->len, data, len);
+    buf->len += len;
+    return true;
+}
+
+/* Based on encode_int() in subversion/libsvn_delta/svndiff.c */
+static Py_ssize_t encode_length(unsigned char *p, svndiff_int_t len)
+{
+    svndiff_int_t v = len >> 7;
+    int n = 1, i;
+
+    while (v > 0) {
+        v >>= 7;
+        n++;
+    }
+
+    for (i = n - 1; i >= 0; i--) {
+        *p++ = ((len >> (i * 7)) & 0x7f) | (i > 0 ? 0x80 : 0);
+    }
+
+    return n;
+}
+
+static bool decode_length(const unsigned char **p, const unsigned char *end,
+                          svndiff_int_t *ret)
+{
+    svndiff_int_t v = 0;
+    int i;
+
+    for (i = 0; i < MAX_ENCODED_INT_LEN; i++) {
+        unsigned char c;
+        if (*p >= end) {
+            PyErr_SetString(PyExc_ValueError, "Truncated svndiff data");
+            return false;
+        }
+        c = *(*p)++;
+        v = (v << 7) | (c & 0x7f);
+        if (!(c & 0x80)) {
+            *ret = v;
+            return true;
+        }
+    }
+
+    PyErr_SetString(PyExc_ValueError, "Encoded integer too long");
+    return false;
+}
+
+static bool py_to_length(PyObject *obj, svndiff_int_t *ret)
+{
+    Py_ssize_t v = PyNumber_AsSsize_t(obj, PyExc_OverflowError);
+    if (v == -1 && PyErr_Occurred())
+        return false;
+    if (v < 0) {
+        PyErr_SetString(PyExc_ValueError, "negative length in delta window");
+        return false;
+    }
+    *ret = v;
+    return true;
+}
+
+static bool parse_op(PyObject *op, int *action, Py_ssize_t *offset,
+                     Py_ssize_t *length)
+{
+    PyObject *seq;
+    Py_ssize_t v;
+
+    seq = PySequence_Fast(op, "delta operation should be a sequence");
+    if (seq == NULL)
+        return false;
+
+    if (PySequence_Fast_GET_SIZE(seq) != 3) {
+        PyErr_SetString(PyExc_ValueError,
+                        "expected (action, offset, length) tuple");
+        Py_DECREF(seq);
+        return false;
+    }
+
+    v = PyNumber_AsSsize_t(PySequence_Fast_GET_ITEM(seq, 0),
+                           PyExc_OverflowError);
+    if (v == -1 && PyErr_Occurred())
+        goto fail;
+    *action = (int)v;
+    *offset = PyNumber_AsSsize_t(PySequence_Fast_GET_ITEM(seq, 1),
+                                 PyExc_OverflowError);
+    if (*offset == -1 && PyErr_Occurred())
+        goto fail;
+    *length = PyNumber_AsSsize_t(PySequence_Fast_GET_ITEM(seq, 2),
+                                 PyExc_OverflowError);
+    if (*length == -1 && PyErr_Occurred())
+        goto fail;
+
+    Py_DECREF(seq);
+
+    if (*offset < 0 || *length < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "negative offset or length in delta operation");
+        return false;
+    }
+    return true;
+
+fail:
+    Py_DECREF(seq);
+    return false;
+}
+
+static Py_ssize_t pack_instruction(unsigned char *p, int action,
+                                   Py_ssize_t offset, Py_ssize_t length)
+{
+    Py_ssize_t n;
+
+    if (length < 0x3f) {
+        p[0] = (action << 6) + length;
+        n = 1;
+    } else {
+        p[0] = action << 6;
+        n = 1 + encode_length(p + 1, length);
+    }
+    if (action != TXDELTA_NEW)
+        n += encode_length(p + n, offset);
+    return n;
+}
+
+static bool pack_window(struct growbuf *out, PyObject *window)
+{
+    PyObject *seq = NULL, *ops = NULL;
+    Py_buffer new_data;
+    struct growbuf instrdata = { NULL, 0, 0 };
+    unsigned char header[5 * MAX_ENCODED_INT_LEN];
+    svndiff_int_t sview_offset, sview_len, tview_len;
+    Py_ssize_t i, n;
+    bool ret = false;
+
+    new_data.obj = NULL;
+
+    seq = PySequence_Fast(window, "delta window should be a sequence");
+    if (seq == NULL)
+        return false;
+
+    if (PySequence_Fast_GET_SIZE(seq) != 6) {
+        PyErr_SetString(PyExc_ValueError,
+                        "expected window with 6 elements");
+        goto done;
+    }
+
+    if (!py_to_length(PySequence_Fast_GET_ITEM(seq, 0), &sview_offset) ||
+        !py_to_length(PySequence_Fast_GET_ITEM(seq, 1), &sview_len) ||
+        !py_to_length(PySequence_Fast_GET_ITEM(seq, 2), &tview_len))
+        goto done;
+
+    ops = PySequence_Fast(PySequence_Fast_GET_ITEM(seq, 4),
+                          "delta operations should be a sequence");
+    if (ops == NULL)
+        goto done;
+
+    if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(seq, 5), &new_data,
+                           PyBUF_SIMPLE) != 0)
+        goto done;
+
+    for (i = 0; i < PySequence_Fast_GET_SIZE(ops); i++) {
+        int action;
+        Py_ssize_t offset, length;
+
+        if (!parse_op(PySequence_Fast_GET_ITEM(ops, i), &action, &offset,
+                      &length))
+            goto done;
+
+        if (!growbuf_reserve(&instrdata, MAX_INSTRUCTION_LEN))
+            goto done;
+
+        instrdata.len += pack_instruction(instrdata.data + instrdata.len,
+                                          action, offset, length);
+    }
+
+    n = encode_length(header, sview_offset);
+    n += encode_length(header + n, sview_len);
+    n += encode_length(header + n, tview_len);
+    n += encode_length(header + n, instrdata.len);
+    n += encode_length(header + n, new_data.len);
+
+    if (!growbuf_reserve(out, n + instrdata.len + new_data.len))
+        goto done;
+
+    growbuf_append(out, header, n);
+    growbuf_append(out, instrdata.data, instrdata.len);
+    growbuf_append(out, new_data.buf, new_data.len);
+
+    ret = true;
+
+done:
+    if (new_data.obj != NULL)
+        PyBuffer_Release(&new_data);
+    PyMem_Free(instrdata.data);
+    Py_XDECREF(ops);
+    Py_DECREF(seq);
+    return ret;
+}
+
+static PyObject *py_pack_svndiff0_window(PyObject *self, PyObject *window)
+{
+    struct growbuf out = { NULL, 0, 0 };
+    PyObject *ret;
+
+    if (!pack_window(&out, window)) {
+        PyMem_Free(out.data);
+        return NULL;
+    }
+
+    ret = PyByteArray_FromStringAndSize((char *)out.data, out.len);
+    PyMem_Free(out.data);
+    return ret;
+}
+
+static PyObject *py_pack_svndiff0(PyObject *self, PyObject *windows)
+{
+    struct growbuf out = { NULL, 0, 0 };
+    PyObject *iter, *window, *ret;
+
+    iter = PyObject_GetIter(windows);
+    if (iter == NULL)
+        return NULL;
+
+    if (!growbuf_append(&out, SVNDIFF0_HEADER, SVNDIFF_HEADER_LEN))
+        goto fail;
+
+    while ((window = PyIter_Next(iter)) != NULL) {
+        bool ok = pack_window(&out, window);
+        Py_DECREF(window);
+        if (!ok)
+            goto fail;
+    }
+
+    if (PyErr_Occurred())
+        goto fail;
+
+    Py_DECREF(iter);
+    ret = PyBytes_FromStringAndSize((char *)out.data, out.len);
+    PyMem_Free(out.data);
+    return ret;
+
+fail:
+    Py_DECREF(iter);
+    PyMem_Free(out.data);
+    return NULL;
+}
+
+static PyObject *py_txdelta_apply_ops(PyObject *self, PyObject *args)
+{
+    PyObject *src_ops, *py_ops, *py_new_data, *py_sview, *ops, *ret = NULL;
+    Py_buffer new_data, sview;
+    Py_ssize_t i, tlen = 0, pos = 0;
+    unsigned char *tview;
+
+    if (!PyArg_ParseTuple(args, "OOOO", &src_ops, &py_ops, &py_new_data,
+                          &py_sview))
+        return NULL;
+
+    ops = PySequence_Fast(py_ops, "delta operations should be a sequence");
+    if (ops == NULL)
+        return NULL;
+
+    if (PyObject_GetBuffer(py_new_data, &new_data, PyBUF_SIMPLE) != 0) {
+        Py_DECREF(ops);
+        return NULL;
+    }
+
+    if (PyObject_GetBuffer(py_sview, &sview, PyBUF_SIMPLE) != 0) {
+        PyBuffer_Release(&new_data);
+        Py_DECREF(ops);
+        return NULL;
+    }
+
+    /* Determine the maximum size of the target view up front, so that
+     * it only has to be allocated once. */
+    for (i = 0; i < PySequence_Fast_GET_SIZE(ops); i++) {
+        int action;
+        Py_ssize_t offset, length;
+
+        if (!parse_op(PySequence_Fast_GET_ITEM(ops, i), &action, &offset,
+                      &length))
+            goto done;
+        if (length > PY_SSIZE_T_MAX - tlen) {
+            PyErr_SetString(PyExc_OverflowError, "target view too large");
+            goto done;
+        }
+        tlen += length;
+    }
+
+    ret = PyByteArray_FromStringAndSize(NULL, tlen);
+    if (ret == NULL)
+        goto done;
+    tview = (unsigned char *)PyByteArray_AS_STRING(ret);
+
+    for (i = 0; i < PySequence_Fast_GET_SIZE(ops); i++) {
+        int action;
+        Py_ssize_t offset, length;
+
+        if (!parse_op(PySequence_Fast_GET_ITEM(ops, i), &action, &offset,
+                      &length))
+            goto fail;
+
+        switch (action) {
+            case TXDELTA_SOURCE:
+                /* Copy from source area, with slice semantics. */
+                if (offset > sview.len)
+                    offset = sview.len;
+                if (length > sview.len - offset)
+                    length = sview.len - offset;
+                memcpy(tview + pos, (unsigned char *)sview.buf + offset,
+                       length);
+                pos += length;
+                break;
+            case TXDELTA_TARGET:
+                /* The source and target may overlap, in which case the
+                 * bytes between offset and pos repeat. Every copy is
+                 * non-overlapping, and the copied span doubles each
+                 * iteration. */
+                if (offset >= pos) {
+                    PyErr_SetString(PyExc_IndexError,
+                                    "target copy beyond end of target view");
+                    goto fail;
+                }
+                while (length > 0) {
+                    Py_ssize_t n = pos - offset;
+                    if (n > length)
+                        n = length;
+                    memcpy(tview + pos, tview + offset, n);
+                    pos += n;
+                    length -= n;
+                }
+                break;
+            case TXDELTA_NEW:
+                if (offset > new_data.len)
+                    offset = new_data.len;
+                if (length > new_data.len - offset)
+                    length = new_data.len - offset;
+                memcpy(tview + pos, (unsigned char *)new_data.buf + offset,
+                       length);
+                pos += length;
+                break;
+            default:
+                PyErr_SetString(PyExc_Exception,
+                                "Invalid delta instruction code");
+                goto fail;
+        }
+    }
+
+    if (pos != tlen && PyByteArray_Resize(ret, pos) != 0)
+        goto fail;
+
+    goto done;
+
+fail:
+    Py_CLEAR(ret);
+
+done:
+    PyBuffer_Release(&sview);
+    PyBuffer_Release(&new_data);
+    Py_DECREF(ops);
+    return ret;
+}
+
+typedef struct {
+    PyObject_HEAD
+    Py_buffer text;
+    Py_ssize_t offset;
+} SvndiffIteratorObject;
+
+static PyObject *svndiff_iter_next(SvndiffIteratorObject *self)
+{
+    const unsigned char *p, *end, *instr_end;
+    svndiff_int_t sview_offset, sview_len, tview_len, instr_len, newdata_len;
+    svndiff_int_t new_offset;
+    PyObject *ops, *newdata;
+
+    if (self->text.obj == NULL || self->offset >= self->text.len)
+        return NULL;
+
+    p = (const unsigned char *)self->text.buf + self->offset;
+    end = (const unsigned char *)self->text.buf + self->text.len;
+
+    if (!decode_length(&p, end, &sview_offset) ||
+        !decode_length(&p, end, &sview_len) ||
+        !decode_length(&p, end, &tview_len) ||
+        !decode_length(&p, end, &instr_len) ||
+        !decode_length(&p, end, &newdata_len))
+        return NULL;
+
+    if (instr_len > (svndiff_int_t)(end - p) ||
+        newdata_len > (svndiff_int_t)(end - p) - instr_len) {
+        PyErr_SetString(PyExc_ValueError, "Truncated svndiff window");
+        return NULL;
+    }
+
+    ops = PyList_New(0);
+    if (ops == NULL)
+        return NULL;
+
+    /* New data is consumed in order, so new ops carry no offset */
+    new_offset = 0;
+    instr_end = p + instr_len;
+    while (p < instr_end) {
+        int action = *p >> 6;
+        svndiff_int_t length = *p & 0x3f, offset = 0;
+        PyObject *op;
+        p++;
+
+        if (action == TXDELTA_NEW + 1) {
+            PyErr_SetString(PyExc_Exception,
+                            "Invalid delta instruction code");
+            goto fail;
+        }
+        if (length == 0 && !decode_length(&p, instr_end, &length))
+            goto fail;
+        if (action == TXDELTA_NEW) {
+            offset = new_offset;
+            new_offset += length;
+        } else if (!decode_length(&p, instr_end, &offset)) {
+            goto fail;
+        }
+
+        op = Py_BuildValue("(iKK)", action, offset, length);
+        if (op == NULL)
+            goto fail;
+        if (PyList_Append(ops, op) != 0) {
+            Py_DECREF(op);
+            goto fail;
+        }
+        Py_DECREF(op);
+    }
+
+    newdata = PyBytes_FromStringAndSize((const char *)p, newdata_len);
+    if (newdata == NULL)
+        goto fail;
+    p += newdata_len;
+
+    self->offset = p - (const unsigned char *)self->text.buf;
+
+    return Py_BuildValue("(KKKnNN)", sview_offset, sview_len, tview_len,
+                         PyList_GET_SIZE(ops), ops, newdata);
+
+fail:
+    Py_DECREF(ops);
+    return NULL;
+}
+
+static void svndiff_iter_dealloc(SvndiffIteratorObject *self)
+{
+    if (self->text.obj != NULL)
+        PyBuffer_Release(&self->text);
+    PyObject_Del(self);
+}
+
+static PyTypeObject SvndiffIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "subvertpy._delta.SvndiffIterator", /*	const char *tp_name;  For printing, in format "<module>.<name>" */
+    sizeof(SvndiffIteratorObject),
+    0,/*	Py_ssize_t tp_basicsize, tp_itemsize;  For allocation */
+
+    /* Methods to implement standard operations */
+
+    .tp_dealloc = (destructor)svndiff_iter_dealloc, /*	destructor tp_dealloc;	*/
+
+#if PY_MAJOR_VERSION < 3
+    /* Flags to define presence of optional/expanded features */
+    .tp_flags = Py_TPFLAGS_HAVE_ITER, /*	long tp_flags;	*/
+#endif
+
+    /* Iterators */
+    .tp_iter = PyObject_SelfIter,
+    .tp_iternext = (iternextfunc)svndiff_iter_next,
+};
+
+static PyObject *py_unpack_svndiff0(PyObject *self, PyObject *text)
+{
+    SvndiffIteratorObject *ret;
+
+    ret = PyObject_New(SvndiffIteratorObject, &SvndiffIterator_Type);
+    if (ret == NULL)
+        return NULL;
+    ret->text.obj = NULL;
+    ret->offset = SVNDIFF_HEADER_LEN;
+
+    if (PyObject_GetBuffer(text, &ret->text, PyBUF_SIMPLE) != 0) {
+        Py_DECREF(ret);
+        return NULL;
+    }
+
+    if (ret->text.len < SVNDIFF_HEADER_LEN ||
+        memcmp(ret->text.buf, SVNDIFF0_HEADER, SVNDIFF_HEADER_LEN) != 0) {
+        PyErr_SetString(PyExc_ValueError, "Not a svndiff0 stream");
+        Py_DECREF(ret);
+        return NULL;
+    }
+
+    return (PyObject *)ret;
+}
+
+static PyMethodDef delta_methods[] = {
+    { "pack_svndiff0_window", py_pack_svndiff0_window, METH_O,
+        "pack_svndiff0_window(window) -> bytearray\n"
+        "Pack an individual window using svndiff0." },
+    { "pack_svndiff0", py_pack_svndiff0, METH_O,
+        "pack_svndiff0(windows) -> bytes\n"
+        "Pack a SVN diff file." },
+    { "unpack_svndiff0", py_unpack_svndiff0, METH_O,
+        "unpack_svndiff0(text) -> iterator\n"
+        "Unpack a version 0 svndiff text." },
+    { "txdelta_apply_ops", py_txdelta_apply_ops, METH_VARARGS,
+        "txdelta_apply_ops(src_ops, ops, new_data, sview) -> bytearray\n"
+        "Apply txdelta operations to a source view." },
+    { NULL }
+};
+
+static PyObject *
+moduleinit(void)
+{
+    PyObject *mod;
+
+    if (PyType_Ready(&SvndiffIterator_Type) < 0)
+        return NULL;
+
+#if PY_MAJOR_VERSION >= 3
+    static struct PyModuleDef moduledef = {
+      PyModuleDef_HEAD_INIT,
+      "_delta",         /* m_name */
+      "Accelerated svndiff routines", /* m_doc */
+      -1,              /* m_size */
+      delta_methods, /* m_methods */
+      NULL,            /* m_reload */
+      NULL,            /* m_traverse */
+      NULL,            /* m_clear*/
+      NULL,            /* m_free */
+    };
+    mod = PyModule_Create(&moduledef);
+#else
+    mod = Py_InitModule3("_delta", delta_methods,
+                         "Accelerated svndiff routines");
+#endif
+    if (mod == NULL)
+        return NULL;
+
+    return mod;
+}
+
+#if PY_MAJOR_VERSION >= 3
+PyMODINIT_FUNC
+PyInit__delta(void)
+{
+    return moduleinit();
+}
+#else
+PyMODINIT_FUNC
+init_delta(void)
+{
+    moduleinit();
+}
+#endif
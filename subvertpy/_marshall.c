@@ -0,0 +1,638 @@
+/*
+ * Copyright © 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+ * -*- coding: utf-8 -*-
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU Lesser General Public License as published by
+ * the Free Software Foundation; either version 2.1 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
+ */
+
+/*
+ * Accelerated versions of the routines in subvertpy.marshall.
+ *
+ * This module does not depend on any of the Subversion libraries, and
+ * is optional: subvertpy.marshall falls back to its pure-Python
+ * implementation if it is not available.
+ */
+
+#include <Python.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <string.h>
+
+/* literal, MarshallError and NeedMoreData from subvertpy.marshall */
+static PyObject *literal_type;
+static PyObject *marshall_error;
+static PyObject *need_more_data;
+
+static bool load_marshall_types(void)
+{
+    PyObject *mod;
+
+    if (literal_type != NULL)
+        return true;
+
+    mod = PyImport_ImportModule("subvertpy.marshall");
+    if (mod == NULL)
+        return false;
+    literal_type = PyObject_GetAttrString(mod, "literal");
+    marshall_error = PyObject_GetAttrString(mod, "MarshallError");
+    need_more_data = PyObject_GetAttrString(mod, "NeedMoreData");
+    Py_DECREF(mod);
+    if (literal_type == NULL || marshall_error == NULL ||
+        need_more_data == NULL) {
+        Py_CLEAR(literal_type);
+        Py_CLEAR(marshall_error);
+        Py_CLEAR(need_more_data);
+        return false;
+    }
+    return true;
+}
+
+struct growbuf {
+    char *data;
+    Py_ssize_t len;
+    Py_ssize_t size;
+};
+
+static bool growbuf_reserve(struct growbuf *buf, Py_ssize_t extra)
+{
+    char *data;
+    Py_ssize_t size;
+
+    if (buf->len + extra <= buf->size)
+        return true;
+
+    size = buf->size * 2;
+    if (size < buf->len + extra)
+        size = buf->len + extra;
+
+    data = PyMem_Realloc(buf->data, size);
+    if (data == NULL) {
+        PyErr_NoMemory();
+        return false;
+    }
+    buf->data = data;
+    buf->size = size;
+    return true;
+}
+
+static bool growbuf_append(struct growbuf *buf, const void *data,
+                           Py_ssize_t len)
+{
+    if (!growbuf_reserve(buf, len))
+        return false;
+    memcpy(buf->data + buf->len, data, len);
+    buf->len += len;
+    return true;
+}
+
+static bool marshall_string(struct growbuf *buf, const char *data,
+                            Py_ssize_t len)
+{
+    char prefix[32];
+    int n;
+
+    n = snprintf(prefix, sizeof(prefix), "%zd:", len);
+    if (!growbuf_reserve(buf, n + len + 1))
+        return false;
+    memcpy(buf->data + buf->len, prefix, n);
+    memcpy(buf->data + buf->len + n, data, len);
+    buf->data[buf->len + n + len] = ' ';
+    buf->len += n + len + 1;
+    return true;
+}
+
+static bool marshall_ascii(struct growbuf *buf, PyObject *obj)
+{
+    PyObject *bytes;
+    bool ret;
+
+#if PY_MAJOR_VERSION >= 3
+    bytes = PyUnicode_AsASCIIString(obj);
+#else
+    bytes = obj;
+    Py_INCREF(bytes);
+#endif
+    if (bytes == NULL)
+        return false;
+    ret = (growbuf_append(buf, PyBytes_AS_STRING(bytes),
+                          PyBytes_GET_SIZE(bytes)) &&
+           growbuf_append(buf, " ", 1));
+    Py_DECREF(bytes);
+    return ret;
+}
+
+static bool marshall_item(struct growbuf *buf, PyObject *x)
+{
+    if (PyLong_Check(x)
+#if PY_MAJOR_VERSION < 3
+        || PyInt_Check(x)
+#endif
+        ) {
+        char text[32];
+        long long value;
+        int overflow;
+        PyObject *str;
+        bool ret;
+
+        value = PyLong_AsLongLongAndOverflow(x, &overflow);
+        if (value == -1 && PyErr_Occurred())
+            return false;
+        if (!overflow) {
+            int n = snprintf(text, sizeof(text), "%lld ", value);
+            return growbuf_append(buf, text, n);
+        }
+        str = PyObject_Str(x);
+        if (str == NULL)
+            return false;
+        ret = marshall_ascii(buf, str);
+        Py_DECREF(str);
+        return ret;
+    } else if (PyList_Check(x) || PyTuple_Check(x)) {
+        Py_ssize_t i;
+        PyObject *seq = x;
+
+        if (!growbuf_append(buf, "( ", 2))
+            return false;
+        if (Py_EnterRecursiveCall(" while marshalling"))
+            return false;
+        for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+            if (!marshall_item(buf, PySequence_Fast_GET_ITEM(seq, i))) {
+                Py_LeaveRecursiveCall();
+                return false;
+            }
+        }
+        Py_LeaveRecursiveCall();
+        return growbuf_append(buf, ") ", 2);
+    }
+
+    switch (PyObject_IsInstance(x, literal_type)) {
+        case -1:
+            return false;
+        case 1: {
+            PyObject *str;
+            bool ret;
+
+            str = PyObject_Str(x);
+            if (str == NULL)
+                return false;
+            ret = marshall_ascii(buf, str);
+            Py_DECREF(str);
+            return ret;
+        }
+    }
+
+    if (PyBytes_Check(x)) {
+        return marshall_string(buf, PyBytes_AS_STRING(x),
+                               PyBytes_GET_SIZE(x));
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyUnicode_Check(x)) {
+        const char *data;
+        Py_ssize_t len;
+
+        data = PyUnicode_AsUTF8AndSize(x, &len);
+        if (data == NULL)
+            return false;
+        return marshall_string(buf, data, len);
+#endif
+    }
+
+    PyErr_Format(marshall_error, "Unable to marshall type %s",
+                 Py_TYPE(x)->tp_name);
+    return false;
+}
+
+static PyObject *py_marshall(PyObject *self, PyObject *x)
+{
+    struct growbuf buf = { NULL, 0, 0 };
+    PyObject *ret;
+
+    if (!load_marshall_types())
+        return NULL;
+
+    if (!marshall_item(&buf, x)) {
+        PyMem_Free(buf.data);
+        return NULL;
+    }
+
+    ret = PyBytes_FromStringAndSize(buf.data, buf.len);
+    PyMem_Free(buf.data);
+    return ret;
+}
+
+#define IS_WHITESPACE(c) ((c) == ' ' || (c) == '\n')
+#define IS_DIGIT(c) ((c) >= '0' && (c) <= '9')
+#define IS_ALPHA(c) (((c) >= 'a' && (c) <= 'z') || ((c) >= 'A' && (c) <= 'Z'))
+
+static PyObject *new_literal(const char *data, Py_ssize_t len)
+{
+    PyObject *txt, *ret;
+
+#if PY_MAJOR_VERSION >= 3
+    txt = PyUnicode_DecodeASCII(data, len, "strict");
+#else
+    txt = PyString_FromStringAndSize(data, len);
+#endif
+    if (txt == NULL)
+        return NULL;
+    ret = PyObject_CallFunctionObjArgs(literal_type, txt, NULL);
+    Py_DECREF(txt);
+    return ret;
+}
+
+static PyObject *parse_number(const char *data, Py_ssize_t len)
+{
+    char *text;
+    PyObject *ret;
+
+    if (len < 18) {
+        long long value = 0;
+        Py_ssize_t i;
+        for (i = 0; i < len; i++)
+            value = value * 10 + (data[i] - '0');
+        return PyLong_FromLongLong(value);
+    }
+
+    text = PyMem_Malloc(len + 1);
+    if (text == NULL)
+        return PyErr_NoMemory();
+    memcpy(text, data, len);
+    text[len] = '\0';
+    ret = PyLong_FromString(text, NULL, 10);
+    PyMem_Free(text);
+    return ret;
+}
+
+/*
+ * Parse a string length. Returns false if the length does not fit in a
+ * Py_ssize_t; such a string can never be received completely.
+ */
+static bool parse_length(const char *data, Py_ssize_t len, Py_ssize_t *ret)
+{
+    Py_ssize_t i;
+
+    *ret = 0;
+    for (i = 0; i < len; i++) {
+        if (*ret > (PY_SSIZE_T_MAX - 9) / 10)
+            return false;
+        *ret = *ret * 10 + (data[i] - '0');
+    }
+    return true;
+}
+
+/*
+ * Like subvertpy.marshall.unmarshall(), but working on offsets in data
+ * rather than on copies of the remaining buffer.
+ *
+ * Returns the item and sets *pos to the offset just after it.
+ */
+static PyObject *unmarshall_at(PyObject *x, const char *data,
+                               Py_ssize_t len, Py_ssize_t *pos)
+{
+    Py_ssize_t p = *pos;
+
+    if (p >= len) {
+        PyErr_SetString(need_more_data, "Not enough data");
+        return NULL;
+    }
+
+    if (data[p] == '(') {
+        PyObject *ret, *item;
+
+        if (p + 1 >= len) {
+            PyErr_SetString(need_more_data, "Missing whitespace");
+            return NULL;
+        }
+        if (data[p + 1] != ' ') {
+            PyErr_SetString(marshall_error,
+                            "missing whitespace after list start");
+            return NULL;
+        }
+        p += 2;
+        ret = PyList_New(0);
+        if (ret == NULL)
+            return NULL;
+        if (Py_EnterRecursiveCall(" while unmarshalling")) {
+            Py_DECREF(ret);
+            return NULL;
+        }
+        while (p >= len || data[p] != ')') {
+            item = unmarshall_at(x, data, len, &p);
+            if (item == NULL || PyList_Append(ret, item) < 0) {
+                Py_XDECREF(item);
+                Py_DECREF(ret);
+                Py_LeaveRecursiveCall();
+                return NULL;
+            }
+            Py_DECREF(item);
+        }
+        Py_LeaveRecursiveCall();
+        if (p + 1 >= len) {
+            Py_DECREF(ret);
+            PyErr_SetString(need_more_data, "Missing whitespace");
+            return NULL;
+        }
+        if (!IS_WHITESPACE(data[p + 1])) {
+            Py_DECREF(ret);
+            PyErr_Format(marshall_error, "Expected space, got '%c'",
+                         data[p + 1]);
+            return NULL;
+        }
+        *pos = p + 2;
+        return ret;
+    } else if (IS_DIGIT(data[p])) {
+        Py_ssize_t start = p, num;
+
+        while (p < len && IS_DIGIT(data[p]))
+            p++;
+
+        if (p >= len) {
+            PyErr_SetString(need_more_data, "Expected whitespace or ':'");
+            return NULL;
+        } else if (IS_WHITESPACE(data[p])) {
+            *pos = p + 1;
+            return parse_number(data + start, p - start);
+        } else if (data[p] == ':') {
+            if (!parse_length(data + start, p - start, &num) ||
+                len - p - 1 < num) {
+                PyErr_SetString(need_more_data,
+                                "Expected string of length");
+                return NULL;
+            }
+            /* Like unmarshall(), allow the final space to be missing */
+            *pos = (len - p > num + 1) ? p + num + 2 : len;
+            return PySequence_GetSlice(x, p + 1, p + 1 + num);
+        } else {
+            PyErr_Format(marshall_error,
+                         "Expected whitespace or ':', got '%c'", data[p]);
+            return NULL;
+        }
+    } else if (IS_ALPHA(data[p])) {
+        Py_ssize_t start = p;
+
+        while (p < len &&
+               (IS_ALPHA(data[p]) || IS_DIGIT(data[p]) || data[p] == '-'))
+            p++;
+
+        if (p >= len) {
+            PyErr_SetString(marshall_error,
+                            "Expected whitespace, got end of string.");
+            return NULL;
+        }
+        if (!IS_WHITESPACE(data[p])) {
+            PyErr_Format(marshall_error, "Expected whitespace, got '%c'",
+                         data[p]);
+            return NULL;
+        }
+        *pos = p + 1;
+        return new_literal(data + start, p - start);
+    } else {
+        PyErr_Format(marshall_error, "Unexpected character '%c'", data[p]);
+        return NULL;
+    }
+}
+
+static PyObject *py_unmarshall(PyObject *self, PyObject *x)
+{
+    Py_buffer view;
+    Py_ssize_t pos = 0;
+    PyObject *item, *rest, *ret;
+
+    if (!load_marshall_types())
+        return NULL;
+
+    if (PyObject_GetBuffer(x, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    item = unmarshall_at(x, view.buf, view.len, &pos);
+    PyBuffer_Release(&view);
+    if (item == NULL)
+        return NULL;
+
+    rest = PySequence_GetSlice(x, pos, PY_SSIZE_T_MAX);
+    if (rest == NULL) {
+        Py_DECREF(item);
+        return NULL;
+    }
+
+    ret = PyTuple_Pack(2, rest, item);
+    Py_DECREF(rest);
+    Py_DECREF(item);
+    return ret;
+}
+
+/*
+ * Parse the next item from data, starting at *pos.
+ *
+ * Returns the item, or Py_None (borrowed) if more data is needed; *pos is
+ * updated to point past everything that has been consumed. Lists that
+ * are still open are kept in stack.
+ */
+static PyObject *read_item(const char *data, Py_ssize_t len,
+                           Py_ssize_t *pos, PyObject *stack)
+{
+    Py_ssize_t p = *pos;
+    PyObject *item;
+
+    while (true) {
+        Py_ssize_t start, nstack;
+
+        while (p < len && IS_WHITESPACE(data[p]))
+            p++;
+        if (p >= len)
+            return Py_None;
+
+        if (data[p] == '(' || data[p] == ')') {
+            if (p + 1 >= len)
+                return Py_None;
+            if (!IS_WHITESPACE(data[p + 1])) {
+                PyErr_Format(marshall_error, "Unexpected data after '%c'",
+                             data[p]);
+                return NULL;
+            }
+            if (data[p] == '(') {
+                item = PyList_New(0);
+                if (item == NULL)
+                    return NULL;
+                if (PyList_Append(stack, item) < 0) {
+                    Py_DECREF(item);
+                    return NULL;
+                }
+                Py_DECREF(item);
+                *pos = p = p + 2;
+                continue;
+            }
+            nstack = PyList_GET_SIZE(stack);
+            if (nstack == 0) {
+                PyErr_SetString(marshall_error, "Unexpected end of list");
+                return NULL;
+            }
+            item = PyList_GET_ITEM(stack, nstack - 1);
+            Py_INCREF(item);
+            if (PyList_SetSlice(stack, nstack - 1, nstack, NULL) < 0) {
+                Py_DECREF(item);
+                return NULL;
+            }
+            p += 2;
+        } else if (IS_DIGIT(data[p])) {
+            start = p;
+            while (p < len && IS_DIGIT(data[p]))
+                p++;
+            if (p >= len)
+                return Py_None;
+            if (IS_WHITESPACE(data[p])) {
+                item = parse_number(data + start, p - start);
+                if (item == NULL)
+                    return NULL;
+                p++;
+            } else if (data[p] == ':') {
+                Py_ssize_t num;
+                if (!parse_length(data + start, p - start, &num) ||
+                    len - p - 1 <= num)
+                    return Py_None;
+                if (!IS_WHITESPACE(data[p + 1 + num])) {
+                    PyErr_Format(marshall_error,
+                                 "Expected whitespace, got '%c'",
+                                 data[p + 1 + num]);
+                    return NULL;
+                }
+                item = PyBytes_FromStringAndSize(data + p + 1, num);
+                if (item == NULL)
+                    return NULL;
+                p += num + 2;
+            } else {
+                PyErr_Format(marshall_error,
+                             "Expected whitespace or ':', got '%c'",
+                             data[p]);
+                return NULL;
+            }
+        } else if (IS_ALPHA(data[p])) {
+            start = p;
+            while (p < len &&
+                   (IS_ALPHA(data[p]) || IS_DIGIT(data[p]) || data[p] == '-'))
+                p++;
+            if (p >= len)
+                return Py_None;
+            if (!IS_WHITESPACE(data[p])) {
+                PyErr_Format(marshall_error, "Expected whitespace, got '%c'",
+                             data[p]);
+                return NULL;
+            }
+            item = new_literal(data + start, p - start);
+            if (item == NULL)
+                return NULL;
+            p++;
+        } else {
+            PyErr_Format(marshall_error, "Unexpected character '%c'",
+                         data[p]);
+            return NULL;
+        }
+
+        *pos = p;
+        nstack = PyList_GET_SIZE(stack);
+        if (nstack == 0)
+            return item;
+        if (PyList_Append(PyList_GET_ITEM(stack, nstack - 1), item) < 0) {
+            Py_DECREF(item);
+            return NULL;
+        }
+        Py_DECREF(item);
+    }
+}
+
+static PyObject *py_read_item(PyObject *self, PyObject *args)
+{
+    PyObject *buf, *stack, *item;
+    Py_ssize_t pos;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "OnO!", &buf, &pos, &PyList_Type, &stack))
+        return NULL;
+
+    if (!load_marshall_types())
+        return NULL;
+
+    if (PyObject_GetBuffer(buf, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    if (pos < 0 || pos > view.len) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "position out of range");
+        return NULL;
+    }
+
+    item = read_item(view.buf, view.len, &pos, stack);
+    PyBuffer_Release(&view);
+    if (item == NULL)
+        return NULL;
+    if (item == Py_None)
+        return Py_BuildValue("(nO)", pos, Py_None);
+    return Py_BuildValue("(nN)", pos, item);
+}
+
+static PyMethodDef marshall_methods[] = {
+    { "marshall", py_marshall, METH_O,
+        "marshall(x) -> bytes\n"
+        "Marshall a Python data item." },
+    { "unmarshall", py_unmarshall, METH_O,
+        "unmarshall(x) -> (remaining, item)\n"
+        "Unmarshall the next item from a buffer." },
+    { "read_item", py_read_item, METH_VARARGS,
+        "read_item(buf, pos, stack) -> (pos, item)\n"
+        "Parse the next item from a buffer, or return None as item if "
+        "more data is needed." },
+    { NULL }
+};
+
+static PyObject *
+moduleinit(void)
+{
+    PyObject *mod;
+
+#if PY_MAJOR_VERSION >= 3
+    static struct PyModuleDef moduledef = {
+      PyModuleDef_HEAD_INIT,
+      "_marshall",         /* m_name */
+      "Accelerated svn protocol marshalling", /* m_doc */
+      -1,              /* m_size */
+      marshall_methods, /* m_methods */
+      NULL,            /* m_reload */
+      NULL,            /* m_traverse */
+      NULL,            /* m_clear*/
+      NULL,            /* m_free */
+    };
+    mod = PyModule_Create(&moduledef);
+#else
+    mod = Py_InitModule3("_marshall", marshall_methods,
+                         "Accelerated svn protocol marshalling");
+#endif
+    if (mod == NULL)
+        return NULL;
+
+    return mod;
+}
+
+#if PY_MAJOR_VERSION >= 3
+PyMODINIT_FUNC
+PyInit__marshall(void)
+{
+    return moduleinit();
+}
+#else
+PyMODINIT_FUNC
+init_marshall(void)
+{
+    moduleinit();
+}
+#endif
@@ -2298,6 +2298,12 @@ static PyMethodDef ra_methods[] = {
 	{ "rev_proplist", ra_rev_proplist, METH_VARARGS,
 		"S.rev_proplist(revnum) -> properties\n"
 		"Return a dictionary with the properties set on the specified revision" },
+	{ "rev_proplist_range", (PyCFunction)ra_rev_proplist_range, METH_VARARGS|METH_KEYWORDS,
+		"S.rev_proplist_range(start, end, names=None)\n"
+		"Yields (revnum, properties) tuples for the revisions from start to end.\n"
+		"All properties are retrieved in a single request; names can be used\n"
+		"to limit the properties that are retrieved. Like iter_log, the\n"
+		"iterator should be run to exhaustion.\n" },
 	{ "replay", ra_replay, METH_VARARGS,
 		"S.replay(revision, low_water_mark, update_editor, send_deltas=True)\n"
 		"Replay a revision, reporting changes to update_editor." },
@@ -2331,7 +2337,7 @@ static PyMethodDef ra_methods[] = {
 	{ "iter_log", (PyCFunction)ra_iter_log, METH_VARARGS|METH_KEYWORDS,
 		"S.iter_log(paths, start, end, limit=0, "
 		"discover_changed_paths=False, strict_node_history=True, "
-		"include_merged_revisions=False, revprops=None)\n"
+		"include_merged_revisions=False, revprops=None, max_queue_size=1000)\n"
 		"Yields tuples of three or four elements:\n"
 		"(changed_paths, revision, revprops[, has_children])\n"
 		"The changed_paths element may be None, or a dictionary mapping each\n"
@@ -2341,6 +2347,10 @@ static PyMethodDef ra_methods[] = {
 		"any further methods, make sure the thread has completed by running the\n"
 		"iterator to exhaustion (i.e. until StopIteration is raised, the \"for\"\n"
 		"loop finishes, etc).\n"
+		"At most max_queue_size entries (0 for no limit) are buffered; the\n"
+		"thread waits for entries to be consumed once that limit is reached.\n"
+		"The queue_size, max_queue_size and peak_queue_size attributes of the\n"
+		"iterator describe the buffer.\n"
 	},
 	{ "get_latest_revnum", (PyCFunction)ra_get_latest_revnum, METH_NOARGS,
 		"S.get_latest_revnum() -> int\n"
@@ -3423,6 +3433,15 @@ moduleinit(void)
 	if (PyType_Ready(&TxDeltaWindowHandler_Type) < 0)
 		return NULL;
 
+	if (PyType_Ready(&TxDeltaWindow_Type) < 0)
+		return NULL;
+
+	if (PyType_Ready(&TxDeltaOps_Type) < 0)
+		return NULL;
+
+	if (PyType_Ready(&TxDeltaTarget_Type) < 0)
+		return NULL;
+
 	if (PyType_Ready(&Auth_Type) < 0)
 		return NULL;
 
@@ -3471,6 +3490,12 @@ moduleinit(void)
 	PyModule_AddObject(mod, "Editor", (PyObject *)&Editor_Type);
 	Py_INCREF(&Editor_Type);
 
+	PyModule_AddObject(mod, "TxDeltaWindow", (PyObject *)&TxDeltaWindow_Type);
+	Py_INCREF(&TxDeltaWindow_Type);
+
+	PyModule_AddObject(mod, "TxDeltaTarget", (PyObject *)&TxDeltaTarget_Type);
+	Py_INCREF(&TxDeltaTarget_Type);
+
 	busy_exc = PyErr_NewException("_ra.BusyException", NULL, NULL);
 	PyModule_AddObject(mod, "BusyException", busy_exc);
 
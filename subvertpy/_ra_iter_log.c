@@ -17,6 +17,11 @@
  * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
  */
 #include <pythread.h>
+#include <apr_thread_cond.h>
+#include <apr_thread_mutex.h>
+
+/* Default maximum number of log entries buffered by a LogIterator */
+#define DEFAULT_LOG_QUEUE_SIZE 1000
 
 struct log_entry {
 	PyObject *tuple;
@@ -29,15 +34,28 @@ typedef struct {
 	svn_boolean_t discover_changed_paths;
 	svn_boolean_t strict_node_history;
 	svn_boolean_t include_merged_revisions;
+	/* Only yield (revnum, revprops) tuples */
+	svn_boolean_t revprops_only;
+	/* If set, the session is reparented to this URL for the log and
+	 * back to the session URL afterwards */
+	const char *root_url;
 	int limit;
 	apr_pool_t *pool;
 	apr_array_header_t *apr_paths;
 	apr_array_header_t *apr_revprops;
 	RemoteAccessObject *ra;
-	svn_boolean_t done;
 	PyObject *exc_type;
 	PyObject *exc_val;
+	/* The fields below are protected by lock. The producer thread waits on
+	 * cond for room in the queue, the consumer for entries or the end of
+	 * the log. */
+	apr_thread_mutex_t *lock;
+	apr_thread_cond_t *cond;
+	svn_boolean_t done;
+	svn_boolean_t cancelled;
 	int queue_size;
+	int max_queue_size;
+	int peak_queue_size;
 	struct log_entry *head;
 	struct log_entry *tail;
 } LogIteratorObject;
@@ -46,6 +64,16 @@ static void log_iter_dealloc(PyObject *self)
 {
 	LogIteratorObject *iter = (LogIteratorObject *)self;
 
+	/* Stop the producer thread and wait for it to finish */
+	Py_BEGIN_ALLOW_THREADS
+	apr_thread_mutex_lock(iter->lock);
+	iter->cancelled = TRUE;
+	apr_thread_cond_broadcast(iter->cond);
+	while (!iter->done)
+		apr_thread_cond_wait(iter->cond, iter->lock);
+	apr_thread_mutex_unlock(iter->lock);
+	Py_END_ALLOW_THREADS
+
 	while (iter->head) {
 		struct log_entry *e = iter->head;
 		Py_DECREF(e->tuple);
@@ -65,29 +93,56 @@ static PyObject *log_iter_next(LogIteratorObject *iter)
 	PyObject *ret;
 	Py_INCREF(iter);
 
-	while (iter->head == NULL) {
+	Py_BEGIN_ALLOW_THREADS
+	apr_thread_mutex_lock(iter->lock);
+	while (iter->head == NULL && !iter->done)
+		apr_thread_cond_wait(iter->cond, iter->lock);
+	first = iter->head;
+	if (first != NULL) {
+		iter->head = first->next;
+		if (first == iter->tail)
+			iter->tail = NULL;
+		iter->queue_size--;
+		/* Wake up the producer if it is waiting for room */
+		apr_thread_cond_broadcast(iter->cond);
+	}
+	apr_thread_mutex_unlock(iter->lock);
+	Py_END_ALLOW_THREADS
+
+	if (first == NULL) {
 		/* Done, raise exception */
-		if (iter->exc_type != NULL) {
-			PyErr_SetObject(iter->exc_type, iter->exc_val);
-			Py_DECREF(iter);
-			return NULL;
-		} else {
-			Py_BEGIN_ALLOW_THREADS
-			/* FIXME: Don't waste cycles */
-			Py_END_ALLOW_THREADS
-		}
+		PyErr_SetObject(iter->exc_type, iter->exc_val);
+		Py_DECREF(iter);
+		return NULL;
 	}
-	first = iter->head;
-	ret = iter->head->tuple;
-	iter->head = first->next;
-	if (first == iter->tail)
-		iter->tail = NULL;
+	ret = first->tuple;
 	free(first);
-	iter->queue_size--;
 	Py_DECREF(iter);
 	return ret;
 }
 
+/**
+ * Wait until there is room in the queue for another entry.
+ *
+ * Called from the producer thread, without holding the GIL.
+ */
+static svn_error_t *py_iter_wait_for_room(LogIteratorObject *iter)
+{
+	svn_boolean_t cancelled;
+
+	apr_thread_mutex_lock(iter->lock);
+	while (iter->max_queue_size > 0 && !iter->cancelled &&
+		   iter->queue_size >= iter->max_queue_size)
+		apr_thread_cond_wait(iter->cond, iter->lock);
+	cancelled = iter->cancelled;
+	apr_thread_mutex_unlock(iter->lock);
+
+	if (cancelled)
+		return svn_error_create(SVN_ERR_CANCELLED, NULL,
+								"Log iterator was deallocated");
+	return NULL;
+}
+
 static PyObject *py_iter_append(LogIteratorObject *iter, PyObject *tuple)
 {
 	struct log_entry *entry;
@@ -99,6 +154,7 @@ static PyObject *py_iter_append(LogIteratorObject *iter, PyObject *tuple)
 	}
 
 	entry->tuple = tuple;
+	apr_thread_mutex_lock(iter->lock);
 	if (iter->tail == NULL) {
 		iter->tail = entry;
 	} else {
@@ -109,10 +165,24 @@ static PyObject *py_iter_append(LogIteratorObject *iter, PyObject *tuple)
 		iter->head = entry;
 
 	iter->queue_size++;
+	if (iter->queue_size > iter->peak_queue_size)
+		iter->peak_queue_size = iter->queue_size;
+	apr_thread_cond_broadcast(iter->cond);
+	apr_thread_mutex_unlock(iter->lock);
 
 	Py_RETURN_NONE;
 }
 
+static PyMemberDef log_iter_members[] = {
+	{ "queue_size", T_INT, offsetof(LogIteratorObject, queue_size), READONLY,
+		"Number of log entries that have been received but not yet consumed." },
+	{ "max_queue_size", T_INT, offsetof(LogIteratorObject, max_queue_size), READONLY,
+		"Maximum number of log entries to buffer (0 for no limit)." },
+	{ "peak_queue_size", T_INT, offsetof(LogIteratorObject, peak_queue_size), READONLY,
+		"Largest number of log entries that have been buffered at once." },
+	{ NULL }
+};
+
 PyTypeObject LogIterator_Type = {
 	PyVarObject_HEAD_INIT(NULL, 0)
 	"_ra.LogIterator", /*	const char *tp_name;  For printing, in format "<module>.<name>" */
@@ -131,6 +201,8 @@ PyTypeObject LogIterator_Type = {
 	/* Iterators */
 	.tp_iter = PyObject_SelfIter,
 	.tp_iternext = (iternextfunc)log_iter_next,
+
+	.tp_members = log_iter_members,
 };
 
 #if ONLY_SINCE_SVN(1, 5)
@@ -141,32 +213,48 @@ static svn_error_t *py_iter_log_entry_cb(void *baton, svn_log_entry_t *log_entry
 
 	PyGILState_STATE state;
 
+	SVN_ERR(py_iter_wait_for_room(iter));
+
 	state = PyGILState_Ensure();
 
+	if (iter->revprops_only) {
+		revprops = prop_hash_to_dict(log_entry->revprops);
+		if (revprops == NULL) {
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		tuple = Py_BuildValue("lN", log_entry->revision, revprops);
+		if (tuple == NULL) {
+			Py_DECREF(revprops);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+	} else {
 #if ONLY_SINCE_SVN(1, 6)
-	py_changed_paths = pyify_changed_paths2(log_entry->changed_paths2, pool);
+		py_changed_paths = pyify_changed_paths2(log_entry->changed_paths2, pool);
 #else
-	py_changed_paths = pyify_changed_paths(log_entry->changed_paths, true, pool);
+		py_changed_paths = pyify_changed_paths(log_entry->changed_paths, true, pool);
 #endif
-	if (py_changed_paths == NULL) {
-		PyGILState_Release(state);
-		return py_svn_error();
-	}
+		if (py_changed_paths == NULL) {
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
 
-	revprops = prop_hash_to_dict(log_entry->revprops);
-	if (revprops == NULL) {
-		Py_DECREF(py_changed_paths);
-		PyGILState_Release(state);
-		return py_svn_error();
-	}
+		revprops = prop_hash_to_dict(log_entry->revprops);
+		if (revprops == NULL) {
+			Py_DECREF(py_changed_paths);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
 
-	tuple = Py_BuildValue("NlNb", py_changed_paths,
-						log_entry->revision, revprops, log_entry->has_children);
-	if (tuple == NULL) {
-		Py_DECREF(revprops);
-		Py_DECREF(py_changed_paths);
-		PyGILState_Release(state);
-		return py_svn_error();
+		tuple = Py_BuildValue("NlNb", py_changed_paths,
+							log_entry->revision, revprops, log_entry->has_children);
+		if (tuple == NULL) {
+			Py_DECREF(revprops);
+			Py_DECREF(py_changed_paths);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
 	}
 
 	ret = py_iter_append(iter, tuple);
@@ -190,15 +278,26 @@ static svn_error_t *py_iter_log_cb(void *baton, apr_hash_t *changed_paths, svn_r
 
 	PyGILState_STATE state;
 
+	SVN_ERR(py_iter_wait_for_room(iter));
+
 	state = PyGILState_Ensure();
 
 	if (!pyify_log_message(changed_paths, author, date, message, true,
 	pool, &py_changed_paths, &revprops)) {
 		goto fail;
 	}
-	tuple = Py_BuildValue("NlN", py_changed_paths, revision, revprops);
-	if (tuple == NULL) {
-		goto fail_tuple;
+	if (iter->revprops_only) {
+		Py_DECREF(py_changed_paths);
+		tuple = Py_BuildValue("lN", revision, revprops);
+		if (tuple == NULL) {
+			Py_DECREF(revprops);
+			goto fail;
+		}
+	} else {
+		tuple = Py_BuildValue("NlN", py_changed_paths, revision, revprops);
+		if (tuple == NULL) {
+			goto fail_tuple;
+		}
 	}
 
 	ret = py_iter_append(iter, tuple);
@@ -230,18 +329,35 @@ static void py_iter_log(void *baton)
 	svn_error_t *error;
 	PyGILState_STATE state;
 
+	if (iter->root_url != NULL) {
+		error = svn_ra_reparent(iter->ra->ra, iter->root_url, iter->pool);
+	} else {
+		error = NULL;
+	}
+	if (error == NULL) {
 #if ONLY_SINCE_SVN(1, 5)
-	error = svn_ra_get_log2(iter->ra->ra, 
-			iter->apr_paths, iter->start, iter->end, iter->limit,
-			iter->discover_changed_paths, iter->strict_node_history, 
-			iter->include_merged_revisions, iter->apr_revprops,
-			py_iter_log_entry_cb, iter, iter->pool);
+		error = svn_ra_get_log2(iter->ra->ra, 
+				iter->apr_paths, iter->start, iter->end, iter->limit,
+				iter->discover_changed_paths, iter->strict_node_history, 
+				iter->include_merged_revisions, iter->apr_revprops,
+				py_iter_log_entry_cb, iter, iter->pool);
 #else
-	error = svn_ra_get_log(iter->ra->ra, 
-			iter->apr_paths, iter->start, iter->end, iter->limit,
-			iter->discover_changed_paths, iter->strict_node_history, py_iter_log_cb, 
-			iter, iter->pool);
+		error = svn_ra_get_log(iter->ra->ra, 
+				iter->apr_paths, iter->start, iter->end, iter->limit,
+				iter->discover_changed_paths, iter->strict_node_history, py_iter_log_cb, 
+				iter, iter->pool);
 #endif
+		if (iter->root_url != NULL) {
+			svn_error_t *reparent_error;
+			reparent_error = svn_ra_reparent(iter->ra->ra, iter->ra->url,
+											 iter->pool);
+			if (error == NULL) {
+				error = reparent_error;
+			} else {
+				svn_error_clear(reparent_error);
+			}
+		}
+	}
 	state = PyGILState_Ensure();
 	if (error != NULL) {
 		iter->exc_type = (PyObject *)PyErr_GetSubversionExceptionTypeObject();
@@ -253,33 +369,34 @@ static void py_iter_log(void *baton)
 		iter->exc_val = Py_None;
 		Py_INCREF(iter->exc_val);
 	}
-	iter->done = TRUE;
 	iter->ra->busy = false;
 
-	Py_DECREF(iter);
+	/* The iterator may be deallocated as soon as done is set, so this
+	 * is the last time it is accessed from this thread. */
+	apr_thread_mutex_lock(iter->lock);
+	iter->done = TRUE;
+	apr_thread_cond_broadcast(iter->cond);
+	apr_thread_mutex_unlock(iter->lock);
+
 	PyGILState_Release(state);
 }
 
-PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
+static PyObject *log_iter_new(RemoteAccessObject *ra, PyObject *paths,
+	svn_revnum_t start, svn_revnum_t end, int limit,
+	bool discover_changed_paths, bool strict_node_history,
+	bool include_merged_revisions, PyObject *revprops, bool revprops_only,
+	const char *root_url, int max_queue_size)
 {
-	char *kwnames[] = { "paths", "start", "end", "limit",
-		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops", NULL };
-	PyObject *paths;
-	svn_revnum_t start = 0, end = 0;
-	int limit=0; 
-	bool discover_changed_paths=false, strict_node_history=true, include_merged_revisions=false;
-	RemoteAccessObject *ra = (RemoteAccessObject *)self;
-	PyObject *revprops = Py_None;
 	LogIteratorObject *ret;
 	apr_pool_t *pool;
 	apr_array_header_t *apr_paths;
 	apr_array_header_t *apr_revprops;
 
-	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oll|ibbbO:iter_log", kwnames, 
-						 &paths, &start, &end, &limit,
-						 &discover_changed_paths, &strict_node_history,
-						 &include_merged_revisions, &revprops))
+	if (max_queue_size < 0) {
+		PyErr_SetString(PyExc_ValueError,
+						"max_queue_size should not be negative");
 		return NULL;
+	}
 
 	if (!ra_get_log_prepare(ra, paths, include_merged_revisions,
 	revprops, &pool, &apr_paths, &apr_revprops)) {
@@ -287,6 +404,19 @@ PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
 	}
 
 	ret = PyObject_New(LogIteratorObject, &LogIterator_Type);
+	if (ret == NULL) {
+		apr_pool_destroy(pool);
+		ra->busy = false;
+		return NULL;
+	}
+	if (apr_thread_mutex_create(&ret->lock, APR_THREAD_MUTEX_DEFAULT, pool) != APR_SUCCESS ||
+		apr_thread_cond_create(&ret->cond, pool) != APR_SUCCESS) {
+		PyErr_SetString(PyExc_RuntimeError, "Unable to create lock");
+		apr_pool_destroy(pool);
+		ra->busy = false;
+		PyObject_Del(ret);
+		return NULL;
+	}
 	ret->ra = ra;
 	Py_INCREF(ret->ra);
 	ret->start = start;
@@ -299,16 +429,71 @@ PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
 	ret->pool = pool;
 	ret->include_merged_revisions = include_merged_revisions;
 	ret->strict_node_history = strict_node_history;
+	ret->revprops_only = revprops_only;
+	ret->root_url = root_url;
 	ret->apr_revprops = apr_revprops;
 	ret->done = FALSE;
+	ret->cancelled = FALSE;
 	ret->queue_size = 0;
+	ret->max_queue_size = max_queue_size;
+	ret->peak_queue_size = 0;
 	ret->head = NULL;
 	ret->tail = NULL;
 
-	Py_INCREF(ret);
+	/* The thread does not hold a reference; the iterator waits for the
+	 * thread to finish when it is deallocated. */
 	PyThread_start_new_thread(py_iter_log, ret);
 
 	return (PyObject *)ret;
 }
 
+PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { "paths", "start", "end", "limit",
+		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops",
+		"max_queue_size", NULL };
+	PyObject *paths;
+	svn_revnum_t start = 0, end = 0;
+	int limit=0; 
+	int max_queue_size = DEFAULT_LOG_QUEUE_SIZE;
+	bool discover_changed_paths=false, strict_node_history=true, include_merged_revisions=false;
+	RemoteAccessObject *ra = (RemoteAccessObject *)self;
+	PyObject *revprops = Py_None;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oll|ibbbOi:iter_log", kwnames, 
+						 &paths, &start, &end, &limit,
+						 &discover_changed_paths, &strict_node_history,
+						 &include_merged_revisions, &revprops, &max_queue_size))
+		return NULL;
+
+	return log_iter_new(ra, paths, start, end, limit, discover_changed_paths,
+						strict_node_history, include_merged_revisions, revprops,
+						false, NULL, max_queue_size);
+}
+
+PyObject *ra_rev_proplist_range(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { "start", "end", "names", NULL };
+	svn_revnum_t start, end;
+	PyObject *names = Py_None, *py_root;
+	const char *root_url = NULL;
+	RemoteAccessObject *ra = (RemoteAccessObject *)self;
 
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "ll|O:rev_proplist_range",
+						 kwnames, &start, &end, &names))
+		return NULL;
+
+	/* A log of the repository root includes every revision, so this
+	 * fetches all revision properties in a single request. A log of the
+	 * session URL would only include the revisions that changed it. */
+	py_root = ra_get_repos_root(self);
+	if (py_root == NULL)
+		return NULL;
+	Py_DECREF(py_root);
+	if (strcmp(ra->root, ra->url) != 0) {
+		root_url = ra->root;
+	}
+
+	return log_iter_new(ra, Py_None, start, end, 0, false, true, false,
+						names, true, root_url, DEFAULT_LOG_QUEUE_SIZE);
+}
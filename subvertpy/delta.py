@@ -21,6 +21,20 @@ __docformat__ = "restructuredText"
 from hashlib import (
     md5,
     )
+import zlib
+
+from subvertpy import (
+    ERR_SVNDIFF_CORRUPT_WINDOW,
+    ERR_SVNDIFF_INVALID_HEADER,
+    ERR_SVNDIFF_UNEXPECTED_END,
+    ERR_UNSUPPORTED_FEATURE,
+    SubversionException,
+    )
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
 
 
 TXDELTA_SOURCE = 0
@@ -32,6 +46,20 @@ MAX_ENCODED_INT_LEN = 10
 
 DELTA_WINDOW_SIZE = 102400
 
+# Sections smaller than this are never compressed with zlib,
+# see MIN_COMPRESS_SIZE in subversion/libsvn_subr/compress.c
+MIN_COMPRESS_SIZE = 512
+
+ZLIB_COMPRESSION_LEVEL = 5
+
+# Size of the blocks that are indexed when looking for copies,
+# see MATCH_BLOCKSIZE in subversion/libsvn_delta/xdelta.c
+MATCH_BLOCKSIZE = 64
+
+# Largest number of bytes send_stream_delta skips at once when scanning
+# data that does not match the source.
+MAX_SKIP = 64 * MATCH_BLOCKSIZE
+
 
 def apply_txdelta_window(sbuf, window):
     """Apply a txdelta window to a buffer.
@@ -48,6 +76,11 @@ def apply_txdelta_window(sbuf, window):
     """
     (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
     sview = sbuf[sview_offset:sview_offset+sview_len]
+    return _apply_txdelta_window_view(sview, window)
+
+
+def _apply_txdelta_window_view(sview, window):
+    (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
     tview = txdelta_apply_ops(src_ops, ops, new_data, sview)
     if len(tview) != tview_len:
         raise AssertionError("%d != %d" % (len(tview), tview_len))
@@ -72,7 +105,8 @@ def apply_txdelta_handler_chunks(source_chunks, target_chunks):
 def apply_txdelta_handler(sbuf, target_stream):
     """Return a function that can be called repeatedly with txdelta windows.
 
-    :param sbuf: Source buffer
+    :param sbuf: Source buffer; this can also be a mmap object, in which
+        case only the source view of each window is copied into memory.
     :param target_stream: Target stream
     """
     def apply_window(window):
@@ -82,6 +116,44 @@ def apply_txdelta_handler(sbuf, target_stream):
     return apply_window
 
 
+def _read_exactly(stream, size):
+    """Read size bytes from a stream, unless the end of it is reached."""
+    ret = stream.read(size)
+    if len(ret) == size or not ret:
+        return ret
+    chunks = [ret]
+    size -= len(ret)
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return bytes().join(chunks)
+
+
+def apply_txdelta_handler_stream(source_stream, target_stream):
+    """Return a function that can be called repeatedly with txdelta windows.
+
+    Rather than keeping the full source text in memory, this reads the
+    source view of each window from source_stream.
+
+    :param source_stream: Seekable file-like object with the source text
+    :param target_stream: Target stream
+    """
+    def apply_window(window):
+        if window is None:
+            return  # Last call
+        (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
+        if sview_len > 0:
+            source_stream.seek(sview_offset)
+            sview = _read_exactly(source_stream, sview_len)
+        else:
+            sview = bytes()
+        target_stream.write(_apply_txdelta_window_view(sview, window))
+    return apply_window
+
+
 def txdelta_apply_ops(src_ops, ops, new_data, sview):
     """Apply txdelta operations to a source view.
 
@@ -97,8 +169,16 @@ def txdelta_apply_ops(src_ops, ops, new_data, sview):
             # Copy from source area.
             tview.extend(sview[offset:offset+length])
         elif action == TXDELTA_TARGET:
-            for i in range(length):
-                tview.append(tview[offset+i])
+            # Copy from target area. The range may overlap with the data
+            # that is being produced, in which case the bytes between
+            # offset and the end of the target view repeat. The copied span
+            # doubles every iteration.
+            if offset >= len(tview):
+                raise IndexError("target copy beyond end of target view")
+            while length > 0:
+                n = min(length, len(tview) - offset)
+                tview.extend(tview[offset:offset+n])
+                length -= n
         elif action == TXDELTA_NEW:
             tview.extend(new_data[offset:offset+length])
         else:
@@ -126,6 +206,145 @@ def send_stream(stream, handler, block_size=DELTA_WINDOW_SIZE):
     return hash.digest()
 
 
+def _match_length(a, a_offset, b, b_offset, limit):
+    """Determine the length of the common prefix of two buffer ranges.
+
+    Larger chunks are compared first, so that long matches don't have to
+    be compared byte by byte.
+    """
+    n = 0
+    step = 4096
+    while n < limit:
+        step = min(step, limit - n)
+        if a[a_offset+n:a_offset+n+step] == b[b_offset+n:b_offset+n+step]:
+            n += step
+        elif step == 1:
+            break
+        else:
+            step //= 2
+    return n
+
+
+def _delta_window(sview, tview, blocksize=MATCH_BLOCKSIZE,
+                  max_skip=MAX_SKIP):
+    """Compute the operations that create a target view.
+
+    Block-aligned chunks of the source view are indexed by their contents;
+    the target view is then scanned for blocks that occur in the source
+    view or earlier in the target view. Matches are extended as far as
+    possible and copied, everything else is sent as new data.
+
+    Every offset is tried until a full block of them has missed. After
+    that, the scan skips ahead further the longer the run of unmatched
+    data gets (up to max_skip bytes), trying a full block of offsets
+    after every skip. Matches that extend into skipped data are still
+    found, since they are extended backwards; only short matches in
+    otherwise unrelated data can be missed.
+
+    :param sview: Source view
+    :param tview: Target view
+    :param blocksize: Size of the blocks that are indexed
+    :param max_skip: Maximum number of bytes to skip at once
+    :return: Tuple with list of operations and new data
+    """
+    sindex = {}
+    for offset in range(0, len(sview) - blocksize + 1, blocksize):
+        sindex.setdefault(sview[offset:offset+blocksize], offset)
+    tindex = {}
+    next_tblock = 0
+
+    ops = []
+    new_data = bytearray()
+
+    def flush_new(start, end):
+        if start < end:
+            ops.append((TXDELTA_NEW, len(new_data), end - start))
+            new_data.extend(tview[start:end])
+
+    pending = 0
+    pos = 0
+    # End of the run of offsets that are all tried
+    burst_end = blocksize
+    while pos + blocksize <= len(tview):
+        # Index the target blocks that are already complete, so that
+        # repeated data in the target can be copied as well.
+        while next_tblock < pos and next_tblock + blocksize <= len(tview):
+            tindex.setdefault(
+                tview[next_tblock:next_tblock+blocksize], next_tblock)
+            next_tblock += blocksize
+        block = tview[pos:pos+blocksize]
+        best = None
+        offset = sindex.get(block)
+        if offset is not None:
+            length = _match_length(tview, pos, sview, offset,
+                                   min(len(tview) - pos, len(sview) - offset))
+            best = (TXDELTA_SOURCE, offset, length)
+        offset = tindex.get(block)
+        if offset is not None:
+            length = _match_length(tview, pos, tview, offset,
+                                   len(tview) - pos)
+            if best is None or length > best[2]:
+                best = (TXDELTA_TARGET, offset, length)
+        if best is None:
+            pos += 1
+            if pos >= burst_end:
+                pos += min((pos - pending) // 4, max_skip)
+                burst_end = pos + blocksize
+            continue
+        (action, offset, length) = best
+        # Extend the match backwards into the data that is not yet covered.
+        if action == TXDELTA_SOURCE:
+            base = sview
+        else:
+            base = tview
+        while (pos > pending and offset > 0 and
+               tview[pos-1] == base[offset-1]):
+            pos -= 1
+            offset -= 1
+            length += 1
+        flush_new(pending, pos)
+        ops.append((action, offset, length))
+        pos += length
+        pending = pos
+        burst_end = pos + blocksize
+    flush_new(pending, len(tview))
+    return ops, bytes(new_data)
+
+
+def send_stream_delta(source_stream, target_stream, handler,
+                      block_size=DELTA_WINDOW_SIZE):
+    """Send txdelta windows that create target_stream from source_stream.
+
+    Unlike send_stream, this copies data that is unchanged from the source
+    rather than sending it again.
+
+    :param source_stream: file-like object to read the base text from
+    :param target_stream: file-like object to read the new text from
+    :param handler: txdelta window handler function
+    :return: MD5 hash over the target stream
+    """
+    hash = md5()
+    sview_offset = 0
+    text = target_stream.read(block_size)
+    if not isinstance(text, bytes):
+        raise TypeError("The stream should read out bytes")
+    while text:
+        hash.update(text)
+        sview = source_stream.read(block_size)
+        ops, new_data = _delta_window(sview, text)
+        src_ops = len([op for op in ops if op[0] == TXDELTA_SOURCE])
+        if src_ops == 0:
+            window = (0, 0, len(text), 0, ops, new_data)
+        else:
+            window = (sview_offset, len(sview), len(text), src_ops, ops,
+                      new_data)
+        handler(window)
+        sview_offset += len(sview)
+        text = target_stream.read(block_size)
+    handler(None)
+    return hash.digest()
+
+
 def encode_length(len):
     """Encode a length variable.
 
@@ -163,14 +382,27 @@ def decode_length(text):
     :param text: Bytestring to decode
     :return: Integer with actual length
     """
+    ret, offset = decode_length_at(text, 0)
+    return ret, text[offset:]
+
+
+def decode_length_at(text, offset):
+    """Decode a length variable at a particular offset.
+
+    :param text: Buffer to decode from (bytestring or memoryview)
+    :param offset: Offset of the encoded length in text
+    :return: tuple with integer with actual length and offset of the first
+        byte after the encoded length
+    """
     # Decode bytes until we're done.  */
     ret = 0
     next = True
     while next:
-        ret = (ret << 7) | (text[0] & 0x7f)
-        next = (text[0] >> 7) & 0x1
-        text = text[1:]
-    return ret, text
+        c = text[offset]
+        ret = (ret << 7) | (c & 0x7f)
+        next = (c >> 7) & 0x1
+        offset += 1
+    return ret, offset
 
 
 def pack_svndiff_instruction(diff_params):
@@ -198,37 +430,152 @@ def unpack_svndiff_instruction(text):
     :param text: Text to parse
     :return: tuple with operation, remaining text
     """
-    action = text[0] >> 6
-    length = text[0] & 0x3f
-    text = text[1:]
+    op, offset = unpack_svndiff_instruction_at(text, 0)
+    return op, text[offset:]
+
+
+def unpack_svndiff_instruction_at(text, pos, new_offset=0):
+    """Unpack a SVN diff instruction at a particular offset.
+
+    :param text: Buffer to parse (bytestring or memoryview)
+    :param pos: Offset of the instruction in text
+    :param new_offset: Offset in the new data for TXDELTA_NEW instructions,
+        which do not encode one since they consume the new data in order
+    :return: tuple with operation, offset of the next instruction
+    """
+    action = text[pos] >> 6
+    length = text[pos] & 0x3f
+    pos += 1
     assert action in (TXDELTA_NEW, TXDELTA_SOURCE, TXDELTA_TARGET)
     if length == 0:
-        length, text = decode_length(text)
+        length, pos = decode_length_at(text, pos)
     if action != TXDELTA_NEW:
-        offset, text = decode_length(text)
+        offset, pos = decode_length_at(text, pos)
     else:
-        offset = 0
-    return (action, offset, length), text
+        offset = new_offset
+    return (action, offset, length), pos
+
+
+def _unpack_svndiff_instructions(text, pos, end):
+    """Unpack the instructions of a window.
+
+    :param text: Buffer to parse (bytestring or memoryview)
+    :param pos: Offset of the first instruction in text
+    :param end: Offset of the end of the instructions in text
+    :return: list of operations
+    """
+    ops = []
+    new_offset = 0
+    while pos < end:
+        op, pos = unpack_svndiff_instruction_at(text, pos, new_offset)
+        if op[0] == TXDELTA_NEW:
+            new_offset += op[2]
+        ops.append(op)
+    return ops
 
 
 SVNDIFF0_HEADER = b"SVN\0"
+SVNDIFF1_HEADER = b"SVN\1"
+SVNDIFF2_HEADER = b"SVN\2"
 
+SVNDIFF_HEADERS = (SVNDIFF0_HEADER, SVNDIFF1_HEADER, SVNDIFF2_HEADER)
 
-def pack_svndiff0_window(window):
-    """Pack an individual window using svndiff0.
+# svndiff versions that can be encoded and decoded. Version 1 compresses
+# sections with zlib, version 2 with lz4.
+if lz4 is not None:
+    SVNDIFF_VERSIONS = (0, 1, 2)
+else:
+    SVNDIFF_VERSIONS = (0, 1)
 
-    :param window: Window to pack
-    :return: Packed diff (as bytestring)
+
+def svndiff_version(header):
+    """Determine the svndiff version from a svndiff header.
+
+    :param header: First four bytes of the svndiff text
+    :return: svndiff version
     """
-    (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
-    ret = (encode_length(sview_offset) +
-           encode_length(sview_len) +
-           encode_length(tview_len))
+    try:
+        version = SVNDIFF_HEADERS.index(bytes(header))
+    except ValueError:
+        raise SubversionException(
+            "Svndiff has invalid header", ERR_SVNDIFF_INVALID_HEADER)
+    if version not in SVNDIFF_VERSIONS:
+        raise SubversionException(
+            "svndiff%d requires the lz4 module" % version,
+            ERR_UNSUPPORTED_FEATURE)
+    return version
+
+
+def compress_section(data, version):
+    """Compress an instruction or new data section of a svndiff window.
+
+    :param data: Data to compress
+    :param version: svndiff version (1 or 2)
+    :return: Compressed section, prefixed with the original length
+    """
+    ret = encode_length(len(data))
+    if version == 1:
+        if len(data) < MIN_COMPRESS_SIZE:
+            compressed = None
+        else:
+            compressed = zlib.compress(bytes(data), ZLIB_COMPRESSION_LEVEL)
+    elif version == 2:
+        compressed = lz4.block.compress(bytes(data), store_size=False)
+    else:
+        raise ValueError("unsupported svndiff version %d" % version)
+    if compressed is not None and len(compressed) < len(data):
+        ret.extend(compressed)
+    else:
+        # Compression didn't help, just append the original data
+        ret.extend(data)
+    return ret
+
+
+def decompress_section(data, version):
+    """Decompress an instruction or new data section of a svndiff window.
 
+    :param data: Section to decompress, prefixed with the original length
+    :param version: svndiff version (1 or 2)
+    :return: Decompressed data
+    """
+    orig_len, offset = decode_length_at(data, 0)
+    data = bytes(data[offset:])
+    if len(data) == orig_len:
+        return data
+    if version == 1:
+        try:
+            ret = zlib.decompress(data)
+        except zlib.error as e:
+            raise SubversionException(
+                "Decompression of svndiff data failed: %s" % e,
+                ERR_SVNDIFF_CORRUPT_WINDOW)
+    elif version == 2:
+        try:
+            ret = lz4.block.decompress(data, uncompressed_size=orig_len)
+        except lz4.block.LZ4BlockError as e:
+            raise SubversionException(
+                "Decompression of svndiff data failed: %s" % e,
+                ERR_SVNDIFF_CORRUPT_WINDOW)
+    else:
+        raise ValueError("unsupported svndiff version %d" % version)
+    if len(ret) != orig_len:
+        raise SubversionException(
+            "Size of uncompressed data does not match stored original length",
+            ERR_SVNDIFF_CORRUPT_WINDOW)
+    return ret
+
+
+def _pack_svndiff_instructions(ops):
     instrdata = bytearray()
     for op in ops:
         instrdata += pack_svndiff_instruction(op)
+    return instrdata
+
 
+def _pack_window(sview_offset, sview_len, tview_len, instrdata, new_data):
+    ret = (encode_length(sview_offset) +
+           encode_length(sview_len) +
+           encode_length(tview_len))
     ret.extend(encode_length(len(instrdata)))
     ret.extend(encode_length(len(new_data)))
     ret.extend(instrdata)
@@ -236,6 +583,33 @@ def pack_svndiff0_window(window):
     return ret
 
 
+def pack_svndiff0_window(window):
+    """Pack an individual window using svndiff0.
+
+    :param window: Window to pack
+    :return: Packed diff (as bytestring)
+    """
+    (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
+    return _pack_window(sview_offset, sview_len, tview_len,
+                        _pack_svndiff_instructions(ops), new_data)
+
+
+def pack_svndiff_window(window, version=0):
+    """Pack an individual window.
+
+    :param window: Window to pack
+    :param version: svndiff version to use
+    :return: Packed diff (as bytestring)
+    """
+    if version == 0:
+        return pack_svndiff0_window(window)
+    (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
+    return _pack_window(sview_offset, sview_len, tview_len,
+                        compress_section(
+                            _pack_svndiff_instructions(ops), version),
+                        compress_section(new_data, version))
+
+
 def pack_svndiff0(windows):
     """Pack a SVN diff file.
 
@@ -248,6 +622,76 @@ def pack_svndiff0(windows):
     return ret
 
 
+def pack_svndiff(windows, version=0):
+    """Pack a SVN diff file.
+
+    :param windows: Iterator over diff windows
+    :param version: svndiff version to use
+    :return: text
+    """
+    if version == 0:
+        return pack_svndiff0(windows)
+    ret = bytearray(SVNDIFF_HEADERS[version])
+    for window in windows:
+        ret += pack_svndiff_window(window, version)
+    return bytes(ret)
+
+
+def unpack_svndiff(text):
+    """Unpack a svndiff text of any supported version.
+
+    :param text: Text to unpack.
+    :return: yields tuples with sview_offset, sview_len, tview_len, ops_len,
+        ops, newdata
+    """
+    version = svndiff_version(text[:len(SVNDIFF0_HEADER)])
+    if version == 0:
+        for window in unpack_svndiff0(text):
+            yield window
+        return
+    offset = len(SVNDIFF0_HEADER)
+    while offset < len(text):
+        ret = unpack_svndiff_window_at(text, offset, version)
+        if ret is None:
+            raise SubversionException(
+                "Unexpected end of svndiff input", ERR_SVNDIFF_UNEXPECTED_END)
+        (window, offset) = ret
+        yield window
+
+
+def unpack_svndiff_window_at(text, offset, version):
+    """Unpack a window at a particular offset, if it is complete.
+
+    :param text: Buffer to unpack from
+    :param offset: Offset of the window in text
+    :param version: svndiff version
+    :return: None if the window is incomplete, otherwise tuple with
+        window and offset of the next window
+    """
+    try:
+        sview_offset, offset = decode_length_at(text, offset)
+        sview_len, offset = decode_length_at(text, offset)
+        tview_len, offset = decode_length_at(text, offset)
+        instr_len, offset = decode_length_at(text, offset)
+        newdata_len, offset = decode_length_at(text, offset)
+    except IndexError:
+        return None
+    instr_end = offset + instr_len
+    data_end = instr_end + newdata_len
+    if data_end > len(text):
+        return None
+    instrdata = text[offset:instr_end]
+    newdata = text[instr_end:data_end]
+    if version == 0:
+        newdata = bytes(newdata)
+    else:
+        instrdata = decompress_section(instrdata, version)
+        newdata = decompress_section(newdata, version)
+    ops = _unpack_svndiff_instructions(instrdata, 0, len(instrdata))
+    window = (sview_offset, sview_len, tview_len, len(ops), ops, newdata)
+    return (window, data_end)
+
+
 def unpack_svndiff0(text):
     """Unpack a version 0 svndiff text.
 
@@ -255,24 +699,105 @@ def unpack_svndiff0(text):
     :return: yields tuples with sview_offset, sview_len, tview_len, ops_len,
         ops, newdata
     """
-    assert text.startswith(SVNDIFF0_HEADER)
-    text = text[4:]
+    for window in unpack_svndiff0_view(text):
+        yield window[:5] + (window[5].tobytes(), )
 
-    while text:
-        sview_offset, text = decode_length(text)
-        sview_len, text = decode_length(text)
-        tview_len, text = decode_length(text)
-        instr_len, text = decode_length(text)
-        newdata_len, text = decode_length(text)
-
-        instrdata = text[:instr_len]
-        text = text[instr_len:]
-
-        ops = []
-        while instrdata:
-            op, instrdata = unpack_svndiff_instruction(instrdata)
-            ops.append(op)
-
-        newdata = text[:newdata_len]
-        text = text[newdata_len:]
+
+def unpack_svndiff0_view(text):
+    """Unpack a version 0 svndiff text, without copying the new data.
+
+    This yields the same windows as unpack_svndiff0, except that newdata
+    is a memoryview into text rather than a copy. The caller should not
+    modify text while the windows are still in use.
+
+    :param text: Text to unpack (any object supporting the buffer protocol)
+    :return: yields tuples with sview_offset, sview_len, tview_len, ops_len,
+        ops, newdata
+    """
+    view = memoryview(text)
+    assert view[:len(SVNDIFF0_HEADER)].tobytes() == SVNDIFF0_HEADER
+    offset = len(SVNDIFF0_HEADER)
+
+    while offset < len(view):
+        sview_offset, offset = decode_length_at(view, offset)
+        sview_len, offset = decode_length_at(view, offset)
+        tview_len, offset = decode_length_at(view, offset)
+        instr_len, offset = decode_length_at(view, offset)
+        newdata_len, offset = decode_length_at(view, offset)
+
+        instr_end = offset + instr_len
+        ops = _unpack_svndiff_instructions(view, offset, instr_end)
+        offset = instr_end
+
+        newdata = view[offset:offset+newdata_len]
+        offset += newdata_len
         yield (sview_offset, sview_len, tview_len, len(ops), ops, newdata)
+
+
+class SvndiffDecoder(object):
+    """Incremental svndiff decoder.
+
+    The svndiff version is determined from the header; all versions in
+    SVNDIFF_VERSIONS are supported.
+
+    Data can be fed in chunks of arbitrary size; every window is passed on
+    to the txdelta window handler as soon as it has been received
+    completely, so only a single window is buffered at a time.
+    """
+
+    def __init__(self, handler):
+        """Create a new decoder.
+
+        :param handler: txdelta window handler function
+        """
+        self.handler = handler
+        self._buffer = bytearray()
+        self.version = None
+
+    def feed(self, data):
+        """Feed more svndiff data to the decoder.
+
+        :param data: Bytestring with the next chunk of svndiff data
+        """
+        self._buffer.extend(data)
+        if self.version is None:
+            if len(self._buffer) < len(SVNDIFF0_HEADER):
+                return
+            self.version = svndiff_version(
+                self._buffer[:len(SVNDIFF0_HEADER)])
+            del self._buffer[:len(SVNDIFF0_HEADER)]
+        offset = 0
+        while True:
+            ret = unpack_svndiff_window_at(self._buffer, offset, self.version)
+            if ret is None:
+                break
+            (window, offset) = ret
+            self.handler(window)
+        del self._buffer[:offset]
+
+    def close(self):
+        """Signal the end of the svndiff data.
+
+        This calls the window handler with None.
+        """
+        if self._buffer or self.version is None:
+            raise SubversionException(
+                "Unexpected end of svndiff input", ERR_SVNDIFF_UNEXPECTED_END)
+        self.handler(None)
+
+
+_pack_svndiff0_window_py = pack_svndiff0_window
+_pack_svndiff0_py = pack_svndiff0
+_unpack_svndiff0_py = unpack_svndiff0
+_txdelta_apply_ops_py = txdelta_apply_ops
+
+
+try:
+    from subvertpy._delta import (  # noqa: F811
+        pack_svndiff0,
+        pack_svndiff0_window,
+        txdelta_apply_ops,
+        unpack_svndiff0,
+        )
+except ImportError:
+    pass
@@ -17,7 +17,9 @@
  */
 #include <stdbool.h>
 #include <Python.h>
+#include <structmember.h>
 #include <apr_general.h>
+#include <apr_md5.h>
 #include <svn_types.h>
 #include <svn_delta.h>
 #include <svn_path.h>
@@ -93,6 +95,328 @@ static void py_editor_dealloc(PyObject *self)
 #error "Unable to determine PyArg_Parse format for size_t"
 #endif
 
+static const char empty_new_data[] = "";
+
+PyObject *new_txdelta_window(const svn_txdelta_window_t *window)
+{
+	TxDeltaWindowObject *ret;
+	size_t ops_size, data_len = 0;
+	char *buf;
+
+	ret = PyObject_New(TxDeltaWindowObject, &TxDeltaWindow_Type);
+	if (ret == NULL)
+		return NULL;
+
+	ret->sview_offset = window->sview_offset;
+	ret->sview_len = window->sview_len;
+	ret->tview_len = window->tview_len;
+	ret->src_ops = window->src_ops;
+	ret->num_ops = window->num_ops;
+	ret->has_new_data = (window->new_data != NULL && window->new_data->data != NULL);
+	if (ret->has_new_data)
+		data_len = window->new_data->len;
+	ret->ops = NULL;
+	ret->new_data = empty_new_data;
+	ret->new_data_len = data_len;
+
+	/* The window is only valid for the duration of the callback, so copy
+	 * the operations and the new data, in a single allocation. */
+	ops_size = sizeof(svn_txdelta_op_t) * window->num_ops;
+	if (ops_size + data_len > 0) {
+		buf = malloc(ops_size + data_len);
+		if (buf == NULL) {
+			Py_DECREF(ret);
+			PyErr_NoMemory();
+			return NULL;
+		}
+		memcpy(buf, window->ops, ops_size);
+		if (data_len > 0)
+			memcpy(buf + ops_size, window->new_data->data, data_len);
+		ret->ops = (svn_txdelta_op_t *)buf;
+		ret->new_data = buf + ops_size;
+	}
+
+	return (PyObject *)ret;
+}
+
+static void txdelta_window_dealloc(PyObject *self)
+{
+	TxDeltaWindowObject *window = (TxDeltaWindowObject *)self;
+	free(window->ops);
+	PyObject_Del(self);
+}
+
+/* Sequence of (action, offset, length) tuples, backed by the packed
+ * operations of a window. */
+typedef struct {
+	PyObject_HEAD
+	TxDeltaWindowObject *window;
+} TxDeltaOpsObject;
+
+static PyObject *txdelta_window_get_ops(PyObject *self, void *closure)
+{
+	TxDeltaOpsObject *ret = PyObject_New(TxDeltaOpsObject, &TxDeltaOps_Type);
+	if (ret == NULL)
+		return NULL;
+	ret->window = (TxDeltaWindowObject *)self;
+	Py_INCREF(self);
+	return (PyObject *)ret;
+}
+
+static PyObject *txdelta_window_get_new_data(PyObject *self, void *closure)
+{
+	TxDeltaWindowObject *window = (TxDeltaWindowObject *)self;
+	if (!window->has_new_data)
+		Py_RETURN_NONE;
+	return PyMemoryView_FromObject(self);
+}
+
+static PyObject *txdelta_op_tuple(const svn_txdelta_op_t *op)
+{
+	return Py_BuildValue("(ikk)", op->action_code, (unsigned long)op->offset,
+						 (unsigned long)op->length);
+}
+
+/* List of (action, offset, length) tuples, as in a window tuple. */
+static PyObject *txdelta_window_ops_list(TxDeltaWindowObject *window)
+{
+	PyObject *ops;
+	int i;
+
+	ops = PyList_New(window->num_ops);
+	if (ops == NULL)
+		return NULL;
+	for (i = 0; i < window->num_ops; i++) {
+		PyObject *op = txdelta_op_tuple(&window->ops[i]);
+		if (op == NULL) {
+			Py_DECREF(ops);
+			return NULL;
+		}
+		PyList_SET_ITEM(ops, i, op);
+	}
+	return ops;
+}
+
+/* Copy of the new data as bytes, or None, as in a window tuple. */
+static PyObject *txdelta_window_new_data_bytes(TxDeltaWindowObject *window)
+{
+	if (!window->has_new_data)
+		Py_RETURN_NONE;
+	return PyBytes_FromStringAndSize(window->new_data, window->new_data_len);
+}
+
+/* Convert a window to the equivalent tuple, with a list of ops and a
+ * bytes copy of the new data. */
+static PyObject *txdelta_window_as_tuple(TxDeltaWindowObject *window)
+{
+	PyObject *ops, *py_new_data;
+
+	ops = txdelta_window_ops_list(window);
+	if (ops == NULL)
+		return NULL;
+	py_new_data = txdelta_window_new_data_bytes(window);
+	if (py_new_data == NULL) {
+		Py_DECREF(ops);
+		return NULL;
+	}
+	return Py_BuildValue("(LkkiNN)", (PY_LONG_LONG)window->sview_offset,
+						 (unsigned long)window->sview_len,
+						 (unsigned long)window->tview_len,
+						 window->src_ops, ops, py_new_data);
+}
+
+static Py_ssize_t txdelta_window_length(PyObject *self)
+{
+	return 6;
+}
+
+static PyObject *txdelta_window_item(PyObject *self, Py_ssize_t i)
+{
+	TxDeltaWindowObject *window = (TxDeltaWindowObject *)self;
+	switch (i) {
+		case 0:
+			return Py_BuildValue("L", (PY_LONG_LONG)window->sview_offset);
+		case 1:
+			return Py_BuildValue("k", (unsigned long)window->sview_len);
+		case 2:
+			return Py_BuildValue("k", (unsigned long)window->tview_len);
+		case 3:
+			return Py_BuildValue("i", window->src_ops);
+		case 4:
+			return txdelta_window_ops_list(window);
+		case 5:
+			return txdelta_window_new_data_bytes(window);
+		default:
+			PyErr_SetString(PyExc_IndexError, "window index out of range");
+			return NULL;
+	}
+}
+
+static PyObject *txdelta_window_subscript(PyObject *self, PyObject *key)
+{
+	PyObject *tuple, *ret;
+
+	if (PyIndex_Check(key)) {
+		Py_ssize_t i = PyNumber_AsSsize_t(key, PyExc_IndexError);
+		if (i == -1 && PyErr_Occurred())
+			return NULL;
+		if (i < 0)
+			i += 6;
+		return txdelta_window_item(self, i);
+	}
+
+	/* Slices are rare, so don't bother avoiding the conversion */
+	tuple = txdelta_window_as_tuple((TxDeltaWindowObject *)self);
+	if (tuple == NULL)
+		return NULL;
+	ret = PyObject_GetItem(tuple, key);
+	Py_DECREF(tuple);
+	return ret;
+}
+
+static PyObject *txdelta_window_richcompare(PyObject *self, PyObject *other, int op)
+{
+	PyObject *tuple, *other_tuple, *ret;
+
+	if (TxDeltaWindow_Check(other)) {
+		other_tuple = txdelta_window_as_tuple((TxDeltaWindowObject *)other);
+		if (other_tuple == NULL)
+			return NULL;
+	} else if (PyTuple_Check(other)) {
+		other_tuple = other;
+		Py_INCREF(other_tuple);
+	} else {
+		Py_INCREF(Py_NotImplemented);
+		return Py_NotImplemented;
+	}
+
+	tuple = txdelta_window_as_tuple((TxDeltaWindowObject *)self);
+	if (tuple == NULL) {
+		Py_DECREF(other_tuple);
+		return NULL;
+	}
+	ret = PyObject_RichCompare(tuple, other_tuple, op);
+	Py_DECREF(tuple);
+	Py_DECREF(other_tuple);
+	return ret;
+}
+
+static PyObject *txdelta_window_repr(PyObject *self)
+{
+	TxDeltaWindowObject *window = (TxDeltaWindowObject *)self;
+	PyObject *tuple, *ret;
+
+	tuple = txdelta_window_as_tuple(window);
+	if (tuple == NULL)
+		return NULL;
+	ret = PyObject_Repr(tuple);
+	Py_DECREF(tuple);
+	return ret;
+}
+
+static int txdelta_window_getbuffer(PyObject *self, Py_buffer *view, int flags)
+{
+	TxDeltaWindowObject *window = (TxDeltaWindowObject *)self;
+	return PyBuffer_FillInfo(view, self, (void *)window->new_data,
+							 window->new_data_len, 1, flags);
+}
+
+static PySequenceMethods txdelta_window_as_sequence = {
+	.sq_length = txdelta_window_length,
+	.sq_item = txdelta_window_item,
+};
+
+static PyMappingMethods txdelta_window_as_mapping = {
+	.mp_length = txdelta_window_length,
+	.mp_subscript = txdelta_window_subscript,
+};
+
+static PyBufferProcs txdelta_window_as_buffer = {
+	.bf_getbuffer = txdelta_window_getbuffer,
+};
+
+static PyMemberDef txdelta_window_members[] = {
+	{ "sview_offset", T_LONGLONG, offsetof(TxDeltaWindowObject, sview_offset), READONLY,
+		"Offset of the source view" },
+	{ "sview_len", T_ULONG, offsetof(TxDeltaWindowObject, sview_len), READONLY,
+		"Length of the source view" },
+	{ "tview_len", T_ULONG, offsetof(TxDeltaWindowObject, tview_len), READONLY,
+		"Length of the target view" },
+	{ "src_ops", T_INT, offsetof(TxDeltaWindowObject, src_ops), READONLY,
+		"Number of operations that copy from the source view" },
+	{ "num_ops", T_INT, offsetof(TxDeltaWindowObject, num_ops), READONLY,
+		"Number of operations" },
+	{ NULL }
+};
+
+static PyGetSetDef txdelta_window_getsetters[] = {
+	{ "ops", txdelta_window_get_ops, NULL,
+		"Sequence of (action, offset, length) tuples" },
+	{ "new_data", txdelta_window_get_new_data, NULL,
+		"New data as a memoryview, or None" },
+	{ NULL }
+};
+
+PyTypeObject TxDeltaWindow_Type = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "_ra.TxDeltaWindow",
+	.tp_basicsize = sizeof(TxDeltaWindowObject),
+	.tp_dealloc = txdelta_window_dealloc,
+	.tp_repr = txdelta_window_repr,
+	.tp_as_sequence = &txdelta_window_as_sequence,
+	.tp_as_mapping = &txdelta_window_as_mapping,
+	.tp_as_buffer = &txdelta_window_as_buffer,
+#if PY_MAJOR_VERSION < 3
+	.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER,
+#else
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+#endif
+	.tp_doc = "Text delta window.\n\n"
+		"Can be unpacked like a (sview_offset, sview_len, tview_len, src_ops, "
+		"ops, new_data) tuple, in which case ops is a list and new_data is "
+		"bytes. The ops and new_data attributes and the buffer protocol "
+		"give access to them without copying.",
+	.tp_richcompare = txdelta_window_richcompare,
+	.tp_members = txdelta_window_members,
+	.tp_getset = txdelta_window_getsetters,
+};
+
+static void txdelta_ops_dealloc(PyObject *self)
+{
+	Py_DECREF(((TxDeltaOpsObject *)self)->window);
+	PyObject_Del(self);
+}
+
+static Py_ssize_t txdelta_ops_length(PyObject *self)
+{
+	return ((TxDeltaOpsObject *)self)->window->num_ops;
+}
+
+static PyObject *txdelta_ops_item(PyObject *self, Py_ssize_t i)
+{
+	TxDeltaWindowObject *window = ((TxDeltaOpsObject *)self)->window;
+	if (i < 0 || i >= window->num_ops) {
+		PyErr_SetString(PyExc_IndexError, "op index out of range");
+		return NULL;
+	}
+	return txdelta_op_tuple(&window->ops[i]);
+}
+
+static PySequenceMethods txdelta_ops_as_sequence = {
+	.sq_length = txdelta_ops_length,
+	.sq_item = txdelta_ops_item,
+};
+
+PyTypeObject TxDeltaOps_Type = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "_ra.TxDeltaOps",
+	.tp_basicsize = sizeof(TxDeltaOpsObject),
+	.tp_dealloc = txdelta_ops_dealloc,
+	.tp_as_sequence = &txdelta_ops_as_sequence,
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_doc = "Operations of a text delta window.",
+};
+
 static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 {
 	char *kwnames[] = { "window", NULL };
@@ -101,6 +425,7 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 	PyObject *py_window, *py_ops, *py_new_data;
 	int i;
 	svn_string_t new_data;
+	Py_buffer new_data_view;
 	svn_error_t *error;
 	svn_txdelta_op_t *ops;
 
@@ -112,53 +437,88 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 		Py_RETURN_NONE;
 	}
 
+	if (TxDeltaWindow_Check(py_window)) {
+		/* Passed on from another editor; use the packed data as is */
+		TxDeltaWindowObject *w = (TxDeltaWindowObject *)py_window;
+		window.sview_offset = w->sview_offset;
+		window.sview_len = w->sview_len;
+		window.tview_len = w->tview_len;
+		window.src_ops = w->src_ops;
+		window.num_ops = w->num_ops;
+		window.ops = w->ops;
+		if (w->has_new_data) {
+			new_data.data = w->new_data;
+			new_data.len = w->new_data_len;
+			window.new_data = &new_data;
+		} else {
+			window.new_data = NULL;
+		}
+		Py_BEGIN_ALLOW_THREADS
+		error = obj->txdelta_handler(&window, obj->txdelta_baton);
+		Py_END_ALLOW_THREADS
+		if (error != NULL) {
+			handle_svn_error(error);
+			svn_error_clear(error);
+			return NULL;
+		}
+		Py_RETURN_NONE;
+	}
+
 	if (!PyArg_ParseTuple(py_window, SVN_FILESIZE_T_PYFMT "kkiOO",
 		&window.sview_offset, &window.sview_len, &window.tview_len,
 		&window.src_ops, &py_ops, &py_new_data))
 		return NULL;
 
-	if (py_new_data == Py_None) {
-		window.new_data = NULL;
-	} else {
-		if (!PyBytes_Check(py_new_data)) {
-			PyErr_SetString(PyExc_TypeError, "delta data should be bytes");
-			return NULL;
-		}
-		new_data.data = PyBytes_AsString(py_new_data);
-		new_data.len = PyBytes_Size(py_new_data);
-		window.new_data = &new_data;
-	}
-
-	if (!PyList_Check(py_ops)) {
-		PyErr_SetString(PyExc_TypeError, "ops not a list");
+	py_ops = PySequence_Fast(py_ops, "ops not a sequence");
+	if (py_ops == NULL)
 		return NULL;
-	}
 
-	window.num_ops = PyList_Size(py_ops);
+	window.num_ops = PySequence_Fast_GET_SIZE(py_ops);
 
 	window.ops = ops = malloc(sizeof(svn_txdelta_op_t) * window.num_ops);
+	if (ops == NULL && window.num_ops > 0) {
+		Py_DECREF(py_ops);
+		PyErr_NoMemory();
+		return NULL;
+	}
 
 	for (i = 0; i < window.num_ops; i++) {
-		PyObject *windowitem = PyList_GetItem(py_ops, i);
+		PyObject *windowitem = PySequence_Fast_GET_ITEM(py_ops, i);
 		if (!PyArg_ParseTuple(windowitem, "ikk", &ops[i].action_code, 
 							  &ops[i].offset, &ops[i].length)) {
+			Py_DECREF(py_ops);
+			free(ops);
+			return NULL;
+		}
+	}
+	Py_DECREF(py_ops);
+
+	if (py_new_data == Py_None) {
+		window.new_data = NULL;
+	} else {
+		/* Any bytes-like object will do (bytes, bytearray, memoryview,
+		 * mmap, ...); the buffer is held until the handler returns. */
+		if (PyObject_GetBuffer(py_new_data, &new_data_view, PyBUF_SIMPLE) != 0) {
 			free(ops);
 			return NULL;
 		}
+		new_data.data = new_data_view.buf;
+		new_data.len = new_data_view.len;
+		window.new_data = &new_data;
 	}
 
 	Py_BEGIN_ALLOW_THREADS
 	error = obj->txdelta_handler(&window, obj->txdelta_baton);
 	Py_END_ALLOW_THREADS
+	if (window.new_data != NULL)
+		PyBuffer_Release(&new_data_view);
+	free(ops);
 	if (error != NULL) {
 		handle_svn_error(error);
 		svn_error_clear(error);
-		free(ops);
 		return NULL;
 	}
 
-	free(ops);
-
 	Py_RETURN_NONE;
 }
 
@@ -195,6 +555,252 @@ PyTypeObject TxDeltaWindowHandler_Type = {
 	
 };
 
+struct txdelta_target_baton {
+	svn_txdelta_window_handler_t handler;
+	void *baton;
+	svn_stream_t *source;
+	unsigned char digest[APR_MD5_DIGESTSIZE];
+	/* Borrowed from the TxDeltaTarget, which outlives the baton */
+	PyObject *callback;
+};
+
+static svn_error_t *py_txdelta_target_handler(svn_txdelta_window_t *window, void *baton)
+{
+	struct txdelta_target_baton *tb = baton;
+	static const char hexdigits[] = "0123456789abcdef";
+	char hexdigest[APR_MD5_DIGESTSIZE * 2 + 1];
+	PyGILState_STATE state;
+	PyObject *ret;
+	int i;
+
+	SVN_ERR(tb->handler(window, tb->baton));
+	if (window != NULL)
+		return NULL;
+
+	/* svn_txdelta_apply() closes the target, but not the source */
+	SVN_ERR(svn_stream_close(tb->source));
+
+	for (i = 0; i < APR_MD5_DIGESTSIZE; i++) {
+		hexdigest[i * 2] = hexdigits[tb->digest[i] >> 4];
+		hexdigest[i * 2 + 1] = hexdigits[tb->digest[i] & 0xf];
+	}
+	hexdigest[APR_MD5_DIGESTSIZE * 2] = '\0';
+
+	state = PyGILState_Ensure();
+	if (tb->callback == Py_None) {
+		ret = Py_None;
+		Py_INCREF(ret);
+	} else {
+		ret = PyObject_CallFunction(tb->callback, "s", hexdigest);
+	}
+	CB_CHECK_PYRETVAL(ret);
+	Py_DECREF(ret);
+	PyGILState_Release(state);
+	return NULL;
+}
+
+static svn_stream_t *txdelta_target_stream(PyObject *obj, bool write, apr_pool_t *pool)
+{
+	apr_file_t *file;
+	apr_status_t status;
+	const char *path;
+
+	if (obj == Py_None)
+		return svn_stream_empty(pool);
+
+	if (PyBytes_Check(obj) || PyUnicode_Check(obj)) {
+		path = py_object_to_svn_dirent(obj, pool);
+		if (path == NULL)
+			return NULL;
+		status = apr_file_open(&file, path,
+			write?(APR_WRITE | APR_CREATE | APR_TRUNCATE | APR_BUFFERED)
+				:(APR_READ | APR_BUFFERED),
+			APR_OS_DEFAULT, pool);
+		if (status) {
+			PyErr_SetAprStatus(status);
+			return NULL;
+		}
+		return svn_stream_from_aprfile2(file, FALSE, pool);
+	}
+
+#if PY_MAJOR_VERSION < 3
+	if (PyInt_Check(obj) || PyLong_Check(obj)) {
+#else
+	if (PyLong_Check(obj)) {
+#endif
+		/* File descriptors are owned by the caller and stay open */
+		file = apr_file_from_object(obj, pool);
+		if (file == NULL)
+			return NULL;
+		return svn_stream_from_aprfile2(file, TRUE, pool);
+	}
+
+	return new_py_stream(pool, obj);
+}
+
+static bool txdelta_target_open(TxDeltaTargetObject *self, apr_pool_t *pool,
+								svn_txdelta_window_handler_t *handler,
+								void **handler_baton)
+{
+	struct txdelta_target_baton *tb;
+	svn_stream_t *target;
+
+	tb = apr_pcalloc(pool, sizeof(struct txdelta_target_baton));
+	if (tb == NULL) {
+		PyErr_NoMemory();
+		return false;
+	}
+	tb->source = txdelta_target_stream(self->base, false, pool);
+	if (tb->source == NULL)
+		return false;
+	target = txdelta_target_stream(self->target, true, pool);
+	if (target == NULL)
+		return false;
+	tb->callback = self->callback;
+	svn_txdelta_apply(tb->source, target, tb->digest, NULL, pool,
+					  &tb->handler, &tb->baton);
+	*handler = py_txdelta_target_handler;
+	*handler_baton = tb;
+	return true;
+}
+
+static PyObject *txdelta_target_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { "target", "base", "callback", NULL };
+	PyObject *target, *base = Py_None, *callback = Py_None;
+	TxDeltaTargetObject *ret;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|OO", kwnames,
+									 &target, &base, &callback))
+		return NULL;
+
+	if (target == Py_None) {
+		PyErr_SetString(PyExc_TypeError, "target can not be None");
+		return NULL;
+	}
+
+	if (callback != Py_None && !PyCallable_Check(callback)) {
+		PyErr_SetString(PyExc_TypeError, "callback should be callable");
+		return NULL;
+	}
+
+	ret = PyObject_New(TxDeltaTargetObject, &TxDeltaTarget_Type);
+	if (ret == NULL)
+		return NULL;
+
+	Py_INCREF(target);
+	ret->target = target;
+	Py_INCREF(base);
+	ret->base = base;
+	Py_INCREF(callback);
+	ret->callback = callback;
+	ret->pool = NULL;
+	ret->handler = NULL;
+
+	return (PyObject *)ret;
+}
+
+/* Drop the text that is being applied from Python, if any. */
+static void txdelta_target_reset(TxDeltaTargetObject *target)
+{
+	Py_CLEAR(target->handler);
+	if (target->pool != NULL) {
+		apr_pool_destroy(target->pool);
+		target->pool = NULL;
+	}
+}
+
+/* Releases the reference a C editor's pool holds on a TxDeltaTarget, once
+ * the text is complete or has been abandoned. */
+static apr_status_t txdelta_target_pool_cleanup(void *data)
+{
+	PyGILState_STATE state = PyGILState_Ensure();
+	Py_DECREF((PyObject *)data);
+	PyGILState_Release(state);
+	return APR_SUCCESS;
+}
+
+static void txdelta_target_dealloc(PyObject *self)
+{
+	TxDeltaTargetObject *target = (TxDeltaTargetObject *)self;
+	txdelta_target_reset(target);
+	Py_DECREF(target->target);
+	Py_DECREF(target->base);
+	Py_DECREF(target->callback);
+	PyObject_Del(self);
+}
+
+static PyObject *txdelta_target_call(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { "window", NULL };
+	TxDeltaTargetObject *target = (TxDeltaTargetObject *)self;
+	TxDeltaWindowHandlerObject *handler;
+	PyObject *window, *ret;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O", kwnames, &window))
+		return NULL;
+
+	/* Called from Python, e.g. by the pure-Python svn:// client */
+	if (target->handler == NULL) {
+		target->pool = Pool(NULL);
+		if (target->pool == NULL)
+			return NULL;
+		handler = PyObject_New(TxDeltaWindowHandlerObject,
+							   &TxDeltaWindowHandler_Type);
+		if (handler == NULL) {
+			txdelta_target_reset(target);
+			return NULL;
+		}
+		target->handler = (PyObject *)handler;
+		if (!txdelta_target_open(target, target->pool,
+								 &handler->txdelta_handler,
+								 &handler->txdelta_baton)) {
+			txdelta_target_reset(target);
+			return NULL;
+		}
+	}
+
+	ret = PyObject_CallFunctionObjArgs(target->handler, window, NULL);
+	if (ret == NULL || window == Py_None) {
+		/* Text is complete or broken; the target can be reused for
+		 * another text */
+		txdelta_target_reset(target);
+	}
+
+	return ret;
+}
+
+static PyMemberDef txdelta_target_members[] = {
+	{ "target", T_OBJECT, offsetof(TxDeltaTargetObject, target), READONLY,
+		"Path, file descriptor or stream the fulltext is written to" },
+	{ "base", T_OBJECT, offsetof(TxDeltaTargetObject, base), READONLY,
+		"Path, file descriptor or stream with the base text, or None" },
+	{ "callback", T_OBJECT, offsetof(TxDeltaTargetObject, callback), READONLY,
+		"Called with the hex MD5 digest of the fulltext, or None" },
+	{ NULL }
+};
+
+PyTypeObject TxDeltaTarget_Type = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "_ra.TxDeltaTarget",
+	.tp_basicsize = sizeof(TxDeltaTargetObject),
+	.tp_dealloc = txdelta_target_dealloc,
+	.tp_call = txdelta_target_call,
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_doc = "TxDeltaTarget(target, base=None, callback=None)\n\n"
+		"Apply text deltas to a base text and write the fulltext to target.\n\n"
+		"Return an instance from apply_textdelta() in an editor passed to "
+		"do_update, do_switch, replay or replay_range to have the delta "
+		"windows applied in C, without the GIL held. base and target can be "
+		"paths, file descriptors or file-like objects; a base of None is "
+		"the empty text. Streams are closed once the text is complete, "
+		"file descriptors are left open. callback is called with the hex "
+		"MD5 digest of the fulltext.",
+	.tp_members = txdelta_target_members,
+	.tp_new = txdelta_target_new,
+};
+
+
 static PyObject *py_file_editor_apply_textdelta(PyObject *self, PyObject *args)
 {
 	EditorObject *editor = (EditorObject *)self;
@@ -1127,9 +1733,8 @@ static svn_error_t *py_cb_editor_open_file(const char *path, void *parent_baton,
 
 svn_error_t *py_txdelta_window_handler(svn_txdelta_window_t *window, void *baton)
 {
-	int i;
-	PyObject *ops, *ret;
-	PyObject *fn = (PyObject *)baton, *py_new_data, *py_window;
+	PyObject *ret;
+	PyObject *fn = (PyObject *)baton, *py_window;
 	PyGILState_STATE state;
 	if (fn == Py_None) {
 		/* User doesn't care about deltas */
@@ -1142,43 +1747,8 @@ svn_error_t *py_txdelta_window_handler(svn_txdelta_window_t *window, void *baton
 		py_window = Py_None;
 		Py_INCREF(py_window);
 	} else {
-		ops = PyList_New(window->num_ops);
-		if (ops == NULL) {
-			PyGILState_Release(state);
-			return NULL;
-		}
-		for (i = 0; i < window->num_ops; i++) {
-			PyObject *pyval = Py_BuildValue("(iII)", 
-											window->ops[i].action_code, 
-											window->ops[i].offset, 
-											window->ops[i].length);
-			CB_CHECK_PYRETVAL(pyval);
-			if (PyList_SetItem(ops, i, pyval) != 0) {
-				Py_DECREF(ops);
-				Py_DECREF(pyval);
-				PyGILState_Release(state);
-				return NULL;
-			}
-		}
-		if (window->new_data != NULL && window->new_data->data != NULL) {
-			py_new_data = PyBytes_FromStringAndSize(window->new_data->data,
-													window->new_data->len);
-		} else {
-			py_new_data = Py_None;
-			Py_INCREF(py_new_data);
-		}
-		if (py_new_data == NULL) {
-			Py_DECREF(ops);
-			PyGILState_Release(state);
-			return NULL;
-		}
-
-		py_window = Py_BuildValue("((LIIiNN))", 
-								  window->sview_offset, 
-								  window->sview_len, 
-								  window->tview_len, 
-								  window->src_ops, ops, py_new_data);
-		CB_CHECK_PYRETVAL(py_window); /* FIXME: free ops and py_new_data */
+		py_window = new_txdelta_window(window);
+		CB_CHECK_PYRETVAL(py_window);
 	}
 	ret = PyObject_CallFunction(fn, "O", py_window);
 	Py_DECREF(py_window);
@@ -1200,6 +1770,21 @@ static svn_error_t *py_cb_editor_apply_textdelta(void *file_baton, const char *b
 
 	ret = PyObject_CallMethod(self, "apply_textdelta", "z", base_checksum);
 	CB_CHECK_PYRETVAL(ret);
+	if (TxDeltaTarget_Check(ret)) {
+		/* Apply the windows in C; Python only hears about completion */
+		if (!txdelta_target_open((TxDeltaTargetObject *)ret, pool,
+								 handler, handler_baton)) {
+			Py_DECREF(ret);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		/* The baton borrows from the target, so keep it alive for as long
+		 * as the pool, even if the text is never completed */
+		apr_pool_cleanup_register(pool, ret, txdelta_target_pool_cleanup,
+								  apr_pool_cleanup_null);
+		PyGILState_Release(state);
+		return NULL;
+	}
 	*handler_baton = (void *)ret;
 	*handler = py_txdelta_window_handler;
 	PyGILState_Release(state);
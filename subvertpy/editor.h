@@ -48,6 +48,44 @@ typedef struct {
 
 svn_error_t *py_txdelta_window_handler(svn_txdelta_window_t *window, void *baton);
 
+extern PyTypeObject TxDeltaWindow_Type;
+extern PyTypeObject TxDeltaOps_Type;
+
+#define TxDeltaWindow_Check(op) PyObject_TypeCheck(op, &TxDeltaWindow_Type)
+
+/* A delta window, with the operations and new data packed into a single
+ * allocation. Behaves like the (sview_offset, sview_len, tview_len, src_ops,
+ * ops, new_data) tuple that was used before. */
+typedef struct {
+    PyObject_HEAD
+    svn_filesize_t sview_offset;
+    apr_size_t sview_len;
+    apr_size_t tview_len;
+    int src_ops;
+    int num_ops;
+    svn_txdelta_op_t *ops;
+    bool has_new_data;
+    const char *new_data;
+    apr_size_t new_data_len;
+} TxDeltaWindowObject;
+
+PyObject *new_txdelta_window(const svn_txdelta_window_t *window);
+
+extern PyTypeObject TxDeltaTarget_Type;
+
+#define TxDeltaTarget_Check(op) PyObject_TypeCheck(op, &TxDeltaTarget_Type)
+
+/* Returned from apply_textdelta() to have delta windows applied in C and
+ * the fulltext written to target. */
+typedef struct {
+    PyObject_HEAD
+    PyObject *target;
+    PyObject *base;
+    PyObject *callback;
+    apr_pool_t *pool;
+    PyObject *handler;
+} TxDeltaTargetObject;
+
 #ifdef __GNUC__
 #pragma GCC visibility pop
 #endif
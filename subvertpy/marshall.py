@@ -16,6 +16,8 @@
 
 """Marshalling for the svn_ra protocol."""
 
+import re
+
 
 class literal(object):
     """A protocol literal."""
@@ -30,8 +32,16 @@ class literal(object):
         return self.txt
 
     def __eq__(self, other):
+        if isinstance(other, str):
+            return self.txt == other
         return (type(self) == type(other) and self.txt == other.txt)
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.txt)
+
 # 1. Syntactic structure
 # ----------------------
 #
@@ -119,14 +129,14 @@ def unmarshall(x):
             x = x[1:]
         num = int(num)
 
-        if x[0] in whitespace:
+        if not x:
+            raise NeedMoreData("Expected whitespace or ':'")
+        elif x[0] in whitespace:
             return (x[1:], num)
         elif x[0:1] == b":":
-            if len(x) < num:
+            if len(x) < num + 1:
                 raise NeedMoreData("Expected string of length %r" % num)
             return (x[num+2:], x[1:num+1])
-        elif not x:
-            raise MarshallError("Expected whitespace, got end of string.")
         else:
             raise MarshallError("Expected whitespace or ':', got '%c'" % x[0])
     elif x[:1].isalpha():
@@ -148,3 +158,122 @@ def unmarshall(x):
         return (x[1:], literal(ret.decode("ascii")))
     else:
         raise MarshallError("Unexpected character '%c'" % x[0])
+
+
+_whitespace_re = re.compile(b"[ \n]*")
+# Tokens, including their trailing whitespace; strings only up to the colon
+_token_re = re.compile(
+    b"[ \n]*(?:(\\()[ \n]|(\\))[ \n]|([0-9]+)[ \n]|([0-9]+):|"
+    b"([A-Za-z][A-Za-z0-9-]*)[ \n])")
+# Prefixes of tokens, used to tell truncated from invalid input
+_partial_token_re = re.compile(
+    b"[ \n]*(?:[(]|[)]|[0-9]+|[A-Za-z][A-Za-z0-9-]*)?")
+_LIST_START, _LIST_END, _NUMBER, _STRING, _WORD = range(1, 6)
+
+
+def _read_item(buf, pos, stack):
+    """Parse the next item from a buffer.
+
+    :param buf: Buffer to parse
+    :param pos: Offset in buf to start at
+    :param stack: Lists that have been opened but not yet closed; updated
+        in place
+    :return: Tuple with the offset of the first byte not consumed and the
+        item, or None if the item is not complete yet
+    """
+    match = _token_re.match
+    while True:
+        m = match(buf, pos)
+        if m is None:
+            m = _partial_token_re.match(buf, pos)
+            if m.end() == len(buf):
+                return (pos, None)
+            pos = _whitespace_re.match(buf, pos).end()
+            raise MarshallError(
+                "Unexpected data %r" % bytes(buf[pos:pos+10]))
+        kind = m.lastindex
+        if kind == _LIST_START:
+            pos = m.end()
+            stack.append([])
+            continue
+        elif kind == _LIST_END:
+            if not stack:
+                raise MarshallError("Unexpected end of list")
+            pos = m.end()
+            item = stack.pop()
+        elif kind == _NUMBER:
+            pos = m.end()
+            item = int(m.group(kind))
+        elif kind == _STRING:
+            start = m.end()
+            stop = start + int(m.group(kind))
+            if stop >= len(buf):
+                return (pos, None)
+            if buf[stop:stop+1] not in (b" ", b"\n"):
+                raise MarshallError(
+                    "Expected whitespace, got %r" % buf[stop:stop+1])
+            pos = stop + 1
+            item = bytes(buf[start:stop])
+        else:
+            pos = m.end()
+            item = literal(m.group(kind).decode("ascii"))
+        if not stack:
+            return (pos, item)
+        stack[-1].append(item)
+
+
+class Unmarshaller(object):
+    """Incremental parser for items in the svn_ra protocol.
+
+    Data can be fed in chunks of arbitrary size. The parse position and
+    the stack of lists that have not been closed yet are kept between
+    calls, so data is never parsed more than once.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+        self._stack = []
+
+    def feed(self, data):
+        """Add more data to parse.
+
+        :param data: Bytestring with received data
+        """
+        if self._pos:
+            del self._buffer[:self._pos]
+            self._pos = 0
+        self._buffer.extend(data)
+
+    def read_item(self):
+        """Parse the next complete item.
+
+        :raise NeedMoreData: if no complete item has been received yet
+        :return: The next item
+        """
+        (self._pos, item) = _read_item(self._buffer, self._pos, self._stack)
+        if item is None:
+            raise NeedMoreData("Not enough data")
+        return item
+
+    def read_items(self):
+        """Iterate over all items that have been received completely."""
+        while True:
+            try:
+                yield self.read_item()
+            except NeedMoreData:
+                return
+
+
+_marshall_py = marshall
+_unmarshall_py = unmarshall
+_read_item_py = _read_item
+
+try:
+    from subvertpy._marshall import (  # noqa: F811
+        marshall,
+        read_item as _read_item,
+        unmarshall,
+        )
+except ImportError:
+    pass
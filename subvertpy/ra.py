@@ -17,6 +17,11 @@
 
 __author__ = "Jelmer Vernooij <jelmer@jelmer.uk>"
 
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
 from subvertpy import SubversionException, ERR_BAD_URL
 
 from subvertpy import _ra
@@ -51,3 +56,204 @@ def RemoteAccess(url, *args, **kwargs):
     if type not in url_handlers:
         raise SubversionException("Unknown URL type '%s'" % type, ERR_BAD_URL)
     return url_handlers[type](url, *args, **kwargs)
+
+
+def _url_text(url):
+    if isinstance(url, bytes):
+        return url.decode("utf-8")
+    return url
+
+
+def _is_within(url, root):
+    return url == root or url.startswith(root.rstrip("/") + "/")
+
+
+class _PooledSession(object):
+
+    __slots__ = ('session', 'root', 'created', 'last_used')
+
+    def __init__(self, session, root, created):
+        self.session = session
+        self.root = root
+        self.created = created
+        self.last_used = created
+
+
+class SessionPool(object):
+    """Pool of idle RemoteAccess sessions, keyed by repository root.
+
+    A session for a URL is taken from the idle sessions for the same
+    repository and reparented to the URL, so that the connection and
+    authentication handshake are only done once. The pool can be shared
+    between threads; a session is only handed out to one user at a time.
+
+    :param max_idle: Maximum number of idle sessions to keep. The least
+        recently used sessions are closed first.
+    :param max_age: Maximum age of a session in seconds, or None to reuse
+        sessions regardless of their age
+    :param check_interval: Sessions that have been idle for longer than
+        this many seconds are checked with get_latest_revnum() before they
+        are handed out; broken sessions are discarded. None disables
+        the check.
+    :param factory: Callable that opens a new session for a URL. Defaults
+        to calling RemoteAccess with the remaining keyword arguments.
+    """
+
+    def __init__(self, max_idle=10, max_age=None, check_interval=30,
+                 factory=None, **kwargs):
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.check_interval = check_interval
+        if factory is None:
+            def factory(url):
+                return RemoteAccess(url, **kwargs)
+        self._factory = factory
+        self._lock = threading.Lock()
+        # Idle sessions, least recently used first
+        self._idle = OrderedDict()
+        # Repository roots for sessions that are handed out
+        self._in_use = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, entry, now):
+        return self.max_age is not None and now - entry.created > self.max_age
+
+    def _take_idle(self, url, now):
+        """Remove an idle session for url from the pool.
+
+        :return: Tuple with the pool entry or None, and a list of
+            expired entries that should be closed
+        """
+        expired = []
+        with self._lock:
+            for key, entry in reversed(list(self._idle.items())):
+                if self._expired(entry, now):
+                    del self._idle[key]
+                    expired.append(entry)
+                elif _is_within(url, entry.root):
+                    del self._idle[key]
+                    return (entry, expired)
+        return (None, expired)
+
+    def _check(self, entry, now):
+        if (self.check_interval is None or
+                now - entry.last_used <= self.check_interval):
+            return True
+        try:
+            entry.session.get_latest_revnum()
+        except Exception:
+            return False
+        return True
+
+    def get(self, url):
+        """Get a session for a URL.
+
+        The session should be given back with put() when it is no longer
+        used.
+
+        :param url: URL to open a session for
+        :return: A RemoteAccess object for url
+        """
+        url = _url_text(url)
+        while True:
+            now = time.time()
+            (entry, expired) = self._take_idle(url, now)
+            for old in expired:
+                self._close(old.session)
+            if entry is None:
+                break
+            if not self._check(entry, now):
+                self._close(entry.session)
+                continue
+            try:
+                if _url_text(entry.session.url) != url:
+                    entry.session.reparent(url)
+            except SubversionException:
+                self._close(entry.session)
+                continue
+            with self._lock:
+                self.hits += 1
+                self._in_use[id(entry.session)] = entry
+            return entry.session
+        session = self._factory(url)
+        entry = _PooledSession(
+            session, _url_text(session.get_repos_root()), time.time())
+        with self._lock:
+            self.misses += 1
+            self._in_use[id(session)] = entry
+        return session
+
+    def put(self, session):
+        """Return a session to the pool.
+
+        :param session: A session obtained from get()
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            entry = self._in_use.pop(id(session))
+            # A session that is still busy, e.g. because an iterator over
+            # its results was abandoned, can not be used by anybody else.
+            if getattr(session, "busy", False) or self._expired(entry, now):
+                evicted.append(entry)
+            else:
+                entry.last_used = now
+                self._idle[id(session)] = entry
+            while len(self._idle) > self.max_idle:
+                evicted.append(self._idle.popitem(last=False)[1])
+        for old in evicted:
+            self._close(old.session)
+
+    def discard(self, session):
+        """Close a session obtained from get() rather than returning it."""
+        with self._lock:
+            del self._in_use[id(session)]
+        self._close(session)
+
+    @contextmanager
+    def session(self, url):
+        """Context manager that provides a session for a URL.
+
+        The session is returned to the pool afterwards, unless the block
+        raised an exception other than SubversionException.
+        """
+        session = self.get(url)
+        try:
+            yield session
+        except SubversionException:
+            self.put(session)
+            raise
+        except BaseException:
+            self.discard(session)
+            raise
+        else:
+            self.put(session)
+
+    def prune(self):
+        """Close all idle sessions that are older than max_age."""
+        now = time.time()
+        with self._lock:
+            expired = [key for (key, entry) in self._idle.items()
+                       if self._expired(entry, now)]
+            expired = [self._idle.pop(key) for key in expired]
+        for entry in expired:
+            self._close(entry.session)
+
+    def clear(self):
+        """Close all idle sessions."""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for entry in idle:
+            self._close(entry.session)
+
+    @property
+    def idle_count(self):
+        """Number of idle sessions in the pool."""
+        return len(self._idle)
+
+    def _close(self, session):
+        close = getattr(session, "close", None)
+        if close is not None:
+            close()
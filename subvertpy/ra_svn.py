@@ -18,20 +18,33 @@
 __author__ = "Jelmer Vernooij <jelmer@jelmer.uk>"
 
 try:
-    from SocketServer import StreamRequestHandler, TCPServer
+    from SocketServer import StreamRequestHandler, TCPServer, ThreadingMixIn
 except ImportError:
-    from socketserver import StreamRequestHandler, TCPServer
+    from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+import atexit
 import base64
+from collections import deque
 import os
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import shutil
 import socket
 import subprocess
+import tempfile
 from errno import EPIPE
+import threading
+import time
 try:
     import urlparse
 except ImportError:
     import urllib.parse as urlparse
 
 from subvertpy import (
+    ERR_RA_CANNOT_CREATE_SESSION,
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    ERR_RA_SVN_MALFORMED_DATA,
     ERR_RA_SVN_UNKNOWN_CMD,
     ERR_UNSUPPORTED_FEATURE,
     NODE_DIR,
@@ -42,15 +55,16 @@ from subvertpy import (
     properties,
     )
 from subvertpy.delta import (
-    pack_svndiff0_window,
-    unpack_svndiff0,
-    SVNDIFF0_HEADER,
+    pack_svndiff_window,
+    SvndiffDecoder,
+    SVNDIFF_HEADERS,
+    SVNDIFF_VERSIONS,
     )
 from subvertpy.marshall import (
     NeedMoreData,
+    Unmarshaller,
     literal,
     marshall,
-    unmarshall,
     )
 from subvertpy.ra import (
     DIRENT_CREATED_REV,
@@ -90,45 +104,184 @@ class SSHSubprocess(object):
 
 class SSHVendor(object):
 
-    def connect_ssh(self, username, password, host, port, command):
-        args = ['ssh', '-x']
+    def ssh_options(self):
+        """Extra options to pass to ssh."""
+        return []
+
+    def ssh_command(self, username, host, port, command):
+        """Build the command line for running a command over ssh."""
+        args = ['ssh', '-x'] + self.ssh_options()
         if port is not None:
             args.extend(['-p', str(port)])
         if username is not None:
             host = "%s@%s" % (username, host)
         args.append(host)
-        proc = subprocess.Popen(args + command,
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE)
+        return args + command
+
+    def connect_ssh(self, username, password, host, port, command):
+        proc = subprocess.Popen(
+            self.ssh_command(username, host, port, command),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
         return SSHSubprocess(proc)
 
 
+class ControlMasterSSHVendor(SSHVendor):
+    """SSH vendor that shares one connection per host between clients.
+
+    The first client for a host starts an OpenSSH ControlMaster; later
+    clients open a new channel on its connection, which avoids the key
+    exchange and authentication. The master exits after it has been
+    unused for persist seconds.
+
+    To use it for all svn+ssh connections, set get_ssh_vendor to this
+    class.
+
+    :param control_dir: Directory for the control sockets. Defaults to a
+        temporary directory shared by all instances in this process.
+    :param persist: Number of seconds an unused master is kept alive
+    """
+
+    _default_control_dir = None
+    _lock = threading.Lock()
+
+    def __init__(self, control_dir=None, persist=60):
+        self._control_dir = control_dir
+        self.persist = persist
+
+    @property
+    def control_dir(self):
+        if self._control_dir is not None:
+            return self._control_dir
+        cls = ControlMasterSSHVendor
+        with cls._lock:
+            if cls._default_control_dir is None:
+                # Socket paths are limited to about 100 bytes, which the
+                # temporary directory on some platforms already comes
+                # close to.
+                if os.path.isdir("/tmp"):
+                    parent = "/tmp"
+                else:
+                    parent = None
+                cls._default_control_dir = tempfile.mkdtemp(
+                    prefix="subvertpy-ssh-", dir=parent)
+                # Masters whose socket is gone exit once they are unused
+                atexit.register(shutil.rmtree, cls._default_control_dir,
+                                True)
+            return cls._default_control_dir
+
+    def ssh_options(self):
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s' % os.path.join(self.control_dir, '%C'),
+                '-o', 'ControlPersist=%d' % self.persist]
+
+    def exit_master(self, username, host, port=None):
+        """Stop the master connection for a host, if there is one."""
+        args = self.ssh_command(username, host, port, [])
+        args[1:1] = ['-O', 'exit']
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(args, stdout=devnull, stderr=devnull)
+
+
 # Can be overridden by users
 get_ssh_vendor = SSHVendor
 
 
+# Number of bytes to ask for when more data is needed from the peer
+RECV_BLOCK_SIZE = 64 * 1024
+# Number of bytes of outgoing messages to buffer before sending them
+SEND_BUFFER_SIZE = 64 * 1024
+# Maximum size of the strings file contents are sent in
+FILE_CHUNK_SIZE = 64 * 1024
+# Number of rev-proplist commands kept in flight by rev_proplist_range
+REVPROP_WINDOW_SIZE = 100
+
+
 class SVNConnection(object):
 
     def __init__(self, recv_fn, send_fn):
-        self.inbuffer = ""
+        self._unmarshaller = Unmarshaller()
+        self._outbuffer = []
+        self._outbuffer_size = 0
         self.recv_fn = recv_fn
         self.send_fn = send_fn
+        self._svndiff_version = 0
+
+    def _negotiate_svndiff_version(self, capabilities):
+        """Pick the svndiff version to use for text deltas sent to the peer.
+
+        :param capabilities: Capabilities advertised by the peer
+        """
+        if "accepts-svndiff2" in capabilities and 2 in SVNDIFF_VERSIONS:
+            self._svndiff_version = 2
+        elif "svndiff1" in capabilities:
+            self._svndiff_version = 1
+        else:
+            self._svndiff_version = 0
+
+    def _recv_more(self):
+        # The peer may be waiting for buffered messages before it replies
+        self.flush()
+        newdata = self.recv_fn(RECV_BLOCK_SIZE)
+        if not newdata:
+            raise SubversionException(
+                "Connection closed", ERR_RA_SVN_CONNECTION_CLOSED)
+        # self.mutter("IN: %r" % newdata)
+        self._unmarshaller.feed(newdata)
 
     def recv_msg(self):
+        """Receive the next message from the peer.
+
+        Data is read in blocks of RECV_BLOCK_SIZE bytes; anything received
+        beyond the end of the message is kept for later calls.
+        """
         while True:
             try:
-                (self.inbuffer, ret) = unmarshall(self.inbuffer)
-                return ret
+                return self._unmarshaller.read_item()
             except NeedMoreData:
-                newdata = self.recv_fn(1)
-                if newdata != "":
-                    # self.mutter("IN: %r" % newdata)
-                    self.inbuffer += newdata
+                self._recv_more()
+
+    def recv_msgs(self):
+        """Iterate over messages from the peer as they are completed."""
+        while True:
+            for msg in self._unmarshaller.read_items():
+                yield msg
+            self._recv_more()
 
     def send_msg(self, data):
+        """Queue a message for the peer.
+
+        Messages are buffered until a response is expected from the peer
+        or SEND_BUFFER_SIZE bytes are queued, and then sent with a single
+        write.
+        """
         marshalled_data = marshall(data)
         # self.mutter("OUT: %r" % marshalled_data)
-        self.send_fn(marshalled_data)
+        self._outbuffer.append(marshalled_data)
+        self._outbuffer_size += len(marshalled_data)
+        if self._outbuffer_size >= SEND_BUFFER_SIZE:
+            self.flush()
+
+    def _take_output(self):
+        """Remove all queued messages from the send buffer.
+
+        :return: The marshalled messages, as a single bytestring
+        """
+        data = b"".join(self._outbuffer)
+        self._outbuffer = []
+        self._outbuffer_size = 0
+        return data
+
+    def flush(self):
+        """Send all queued messages to the peer."""
+        if not self._outbuffer:
+            return
+        data = memoryview(self._take_output())
+        while data:
+            sent = self.send_fn(data)
+            if sent is None:
+                # File-like objects write everything
+                break
+            data = data[sent:]
 
     def send_success(self, *contents):
         self.send_msg([literal("success"), list(contents)])
@@ -137,13 +290,26 @@ class SVNConnection(object):
 SVN_PORT = 3690
 
 
-def feed_editor(conn, editor):
-    tokens = {}
-    diff = {}
-    txdelta_handler = {}
-    # Process commands
-    while True:
-        command, args = conn.recv_msg()
+class EditorFeeder(object):
+    """Passes editor commands received from the peer on to an editor."""
+
+    def __init__(self, editor):
+        self.editor = editor
+        self._tokens = {}
+        self._diff = {}
+        self.replay_finished = False
+
+    def process(self, command, args):
+        """Process a single editor command.
+
+        :param command: Name of the command
+        :param args: Arguments of the command
+        :return: True if the edit has been closed, aborted or (for replay)
+            finished
+        """
+        editor = self.editor
+        tokens = self._tokens
+        diff = self._diff
         if command == "target-rev":
             editor.set_target_revision(args[0])
         elif command == "open-root":
@@ -159,7 +325,7 @@ def feed_editor(conn, editor):
                 token = tokens[args[1]].add_directory(args[0])
             else:
                 token = tokens[args[1]].add_directory(
-                    args[0], args[3][0], args[4][0])
+                    args[0], args[3][0], args[3][1])
             tokens[args[2]] = token
         elif command == "open-dir":
             tokens[args[2]] = tokens[args[1]].open_directory(args[0], args[3])
@@ -177,24 +343,20 @@ def feed_editor(conn, editor):
                 token = tokens[args[1]].add_file(args[0])
             else:
                 token = tokens[args[1]].add_file(
-                    args[0], args[3][0], args[4][0])
+                    args[0], args[3][0], args[3][1])
             tokens[args[2]] = token
         elif command == "open-file":
             tokens[args[2]] = tokens[args[1]].open_file(args[0], args[3])
         elif command == "apply-textdelta":
             if len(args[1]) == 0:
-                txdelta_handler[args[0]] = tokens[args[0]].apply_textdelta(
-                    None)
+                txdelta_handler = tokens[args[0]].apply_textdelta(None)
             else:
-                txdelta_handler[args[0]] = tokens[args[0]].apply_textdelta(
-                    args[1][0])
-            diff[args[0]] = ""
+                txdelta_handler = tokens[args[0]].apply_textdelta(args[1][0])
+            diff[args[0]] = SvndiffDecoder(txdelta_handler)
         elif command == "textdelta-chunk":
-            diff[args[0]] += args[1]
+            diff[args[0]].feed(args[1])
         elif command == "textdelta-end":
-            for w in unpack_svndiff0(diff[args[0]]):
-                txdelta_handler[args[0]](w)
-            txdelta_handler[args[0]](None)
+            diff.pop(args[0]).close()
         elif command == "change-file-prop":
             if len(args[2]) == 0:
                 tokens[args[0]].change_prop(args[1], None)
@@ -207,13 +369,33 @@ def feed_editor(conn, editor):
                 tokens[args[0]].close(args[1][0])
         elif command == "close-edit":
             editor.close()
-            break
+            return True
         elif command == "abort-edit":
             editor.abort()
-            break
+            return True
+        elif command == "finish-replay":
+            # Replays end without close-edit; the caller closes the editor
+            self.replay_finished = True
+            return True
+
+        return False
+
 
-    conn.send_success()
-    conn._unpack()
+def feed_editor(conn, editor):
+    """Drive an editor with the commands received on a connection.
+
+    Reads commands until the edit is closed or aborted, and then
+    acknowledges it. The finish-replay command that ends a replayed
+    revision is not acknowledged.
+
+    :return: True if the edit ended with finish-replay
+    """
+    feeder = EditorFeeder(editor)
+    while not feeder.process(*conn.recv_msg()):
+        pass
+    if not feeder.replay_finished:
+        conn.send_success()
+    return feeder.replay_finished
 
 
 class Reporter(object):
@@ -255,10 +437,12 @@ class Reporter(object):
         self.conn.send_msg([literal("finish-report"), []])
         self.conn.recv_msg()
         feed_editor(self.conn, self.editor)
+        self.conn._unpack()
         self.conn.busy = False
 
     def abort(self):
         self.conn.send_msg([literal("abort-report"), []])
+        self.conn.flush()
         self.conn.busy = False
 
 
@@ -386,15 +570,17 @@ class FileEditor(object):
             base_check = [base_checksum]
         self.conn.send_msg([literal("apply-textdelta"),
                            [self.id, base_check]])
+        version = self.conn._svndiff_version
         self.conn.send_msg([literal("textdelta-chunk"),
-                           [self.id, SVNDIFF0_HEADER]])
+                           [self.id, SVNDIFF_HEADERS[version]]])
 
         def send_textdelta(delta):
             if delta is None:
                 self.conn.send_msg([literal("textdelta-end"), [self.id]])
             else:
-                self.conn.send_msg([literal("textdelta-chunk"),
-                                   [self.id, pack_svndiff0_window(delta)]])
+                self.conn.send_msg(
+                    [literal("textdelta-chunk"),
+                     [self.id, bytes(pack_svndiff_window(delta, version))]])
         return send_textdelta
 
     def change_prop(self, name, value):
@@ -422,21 +608,240 @@ def mark_busy(unbound):
     return convert
 
 
-def unmarshall_dirent(d):
+def marshall_stat(dirent):
+    """Convert a dictionary as returned by stat() to its wire format."""
+    args = [literal(dirent["kind"]), dirent["size"], dirent["has-props"],
+            dirent["created-rev"]]
+    if "created-date" in dirent:
+        args.append([dirent["created-date"]])
+    else:
+        args.append([])
+    if "last-author" in dirent:
+        args.append([dirent["last-author"]])
+    else:
+        args.append([])
+    return args
+
+
+def unmarshall_stat(d):
     ret = {
-        "name": d[0],
-        "kind": d[1],
-        "size": d[2],
-        "has-props": bool(d[3]),
-        "created-rev": d[4],
+        "kind": d[0],
+        "size": d[1],
+        "has-props": bool(d[2]),
+        "created-rev": d[3],
         }
+    if d[4] != []:
+        ret["created-date"] = d[4][0]
     if d[5] != []:
-        ret["created-date"] = d[5]
-    if d[6] != []:
-        ret["last-author"] = d[6]
+        ret["last-author"] = d[5][0]
     return ret
 
 
+def unmarshall_dirent(d):
+    ret = unmarshall_stat(d[1:])
+    ret["name"] = d[0]
+    return ret
+
+
+def unpack_response(msg):
+    """Unpack a command response.
+
+    :param msg: Response message
+    :return: The parameters of a successful response
+    :raise SubversionException: if the response is a failure
+    """
+    if msg[0] == "failure":
+        if isinstance(msg[1], str):
+            raise SubversionException(*msg[1])
+        num = msg[1][0][0]
+        msg = msg[1][0][1]
+        if num == ERR_RA_SVN_UNKNOWN_CMD:
+            raise NotImplementedError(msg)
+        raise SubversionException(msg, num)
+    assert msg[0] == "success", "Got: %r" % msg
+    assert len(msg) == 2
+    return msg[1]
+
+
+def log_args(paths, start, end, limit=0, discover_changed_paths=True,
+             strict_node_history=True, include_merged_revisions=True,
+             revprops=None):
+    """Build the arguments for a log command."""
+    args = [paths]
+    if start is None or start == -1:
+        args.append([])
+    else:
+        args.append([start])
+    if end is None or end == -1:
+        args.append([])
+    else:
+        args.append([end])
+    args.append(discover_changed_paths)
+    args.append(strict_node_history)
+    args.append(limit)
+    args.append(include_merged_revisions)
+    if revprops is None:
+        args.append(literal("all-revprops"))
+        args.append([])
+    else:
+        args.append(literal("revprops"))
+        args.append(revprops)
+    return args
+
+
+def unmarshall_log_entry(msg):
+    """Unpack a log entry.
+
+    :return: Tuple with changed paths, revision number, revision
+        properties and whether the revision has children
+    """
+    paths = {}
+    for p, action, cfd in msg[0]:
+        if len(cfd) == 0:
+            paths[p] = (str(action), None, -1)
+        else:
+            paths[p] = (str(action), cfd[0], cfd[1])
+
+    if len(msg) > 5:
+        has_children = msg[5]
+    else:
+        has_children = None
+    if len(msg) > 6 and msg[6]:
+        revno = None
+    else:
+        revno = msg[1]  # noqa: F841
+        # TODO(jelmer): Do something with revno
+    revprops = {}
+    if len(msg[2]) != 0:
+        revprops[properties.PROP_REVISION_AUTHOR] = msg[2][0]
+    if len(msg[3]) != 0:
+        revprops[properties.PROP_REVISION_DATE] = msg[3][0]
+    if len(msg[4]) != 0:
+        revprops[properties.PROP_REVISION_LOG] = msg[4][0]
+    if len(msg) > 8:
+        revprops.update(dict(msg[8]))
+    return paths, msg[1], revprops, has_children
+
+
+def _revprop_name(name):
+    if isinstance(name, bytes):
+        return name.decode("utf-8")
+    return name
+
+
+def _filter_revprops(props, names):
+    """Filter revision properties, with the names as text."""
+    props = dict((_revprop_name(k), v) for (k, v) in props.items())
+    if names is None:
+        return props
+    return dict((k, v) for (k, v) in props.items() if k in names)
+
+
+class Future(object):
+    """The result of a command sent on a Pipeline."""
+
+    __slots__ = ('_pipeline', '_done', '_result', '_exception')
+
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """Check whether the response to the command has been read."""
+        return self._done
+
+    def result(self):
+        """Return the result of the command.
+
+        Reads responses from the server until the one for this command
+        has arrived.
+
+        :raise SubversionException: if the command failed
+        """
+        while not self._done:
+            self._pipeline._recv_next()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class Pipeline(object):
+    """Sends commands to a svn:// server without waiting for responses.
+
+    Responses are matched to commands in the order the commands were sent.
+    If the server does not advertise the edit-pipeline capability, every
+    command waits for the response to the previous one.
+
+    Can be used as a context manager, which waits for all outstanding
+    commands on exit.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._pending = deque()
+        self._pipelined = client.has_capability("edit-pipeline")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wait()
+        return False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _recv_next(self):
+        (future, convert) = self._pending.popleft()
+        try:
+            future._result = self._client._recv_response(convert)
+        except (SubversionException, NotImplementedError) as e:
+            future._exception = e
+        future._done = True
+        if not self._pending:
+            self._client.busy = False
+
+    def _call(self, request):
+        if not self._pipelined:
+            self.wait()
+        (msg, convert) = request
+        self._client.busy = True
+        self._client.send_msg(msg)
+        future = Future(self)
+        self._pending.append((future, convert))
+        return future
+
+    def wait(self):
+        """Wait for the responses to all outstanding commands."""
+        while self._pending:
+            self._recv_next()
+
+    def get_latest_revnum(self):
+        return self._call(self._client._get_latest_revnum_request())
+
+    def get_dated_rev(self, date):
+        return self._call(self._client._get_dated_rev_request(date))
+
+    def check_path(self, path, revision=None):
+        return self._call(self._client._check_path_request(path, revision))
+
+    def stat(self, path, revision=-1):
+        return self._call(self._client._stat_request(path, revision))
+
+    def get_dir(self, path, revision=-1, dirent_fields=0, want_props=True,
+                want_contents=True):
+        return self._call(self._client._get_dir_request(
+            path, revision, dirent_fields, want_props, want_contents))
+
+    def rev_proplist(self, revision):
+        return self._call(self._client._rev_proplist_request(revision))
+
+    def rev_prop(self, revision, name):
+        return self._call(self._client._rev_prop_request(revision, name))
+
+
 class SVNClient(SVNConnection):
 
     def __init__(self, url, progress_cb=None, auth=None, config=None,
@@ -455,6 +860,14 @@ class SVNClient(SVNConnection):
         else:
             (recv_func, send_func) = self._connect_ssh(host)
         super(SVNClient, self).__init__(recv_func, send_func)
+        try:
+            self._handshake()
+        except BaseException:
+            self.close()
+            raise
+        self.busy = False
+
+    def _handshake(self):
         (min_version, max_version, _, self._server_capabilities) = (
             self._recv_greeting())
         self.send_msg(
@@ -467,27 +880,31 @@ class SVNClient(SVNConnection):
             # FIXME: Support other mechanisms as well
             self.send_msg([literal("ANONYMOUS"),
                           [base64.b64encode(
-                              "anonymous@%s" % socket.gethostname())]])
+                              ("anonymous@%s" % socket.gethostname()).encode(
+                                  "utf-8"))]])
             self.recv_msg()
         msg = self._unpack()
         if len(msg) > 2:
             self._server_capabilities += msg[2]
         (self._uuid, self._root_url) = msg[0:2]
-        self.busy = False
+        self._negotiate_svndiff_version(self._server_capabilities)
 
     def _unpack(self):
-        msg = self.recv_msg()
-        if msg[0] == "failure":
-            if isinstance(msg[1], str):
-                raise SubversionException(*msg[1])
-            num = msg[1][0][0]
-            msg = msg[1][0][1]
-            if num == ERR_RA_SVN_UNKNOWN_CMD:
-                raise NotImplementedError(msg)
-            raise SubversionException(msg, num)
-        assert msg[0] == "success", "Got: %r" % msg
-        assert len(msg) == 2
-        return msg[1]
+        return unpack_response(self.recv_msg())
+
+    def close(self):
+        if getattr(self, "_socket", None) is not None:
+            # Make sure the server sees the connection closed, even if a
+            # forked child process still has the socket open.
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self._socket.close()
+            self._socket = None
+        if getattr(self, "_tunnel", None) is not None:
+            self._tunnel.close()
+            self._tunnel = None
 
     def _recv_greeting(self):
         greeting = self._unpack()
@@ -496,6 +913,33 @@ class SVNClient(SVNConnection):
 
     _recv_ack = _unpack
 
+    def _recv_response(self, convert):
+        self._recv_ack()
+        return convert(self._unpack())
+
+    def _call(self, request):
+        """Send a command and wait for its response.
+
+        :param request: Tuple with the command to send and a function that
+            converts the response
+        :return: The converted response
+        """
+        (msg, convert) = request
+        self.send_msg(msg)
+        return self._recv_response(convert)
+
+    def pipeline(self):
+        """Create a pipeline for sending commands without waiting.
+
+        Commands issued on the pipeline are sent back-to-back, and their
+        responses are read in order as the results are needed. The client
+        should not be used directly while the pipeline has outstanding
+        commands.
+
+        :return: A Pipeline
+        """
+        return Pipeline(self)
+
     def _connect(self, host):
         (host, port) = urlparse.splitnport(host, SVN_PORT)
         sockaddrs = socket.getaddrinfo(
@@ -589,18 +1033,21 @@ class SVNClient(SVNConnection):
     def has_capability(self, capability):
         return capability in self._server_capabilities
 
-    @mark_busy
-    def check_path(self, path, revision=None):
+    def _check_path_request(self, path, revision=None):
         args = [path]
         if revision is None or revision == -1:
             args.append([])
         else:
             args.append([revision])
-        self.send_msg([literal("check-path"), args])
-        self._recv_ack()
-        ret = self._unpack()[0]
-        return {"dir": NODE_DIR, "file": NODE_FILE, "unknown": NODE_UNKNOWN,
-                "none": NODE_NONE}[ret]
+
+        def convert(ret):
+            return {"dir": NODE_DIR, "file": NODE_FILE,
+                    "unknown": NODE_UNKNOWN, "none": NODE_NONE}[ret[0]]
+        return ([literal("check-path"), args], convert)
+
+    @mark_busy
+    def check_path(self, path, revision=None):
+        return self._call(self._check_path_request(path, revision))
 
     def get_lock(self, path):
         self.send_msg([literal("get-lock"), [path]])
@@ -611,9 +1058,8 @@ class SVNClient(SVNConnection):
         else:
             return ret[0]
 
-    @mark_busy
-    def get_dir(self, path, revision=-1, dirent_fields=0, want_props=True,
-                want_contents=True):
+    def _get_dir_request(self, path, revision=-1, dirent_fields=0,
+                         want_props=True, want_contents=True):
         args = [path]
         if revision is None or revision == -1:
             args.append([])
@@ -637,36 +1083,68 @@ class SVNClient(SVNConnection):
             fields.append(literal("last-author"))
         args.append(fields)
 
-        self.send_msg([literal("get-dir"), args])
-        self._recv_ack()
-        ret = self._unpack()
-        fetch_rev = ret[0]
-        props = dict(ret[1])
-        dirents = {}
-        for d in ret[2]:
-            entry = unmarshall_dirent(d)
-            dirents[entry["name"]] = entry
-
-        return (dirents, fetch_rev, props)
+        def convert(ret):
+            fetch_rev = ret[0]
+            props = dict(ret[1])
+            dirents = {}
+            for d in ret[2]:
+                entry = unmarshall_dirent(d)
+                dirents[entry["name"]] = entry
+            return (dirents, fetch_rev, props)
+        return ([literal("get-dir"), args], convert)
 
     @mark_busy
-    def stat(self, path, revision=-1):
+    def get_dir(self, path, revision=-1, dirent_fields=0, want_props=True,
+                want_contents=True):
+        return self._call(self._get_dir_request(
+            path, revision, dirent_fields, want_props, want_contents))
+
+    def _stat_request(self, path, revision=-1):
         args = [path]
         if revision is None or revision == -1:
-            args.append([revision])
-        else:
             args.append([])
+        else:
+            args.append([revision])
 
-        self.send_msg([literal("stat"), args])
-        self._recv_ack()
-        ret = self._unpack()
-        if len(ret) == 0:
-            return None
-        return unmarshall_dirent(ret[0])
+        def convert(ret):
+            # The dirent is an optional tuple
+            if len(ret[0]) == 0:
+                return None
+            return unmarshall_stat(ret[0][0])
+        return ([literal("stat"), args], convert)
+
+    @mark_busy
+    def stat(self, path, revision=-1):
+        return self._call(self._stat_request(path, revision))
 
     @mark_busy
     def get_file(self, path, stream, revision=-1):
-        raise NotImplementedError(self.get_file)
+        """Retrieve the contents and properties of a file.
+
+        The contents are written to stream in chunks as they are received.
+
+        :param path: Path of the file
+        :param stream: Object with a write() method
+        :param revision: Revision to retrieve, or -1 for the latest
+        :return: Tuple with the revision and the properties of the file
+        """
+        args = [path]
+        if revision is None or revision == -1:
+            args.append([])
+        else:
+            args.append([revision])
+        args += [True, True]
+        self.send_msg([literal("get-file"), args])
+        self._recv_ack()
+        ret = self._unpack()
+        fetch_rev = ret[1]
+        props = dict(ret[2])
+        for chunk in self.recv_msgs():
+            if not chunk:
+                break
+            stream.write(chunk)
+        self._unpack()
+        return (fetch_rev, props)
 
     def change_rev_prop(self, rev, name, value):
         args = [rev, name]
@@ -690,19 +1168,23 @@ class SVNClient(SVNConnection):
         self._recv_ack()
         raise NotImplementedError(self.get_commit_editor)
 
+    def _rev_proplist_request(self, revision):
+        return ([literal("rev-proplist"), [revision]],
+                lambda ret: dict(ret[0]))
+
     def rev_proplist(self, revision):
-        self.send_msg([literal("rev-proplist"), [revision]])
-        self._recv_ack()
-        return dict(self._unpack()[0])
+        return self._call(self._rev_proplist_request(revision))
+
+    def _rev_prop_request(self, revision, name):
+        def convert(ret):
+            if len(ret) == 0:
+                return None
+            else:
+                return ret[0]
+        return ([literal("rev-prop"), [revision, name]], convert)
 
     def rev_prop(self, revision, name):
-        self.send_msg([literal("rev-prop"), [revision, name]])
-        self._recv_ack()
-        ret = self._unpack()
-        if len(ret) == 0:
-            return None
-        else:
-            return ret[0]
+        return self._call(self._rev_prop_request(revision, name))
 
     @mark_busy
     def replay(self, revision, low_water_mark, update_editor,
@@ -719,9 +1201,14 @@ class SVNClient(SVNConnection):
         self.send_msg([literal("replay-range"), [start_revision, end_revision,
                       low_water_mark, send_deltas]])
         self._recv_ack()
+        # The server streams all revisions without waiting for us
         for i in range(start_revision, end_revision+1):
             msg = self.recv_msg()
-            assert msg[0] == "revprops"
+            if msg[0] != "revprops":
+                unpack_response(msg)
+                raise SubversionException(
+                    "Expected revprops for revision %d" % i,
+                    ERR_RA_SVN_MALFORMED_DATA)
             edit = cbs[0](i, dict(msg[1]))
             feed_editor(self, edit)
             cbs[1](i, dict(msg[1]), edit)
@@ -794,17 +1281,19 @@ class SVNClient(SVNConnection):
     def get_repos_root(self):
         return self._root_url
 
+    def _get_latest_revnum_request(self):
+        return ([literal("get-latest-rev"), []], lambda ret: ret[0])
+
     @mark_busy
     def get_latest_revnum(self):
-        self.send_msg([literal("get-latest-rev"), []])
-        self._recv_ack()
-        return self._unpack()[0]
+        return self._call(self._get_latest_revnum_request())
+
+    def _get_dated_rev_request(self, date):
+        return ([literal("get-dated-rev"), [date]], lambda ret: ret[0])
 
     @mark_busy
     def get_dated_rev(self, date):
-        self.send_msg([literal("get-dated-rev"), [date]])
-        self._recv_ack()
-        return self._unpack()[0]
+        return self._call(self._get_dated_rev_request(date))
 
     @mark_busy
     def reparent(self, url):
@@ -820,61 +1309,73 @@ class SVNClient(SVNConnection):
     def log(self, paths, start, end, limit=0, discover_changed_paths=True,
             strict_node_history=True, include_merged_revisions=True,
             revprops=None):
-        args = [paths]
-        if start is None or start == -1:
-            args.append([])
-        else:
-            args.append([start])
-        if end is None or end == -1:
-            args.append([])
-        else:
-            args.append([end])
-        args.append(discover_changed_paths)
-        args.append(strict_node_history)
-        args.append(limit)
-        args.append(include_merged_revisions)
-        if revprops is None:
-            args.append(literal("all-revprops"))
-            args.append([])
-        else:
-            args.append(literal("revprops"))
-            args.append(revprops)
-
-        self.send_msg([literal("log"), args])
+        self.send_msg([literal("log"), log_args(
+            paths, start, end, limit, discover_changed_paths,
+            strict_node_history, include_merged_revisions, revprops)])
         self._recv_ack()
         while True:
             msg = self.recv_msg()
             if msg == "done":
                 break
-            paths = {}
-            for p, action, cfd in msg[0]:
-                if len(cfd) == 0:
-                    paths[p] = (str(action), None, -1)
-                else:
-                    paths[p] = (str(action), cfd[0], cfd[1])
-
-            if len(msg) > 5:
-                has_children = msg[5]
-            else:
-                has_children = None
-            if len(msg) > 6 and msg[6]:
-                revno = None
-            else:
-                revno = msg[1]  # noqa: F841
-                # TODO(jelmer): Do something with revno
-            revprops = {}
-            if len(msg[2]) != 0:
-                revprops[properties.PROP_REVISION_AUTHOR] = msg[2][0]
-            if len(msg[3]) != 0:
-                revprops[properties.PROP_REVISION_DATE] = msg[3][0]
-            if len(msg[4]) != 0:
-                revprops[properties.PROP_REVISION_LOG] = msg[4][0]
-            if len(msg) > 8:
-                revprops.update(dict(msg[8]))
-            yield paths, msg[1], revprops, has_children
+            yield unmarshall_log_entry(msg)
 
         self._unpack()
 
+    def rev_proplist_range(self, start, end, names=None):
+        """Retrieve the revision properties of a range of revisions.
+
+        Uses a single log request if the server can send revision
+        properties with log entries, and pipelined rev-proplist commands
+        otherwise.
+
+        :param start: First revision
+        :param end: Last revision
+        :param names: Names of the properties to retrieve, or None for all
+        :return: Iterator over (revnum, properties) tuples
+        """
+        if names is not None:
+            names = [_revprop_name(name) for name in names]
+        if self.has_capability("log-revprops"):
+            # A log of the repository root includes every revision; a log
+            # of the session URL only the revisions that changed it.
+            url = self.url
+            root_url = self.get_repos_root()
+            if isinstance(root_url, bytes):
+                root_url = root_url.decode("utf-8")
+            if url != root_url:
+                self.reparent(root_url)
+            entries = self.log(
+                [b""], start, end, discover_changed_paths=False,
+                include_merged_revisions=False, revprops=names)
+            try:
+                for (paths, revnum, revprops, has_children) in entries:
+                    yield (revnum, _filter_revprops(revprops, names))
+            except GeneratorExit:
+                # The rest of the log response has to be read before the
+                # connection can be used for anything else
+                for entry in entries:
+                    pass
+                raise
+            finally:
+                if url != root_url:
+                    self.reparent(url)
+            return
+        if start <= end:
+            revnums = range(start, end + 1)
+        else:
+            revnums = range(start, end - 1, -1)
+        pending = deque()
+        with self.pipeline() as pipeline:
+            for revnum in revnums:
+                pending.append((revnum, pipeline.rev_proplist(revnum)))
+                if len(pending) < REVPROP_WINDOW_SIZE:
+                    continue
+                (revnum, future) = pending.popleft()
+                yield (revnum, _filter_revprops(future.result(), names))
+            while pending:
+                (revnum, future) = pending.popleft()
+                yield (revnum, _filter_revprops(future.result(), names))
+
     def get_log(self, callback, *args, **kwargs):
         for (paths, rev, props, has_children) in self.log(*args, **kwargs):
             if has_children is None:
@@ -885,7 +1386,9 @@ class SVNClient(SVNConnection):
 
 MIN_VERSION = 2
 MAX_VERSION = 2
-CAPABILITIES = ["edit-pipeline", "bazaar", "log-revprops"]
+CAPABILITIES = ["edit-pipeline", "bazaar", "log-revprops", "svndiff1"]
+if 2 in SVNDIFF_VERSIONS:
+    CAPABILITIES.append("accepts-svndiff2")
 MECHANISMS = ["ANONYMOUS"]
 
 
@@ -897,6 +1400,7 @@ class SVNServer(SVNConnection):
         self._logf = logf
         super(SVNServer, self).__init__(recv_fn, send_fn)
 
+    def send_greeting(self):
         self.send_success(
             MIN_VERSION, MAX_VERSION, [literal(x) for x in MECHANISMS],
             [literal(x) for x in CAPABILITIES])
@@ -935,6 +1439,18 @@ class SVNServer(SVNConnection):
     def log(self, target_path, start_rev, end_rev, changed_paths,
             strict_node, limit=None, include_merged_revisions=False,
             all_revprops=None, revprops=None):
+        if all_revprops == "revprops":
+            wanted = set(
+                n.decode("utf-8") if isinstance(n, bytes) else n
+                for n in revprops)
+        else:
+            wanted = None
+
+        def optional(name, value):
+            if value is None or (wanted is not None and name not in wanted):
+                return []
+            return [value]
+
         def send_revision(revno, author, date, message, changed_paths=None):
             changes = []
             if changed_paths is not None:
@@ -943,7 +1459,10 @@ class SVNServer(SVNConnection):
                         changes.append((p, literal(action), (cf, cr)))
                     else:
                         changes.append((p, literal(action), ()))
-            self.send_msg([changes, revno, [author], [date], [message]])
+            self.send_msg([changes, revno,
+                           optional(properties.PROP_REVISION_AUTHOR, author),
+                           optional(properties.PROP_REVISION_DATE, date),
+                           optional(properties.PROP_REVISION_LOG, message)])
         self.send_ack()
         if len(start_rev) == 0:
             start_revnum = None
@@ -959,7 +1478,10 @@ class SVNServer(SVNConnection):
         self.send_success()
 
     def open_backend(self, url):
-        (rooturl, location) = urlparse.splithost(url)
+        if not isinstance(url, str):
+            url = url.decode("utf-8")
+        (scheme, opaque) = urlparse.splittype(url)
+        (rooturl, location) = urlparse.splithost(opaque)
         self.repo_backend, self.relpath = self.backend.open_repository(
              location)
 
@@ -978,17 +1500,51 @@ class SVNServer(SVNConnection):
         if dirent is None:
             self.send_success([])
         else:
-            args = [dirent["name"], dirent["kind"], dirent["size"],
-                    dirent["has-props"], dirent["created-rev"]]
-            if "created-date" in dirent:
-                args.append([dirent["created-date"]])
-            else:
-                args.append([])
-            if "last-author" in dirent:
-                args.append([dirent["last-author"]])
-            else:
-                args.append([])
-            self.send_success([args])
+            self.send_success([marshall_stat(dirent)])
+
+    def get_file(self, path, rev, want_props, want_contents,
+                 want_iprops=False):
+        if len(rev) == 0:
+            revnum = None
+        else:
+            revnum = rev[0]
+        self.send_ack()
+        (revnum, props, stream) = self.repo_backend.get_file(
+            path, revnum, want_props, want_contents)
+        self.send_success([], revnum, list((props or {}).items()))
+        if not want_contents:
+            return
+        # The contents are sent as a series of strings, terminated by an
+        # empty string, and followed by another response.
+        try:
+            while True:
+                chunk = stream.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.send_msg(chunk)
+        except SubversionException:
+            self.send_msg(b"")
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        self.send_msg(b"")
+        self.send_success()
+
+    def get_dir(self, path, rev, want_props, want_contents, fields=None,
+                want_iprops=False):
+        if len(rev) == 0:
+            revnum = None
+        else:
+            revnum = rev[0]
+        self.send_ack()
+        (revnum, props, dirents) = self.repo_backend.get_dir(
+            path, revnum, want_props, want_contents)
+        self.send_success(
+            revnum, list((props or {}).items()),
+            [[dirent["name"]] + marshall_stat(dirent)
+             for dirent in (dirents or [])])
 
     def commit(self, logmsg, locks, keep_locks=False, rev_props=None):
         self.send_failure([ERR_UNSUPPORTED_FEATURE,
@@ -1041,6 +1597,34 @@ class SVNServer(SVNConnection):
             # Needs to be sent back to the client to display
             self.send_failure(client_result[1][0])
 
+    def _replay_revision(self, revnum, low_water_mark, send_deltas):
+        editor = Editor(self)
+        try:
+            self.repo_backend.replay(
+                editor, revnum, low_water_mark, send_deltas)
+        except SubversionException:
+            editor.abort()
+            # The client acknowledges the abort before reading the failure
+            self.recv_msg()
+            raise
+        self.send_msg([literal("finish-replay"), []])
+
+    def replay(self, revision, low_water_mark, send_deltas=True):
+        self.send_ack()
+        self._replay_revision(revision, low_water_mark, send_deltas)
+        self.send_success()
+
+    def replay_range(self, start_revision, end_revision, low_water_mark,
+                     send_deltas=True):
+        self.send_ack()
+        # Nothing is read from the client until the end, so revisions are
+        # streamed as fast as the connection allows.
+        for revnum in range(start_revision, end_revision + 1):
+            revprops = self.repo_backend.rev_proplist(revnum)
+            self.send_msg([literal("revprops"), list(revprops.items())])
+            self._replay_revision(revnum, low_water_mark, send_deltas)
+        self.send_success()
+
     commands = {
             "get-latest-rev": get_latest_rev,
             "log": log,
@@ -1052,23 +1636,29 @@ class SVNServer(SVNConnection):
             "rev-proplist": rev_proplist,
             "rev-prop": rev_prop,
             "get-locations": get_locations,
+            "get-file": get_file,
+            "get-dir": get_dir,
+            "replay": replay,
+            "replay-range": replay_range,
             # FIXME: get-dated-rev
-            # FIXME: get-file
-            # FIXME: get-dir
             # FIXME: check-path
             # FIXME: switch
             # FIXME: status
             # FIXME: diff
             # FIXME: get-file-revs
-            # FIXME: replay
     }
 
     def send_auth_request(self):
         pass
 
-    def serve(self):
+    def handshake(self):
+        """Greet the client, authenticate it and open the repository."""
         self.send_greeting()
-        msg = self.recv_msg()
+        self.process_client_greeting(self.recv_msg())
+        self.process_auth(self.recv_msg())
+
+    def process_client_greeting(self, msg):
+        """Handle the client's response to the greeting."""
         version = msg[0]
         capabilities = msg[1]
         url = msg[2]
@@ -1079,27 +1669,47 @@ class SVNServer(SVNConnection):
         self.capabilities = capabilities
         self.version = version
         self.url = url
+        self._negotiate_svndiff_version(capabilities)
         self.mutter("client supports:")
         self.mutter("  version %r" % version)
         self.mutter("  capabilities %r " % capabilities)
         self.send_mechs()
 
-        (mech, args) = self.recv_msg()
+    def process_auth(self, msg):
+        """Handle the client's authentication request and open the
+        repository it asked for."""
+        (mech, args) = msg
         # TODO: Proper authentication
         self.send_success()
 
-        self.open_backend(url)
-        self.send_success(self.repo_backend.get_uuid(), url)
+        self.open_backend(self.url)
+        self.send_success(self.repo_backend.get_uuid(), self.url)
+
+    def handle_command(self, cmd, args):
+        """Run a single command received from the client.
+
+        Errors raised by the backend are sent to the client. After an
+        unknown command the connection is stopped.
+        """
+        if cmd not in self.commands:
+            self.mutter("client used unknown command %r" % cmd)
+            self.send_unknown(cmd)
+            self._stop = True
+            return
+        try:
+            self.commands[cmd](self, *args)
+        except SubversionException as e:
+            if e.args[1] == ERR_RA_SVN_CONNECTION_CLOSED:
+                raise
+            self.mutter("error running %s: %r" % (cmd, e))
+            self.send_failure([e.args[1], e.args[0], __file__, 0])
 
-        # Expect:
+    def serve(self):
+        self.handshake()
         while not self._stop:
             (cmd, args) = self.recv_msg()
-            if cmd not in self.commands:
-                self.mutter("client used unknown command %r" % cmd)
-                self.send_unknown(cmd)
-                return
-            else:
-                self.commands[cmd](self, *args)
+            self.handle_command(cmd, args)
+        self.flush()
 
     def close(self):
         self._stop = True
@@ -1109,6 +1719,44 @@ class SVNServer(SVNConnection):
             self._logf.write("%s\n" % text)
 
 
+class ConnectionMetrics(object):
+    """Statistics for a single connection to a TCPSVNServer.
+
+    :ivar client_address: Address of the client
+    :ivar requests: Number of commands run
+    :ivar bytes_in: Number of bytes received from the client
+    :ivar bytes_out: Number of bytes sent to the client
+    :ivar handler_time: Time spent running commands, in seconds
+    :ivar duration: Time the connection was open, in seconds
+    """
+
+    __slots__ = ('client_address', 'requests', 'bytes_in', 'bytes_out',
+                 'handler_time', 'duration')
+
+    def __init__(self, client_address, requests=0, bytes_in=0, bytes_out=0,
+                 handler_time=0.0, duration=0.0):
+        self.client_address = client_address
+        self.requests = requests
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.handler_time = handler_time
+        self.duration = duration
+
+    def __repr__(self):
+        return ("%s(%r, requests=%d, bytes_in=%d, bytes_out=%d, "
+                "handler_time=%f, duration=%f)" % (
+                    type(self).__name__, self.client_address, self.requests,
+                    self.bytes_in, self.bytes_out, self.handler_time,
+                    self.duration))
+
+
+def marshall_too_many_connections():
+    """Marshall the failure sent instead of a greeting to clients that
+    are refused because the server is busy."""
+    return marshall([literal("failure"), [[
+        ERR_RA_CANNOT_CREATE_SESSION, "Too many connections", __file__, 0]]])
+
+
 class TCPSVNRequestHandler(StreamRequestHandler):
 
     def __init__(self, request, client_address, server):
@@ -1117,23 +1765,230 @@ class TCPSVNRequestHandler(StreamRequestHandler):
             self, request, client_address, server)
 
     def handle(self):
+        metrics = ConnectionMetrics(self.client_address)
+        start = time.time()
+
+        def recv(size):
+            data = self.request.recv(size)
+            metrics.bytes_in += len(data)
+            return data
+
+        def send(data):
+            metrics.bytes_out += len(data)
+            return self.wfile.write(data)
+
         server = SVNServer(
-            self._server._backend, self.rfile.read,
-            self.wfile.write, self._server._logf)
+            self._server._backend, recv, send, self._server._logf)
         try:
-            server.serve()
+            server.handshake()
+            while not server._stop:
+                (cmd, args) = server.recv_msg()
+                command_start = time.time()
+                server.handle_command(cmd, args)
+                metrics.handler_time += time.time() - command_start
+                metrics.requests += 1
+            server.flush()
         except socket.error as e:
             if e.args[0] == EPIPE:
                 return
             raise
+        except SubversionException as e:
+            if e.args[1] == ERR_RA_SVN_CONNECTION_CLOSED:
+                return
+            raise
+        finally:
+            metrics.duration = time.time() - start
+            self._server.record_connection(metrics)
 
 
 class TCPSVNServer(TCPServer):
+    """svn:// server that handles one connection at a time.
+
+    Metrics for the last max_metrics connections that were closed are
+    available from connection_metrics.
+    """
 
     allow_reuse_address = True
     serve = TCPServer.serve_forever
+    max_metrics = 1000
 
     def __init__(self, backend, addr, logf=None):
         self._logf = logf
         self._backend = backend
+        self._metrics = deque(maxlen=self.max_metrics)
+        self._metrics_lock = threading.Lock()
+        self.refused_connections = 0
         TCPServer.__init__(self, addr, TCPSVNRequestHandler)
+
+    @property
+    def connection_metrics(self):
+        """List of ConnectionMetrics for recently closed connections."""
+        with self._metrics_lock:
+            return list(self._metrics)
+
+    def record_connection(self, metrics):
+        """Record the metrics of a connection that was closed.
+
+        :param metrics: A ConnectionMetrics object
+        """
+        with self._metrics_lock:
+            self._metrics.append(metrics)
+
+    def refuse_request(self, request):
+        """Tell a client that it can not be served right now."""
+        self.refused_connections += 1
+        try:
+            request.sendall(marshall_too_many_connections())
+        except socket.error:
+            pass
+        self.shutdown_request(request)
+
+
+class ThreadingTCPSVNServer(ThreadingMixIn, TCPSVNServer):
+    """svn:// server that handles connections in a pool of threads.
+
+    Connections that arrive while all workers are busy are queued. Once
+    max_queue connections are waiting, further clients are refused.
+
+    :param max_workers: Number of worker threads
+    :param max_queue: Maximum number of queued connections, or None for
+        no limit
+    """
+
+    daemon_threads = True
+
+    def __init__(self, backend, addr, logf=None, max_workers=10,
+                 max_queue=None):
+        TCPSVNServer.__init__(self, backend, addr, logf)
+        self._queue = queue.Queue(max_queue or 0)
+        self._busy_workers = 0
+        self._workers_lock = threading.Lock()
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = self.daemon_threads
+            worker.start()
+            self._workers.append(worker)
+
+    @property
+    def queue_depth(self):
+        """Number of connections waiting for a worker."""
+        return self._queue.qsize()
+
+    @property
+    def busy_workers(self):
+        """Number of workers that are serving a connection."""
+        return self._busy_workers
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self.refuse_request(request)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            with self._workers_lock:
+                self._busy_workers += 1
+            try:
+                self.process_request_thread(*item)
+            finally:
+                with self._workers_lock:
+                    self._busy_workers -= 1
+
+    def server_close(self):
+        TCPSVNServer.server_close(self)
+        while True:
+            try:
+                (request, client_address) = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self.shutdown_request(request)
+        for worker in self._workers:
+            self._queue.put(None)
+        if not self.daemon_threads:
+            for worker in self._workers:
+                worker.join()
+
+
+if hasattr(os, "fork"):
+    try:
+        from SocketServer import ForkingMixIn
+    except ImportError:
+        from socketserver import ForkingMixIn
+    import fcntl
+
+    class ForkingTCPSVNServer(ForkingMixIn, TCPSVNServer):
+        """svn:// server that handles each connection in a child process.
+
+        At most max_workers children run at a time. While they are all
+        busy no new connections are accepted; up to max_queue further
+        clients wait in the listen backlog of the socket.
+
+        The children report their metrics to the server through a pipe.
+
+        :param max_workers: Maximum number of child processes
+        :param max_queue: Size of the listen backlog
+        """
+
+        def __init__(self, backend, addr, logf=None, max_workers=10,
+                     max_queue=5):
+            self.max_children = max_workers
+            self.request_queue_size = max_queue
+            (self._metrics_in, self._metrics_out) = os.pipe()
+            flags = fcntl.fcntl(self._metrics_in, fcntl.F_GETFL)
+            fcntl.fcntl(self._metrics_in, fcntl.F_SETFL,
+                        flags | os.O_NONBLOCK)
+            self._metrics_unmarshaller = Unmarshaller()
+            TCPSVNServer.__init__(self, backend, addr, logf)
+
+        def record_connection(self, metrics):
+            # Called in the child; writes shorter than PIPE_BUF are atomic,
+            # so the reports of different children are not interleaved.
+            os.write(self._metrics_out, marshall([
+                metrics.client_address[0], metrics.client_address[1],
+                metrics.requests, metrics.bytes_in, metrics.bytes_out,
+                int(metrics.handler_time * 1000000),
+                int(metrics.duration * 1000000)]))
+
+        def _collect_metrics(self):
+            with self._metrics_lock:
+                while self._metrics_in is not None:
+                    try:
+                        data = os.read(self._metrics_in, 4096)
+                    except OSError:
+                        break
+                    if not data:
+                        break
+                    self._metrics_unmarshaller.feed(data)
+                for item in self._metrics_unmarshaller.read_items():
+                    (host, port, requests, bytes_in, bytes_out, handler_time,
+                     duration) = item
+                    if not isinstance(host, str):
+                        host = host.decode("ascii")
+                    self._metrics.append(ConnectionMetrics(
+                        (host, port), requests, bytes_in, bytes_out,
+                        handler_time / 1000000.0, duration / 1000000.0))
+
+        @property
+        def connection_metrics(self):
+            self._collect_metrics()
+            return TCPSVNServer.connection_metrics.fget(self)
+
+        def service_actions(self):
+            ForkingMixIn.service_actions(self)
+            self._collect_metrics()
+
+        def server_close(self):
+            if getattr(ForkingMixIn, "server_close", None) is not None:
+                # Waits for the children on Python >= 3.7
+                ForkingMixIn.server_close(self)
+            else:
+                TCPSVNServer.server_close(self)
+            self._collect_metrics()
+            os.close(self._metrics_in)
+            os.close(self._metrics_out)
+            self._metrics_in = self._metrics_out = None
@@ -0,0 +1,396 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
+"""asyncio client and server for the svn:// protocol.
+
+Requires Python 3.6 or later.
+"""
+
+import asyncio
+import base64
+import socket
+import urllib.parse as urlparse
+
+from subvertpy import (
+    ERR_RA_CANNOT_CREATE_SESSION,
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    SubversionException,
+    )
+from subvertpy.marshall import (
+    NeedMoreData,
+    Unmarshaller,
+    literal,
+    marshall,
+    )
+from subvertpy import ra_svn
+from subvertpy.ra_svn import (
+    CAPABILITIES,
+    RECV_BLOCK_SIZE,
+    SVN_PORT,
+    EditorFeeder,
+    SVNClient,
+    SVNServer,
+    log_args,
+    unmarshall_log_entry,
+    unpack_response,
+    )
+
+
+class AsyncSVNConnection(object):
+    """A svn protocol connection on top of asyncio streams."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._unmarshaller = Unmarshaller()
+
+    def send_msg(self, data):
+        """Queue a message for the peer."""
+        self._writer.write(marshall(data))
+
+    def send_success(self, *contents):
+        self.send_msg([literal("success"), list(contents)])
+
+    async def recv_msg(self):
+        """Receive the next message from the peer."""
+        while True:
+            try:
+                return self._unmarshaller.read_item()
+            except NeedMoreData:
+                await self._writer.drain()
+                newdata = await self._reader.read(RECV_BLOCK_SIZE)
+                if not newdata:
+                    raise SubversionException(
+                        "Connection closed", ERR_RA_SVN_CONNECTION_CLOSED)
+                self._unmarshaller.feed(newdata)
+
+    async def _unpack(self):
+        return unpack_response(await self.recv_msg())
+
+    _recv_ack = _unpack
+
+    def close(self):
+        self._writer.close()
+
+
+class AsyncSVNClient(AsyncSVNConnection):
+    """svn:// client using asyncio.
+
+    Create instances with the connect() coroutine. Commands on a single
+    client are run one at a time; use several clients to run commands
+    concurrently.
+    """
+
+    def __init__(self, url, reader, writer):
+        super(AsyncSVNClient, self).__init__(reader, writer)
+        self.url = url
+        self._lock = asyncio.Lock()
+        self._process = None
+
+    @classmethod
+    async def connect(cls, url):
+        """Connect to a svn:// or svn+ssh:// URL.
+
+        :param url: URL of the repository
+        :return: An AsyncSVNClient
+        """
+        (type, opaque) = urlparse.splittype(url)
+        if type not in ("svn", "svn+ssh"):
+            raise ValueError("Unsupported URL %s" % url)
+        (host, path) = urlparse.splithost(opaque)
+        process = None
+        if type == "svn":
+            (host, port) = urlparse.splitnport(host, SVN_PORT)
+            (reader, writer) = await asyncio.open_connection(host, port)
+        else:
+            (user, host) = urlparse.splituser(host)
+            if user is not None:
+                (user, password) = urlparse.splitpassword(user)
+            (host, port) = urlparse.splitnport(host, 22)
+            args = ra_svn.get_ssh_vendor().ssh_command(
+                user, host, port, ["svnserve", "-t"])
+            process = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE)
+            (reader, writer) = (process.stdout, process.stdin)
+        client = cls(url, reader, writer)
+        client._process = process
+        try:
+            await client._handshake()
+        except BaseException:
+            client.close()
+            raise
+        return client
+
+    async def _handshake(self):
+        (min_version, max_version, _, self._server_capabilities) = (
+            await self._unpack())
+        self.send_msg(
+            [max_version,
+             [literal(x) for x in CAPABILITIES
+                 if x in self._server_capabilities],
+             self.url])
+        (self._server_mechanisms, mech_arg) = await self._unpack()
+        if self._server_mechanisms != []:
+            self.send_msg([literal("ANONYMOUS"),
+                          [base64.b64encode(
+                              ("anonymous@%s" % socket.gethostname()).encode(
+                                  "utf-8"))]])
+            await self.recv_msg()
+        msg = await self._unpack()
+        if len(msg) > 2:
+            self._server_capabilities += msg[2]
+        (self._uuid, self._root_url) = msg[0:2]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        await self.wait_closed()
+        return False
+
+    async def wait_closed(self):
+        """Wait until the connection has been closed."""
+        if self._process is not None:
+            await self._process.wait()
+
+    def get_uuid(self):
+        return self._uuid
+
+    def get_repos_root(self):
+        return self._root_url
+
+    def has_capability(self, capability):
+        return capability in self._server_capabilities
+
+    async def _call(self, request):
+        (msg, convert) = request
+        async with self._lock:
+            self.send_msg(msg)
+            await self._recv_ack()
+            return convert(await self._unpack())
+
+    _get_latest_revnum_request = SVNClient._get_latest_revnum_request
+    _stat_request = SVNClient._stat_request
+    _get_dir_request = SVNClient._get_dir_request
+    _rev_proplist_request = SVNClient._rev_proplist_request
+
+    async def get_latest_revnum(self):
+        return await self._call(self._get_latest_revnum_request())
+
+    async def stat(self, path, revision=-1):
+        return await self._call(self._stat_request(path, revision))
+
+    async def get_dir(self, path, revision=-1, dirent_fields=0,
+                      want_props=True, want_contents=True):
+        return await self._call(self._get_dir_request(
+            path, revision, dirent_fields, want_props, want_contents))
+
+    async def rev_proplist(self, revision):
+        return await self._call(self._rev_proplist_request(revision))
+
+    async def log(self, paths, start, end, limit=0,
+                  discover_changed_paths=True, strict_node_history=True,
+                  include_merged_revisions=True, revprops=None):
+        """Iterate over log entries.
+
+        Yields tuples with changed paths, revision number, revision
+        properties and whether the revision has children, like
+        SVNClient.log(). The client can not be used for other commands
+        until the iteration has finished.
+        """
+        async with self._lock:
+            self.send_msg([literal("log"), log_args(
+                paths, start, end, limit, discover_changed_paths,
+                strict_node_history, include_merged_revisions, revprops)])
+            await self._recv_ack()
+            while True:
+                msg = await self.recv_msg()
+                if msg == "done":
+                    break
+                yield unmarshall_log_entry(msg)
+            await self._unpack()
+
+    async def replay(self, revision, low_water_mark, update_editor,
+                     send_deltas=True):
+        """Replay a revision, driving update_editor.
+
+        The editor methods are called from the event loop, and should not
+        block.
+        """
+        async with self._lock:
+            self.send_msg([literal("replay"), [revision, low_water_mark,
+                          send_deltas]])
+            await self._recv_ack()
+            feeder = EditorFeeder(update_editor)
+            while not feeder.process(*(await self.recv_msg())):
+                pass
+            if not feeder.replay_finished:
+                self.send_success()
+            await self._unpack()
+
+
+class _StreamBridge(object):
+    """Blocking access to asyncio streams for code running in a thread.
+
+    The returned functions can be used as the recv_fn and send_fn of a
+    SVNConnection that runs outside of the event loop thread. Writes wait
+    for the transport buffer to drain, so a slow client blocks the thread
+    that is sending to it rather than letting the output pile up.
+    """
+
+    def __init__(self, loop, reader, writer):
+        self._loop = loop
+        self._reader = reader
+        self._writer = writer
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def recv(self, size):
+        return asyncio.run_coroutine_threadsafe(
+            self._reader.read(size), self._loop).result()
+
+    def send(self, data):
+        asyncio.run_coroutine_threadsafe(
+            self._send(data), self._loop).result()
+
+
+class AsyncSVNServer(object):
+    """svn:// server using asyncio.
+
+    Connections are handled by the event loop while they are idle; each
+    command is run by a SVNServer in the executor, so that blocking
+    backends do not hold up other connections.
+
+    :param backend: Backend to serve, see subvertpy.server.ServerBackend
+    :param max_connections: Maximum number of concurrent connections, or
+        None for no limit. Further clients are sent an error.
+    :param idle_timeout: Number of seconds to wait for a command before
+        closing the connection, or None to wait forever
+    :param executor: concurrent.futures.Executor to run commands in, or
+        None to use the default executor of the event loop
+    :param logf: Optional file to log to
+    """
+
+    connection_class = SVNServer
+
+    def __init__(self, backend, max_connections=None, idle_timeout=None,
+                 executor=None, logf=None):
+        self._backend = backend
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._executor = executor
+        self._logf = logf
+        self._server = None
+        self._writers = set()
+
+    @property
+    def active_connections(self):
+        """Number of connections currently being served."""
+        return len(self._writers)
+
+    @property
+    def server_address(self):
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start(self, host="localhost", port=SVN_PORT, **kwargs):
+        """Start listening for connections.
+
+        Extra keyword arguments are passed on to asyncio.start_server().
+        """
+        self._server = await asyncio.start_server(
+            self.handle_connection, host, port, **kwargs)
+
+    def close(self):
+        """Stop listening and close all connections."""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+
+    async def wait_closed(self):
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def mutter(self, text):
+        if self._logf is not None:
+            self._logf.write("%s\n" % text)
+
+    async def _flush(self, conn, writer):
+        data = conn._take_output()
+        if data:
+            writer.write(data)
+        await writer.drain()
+
+    async def _read(self, reader):
+        if self.idle_timeout is None:
+            return await reader.read(RECV_BLOCK_SIZE)
+        return await asyncio.wait_for(
+            reader.read(RECV_BLOCK_SIZE), self.idle_timeout)
+
+    async def _recv_msg(self, conn, reader, writer):
+        while True:
+            try:
+                return conn._unmarshaller.read_item()
+            except NeedMoreData:
+                pass
+            # Only send the responses once all pipelined commands that
+            # have already been received are handled
+            await self._flush(conn, writer)
+            newdata = await self._read(reader)
+            if not newdata:
+                raise SubversionException(
+                    "Connection closed", ERR_RA_SVN_CONNECTION_CLOSED)
+            conn._unmarshaller.feed(newdata)
+
+    async def handle_connection(self, reader, writer):
+        """Serve a single client connection."""
+        if (self.max_connections is not None and
+                self.active_connections >= self.max_connections):
+            self.mutter("refusing connection: too many connections")
+            writer.write(marshall([literal("failure"), [[
+                ERR_RA_CANNOT_CREATE_SESSION, "Too many connections",
+                __file__, 0]]]))
+            writer.close()
+            return
+        loop = asyncio.get_event_loop()
+        bridge = _StreamBridge(loop, reader, writer)
+        conn = self.connection_class(
+            self._backend, bridge.recv, bridge.send, self._logf)
+        self._writers.add(writer)
+        try:
+            conn.send_greeting()
+            conn.process_client_greeting(
+                await self._recv_msg(conn, reader, writer))
+            msg = await self._recv_msg(conn, reader, writer)
+            await loop.run_in_executor(self._executor, conn.process_auth, msg)
+            while not conn._stop:
+                (cmd, args) = await self._recv_msg(conn, reader, writer)
+                await loop.run_in_executor(
+                    self._executor, conn.handle_command, cmd, args)
+            await self._flush(conn, writer)
+        except asyncio.TimeoutError:
+            self.mutter("closing idle connection")
+        except ConnectionError:
+            pass
+        except SubversionException as e:
+            if e.args[1] != ERR_RA_SVN_CONNECTION_CLOSED:
+                raise
+        finally:
+            self._writers.discard(writer)
+            writer.close()
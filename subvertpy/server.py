@@ -45,17 +45,48 @@ class ServerRepositoryBackend(object):
     def update(self, editor, revnum, target_path, recurse=True):
         raise NotImplementedError(self.update)
 
+    def replay(self, editor, revnum, low_water_mark, send_deltas=True):
+        """Replay the changes made in a revision.
+
+        Should drive editor from open_root() up to and including closing
+            the root directory, but not call editor.close(). Copies from
+            revisions older than low_water_mark are sent as plain adds,
+            and file contents are only sent if send_deltas is True.
+        """
+        raise NotImplementedError(self.replay)
+
     def check_path(self, path, revnum):
         raise NotImplementedError(self.check_path)
 
     def stat(self, path, revnum):
         """Stat a path.
 
-        Should return a dictionary with the following keys: name, kind, size,
-            has-props, created-rev, created-date, last-author.
+        Should return a dictionary with the following keys: name, kind
+            ("file" or "dir"), size, has-props, created-rev, created-date,
+            last-author.
         """
         raise NotImplementedError(self.stat)
 
+    def get_file(self, path, revnum, want_props=True, want_contents=True):
+        """Retrieve a file.
+
+        Should return a tuple with the revision number, a dictionary with
+            the file properties (or None if want_props is False) and an
+            object with a read() method for the file contents (or None if
+            want_contents is False). The contents are read in chunks.
+        """
+        raise NotImplementedError(self.get_file)
+
+    def get_dir(self, path, revnum, want_props=True, want_contents=True):
+        """Retrieve a directory.
+
+        Should return a tuple with the revision number, a dictionary with
+            the directory properties (or None if want_props is False) and
+            a list of dictionaries like those returned by stat() for the
+            entries (or None if want_contents is False).
+        """
+        raise NotImplementedError(self.get_dir)
+
     def rev_proplist(self, revnum):
         raise NotImplementedError(self.rev_proplist)
 
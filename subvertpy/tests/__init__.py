@@ -447,11 +447,14 @@ def test_suite():
         'marshall',
         'properties',
         'ra',
+        'ra_svn',
         'repos',
         'server',
         'subr',
         'wc',
         ]
+    if sys.version_info >= (3, 6):
+        names.append('ra_svn_async')
     module_names = ['subvertpy.tests.test_' + name for name in names]
     result = unittest.TestSuite()
     loader = unittest.TestLoader()
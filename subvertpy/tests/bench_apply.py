@@ -0,0 +1,105 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmarks for applying txdelta windows.
+
+Times txdelta_apply_ops on windows that mostly copy from the source view,
+windows that mostly repeat data from the target view (as in zero-filled
+binaries or repeated lines) and windows that mostly consist of new data.
+"""
+
+from optparse import OptionParser
+import os
+
+from subvertpy import delta
+from subvertpy.delta import (
+    DELTA_WINDOW_SIZE,
+    TXDELTA_NEW,
+    TXDELTA_SOURCE,
+    TXDELTA_TARGET,
+    )
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+
+try:
+    from subvertpy import _delta
+except ImportError:
+    _delta = None
+
+
+def source_heavy_window(sview):
+    # Many short copies from the source, as for a lightly edited file.
+    ops = []
+    for offset in range(0, len(sview), 1024):
+        ops.append((TXDELTA_SOURCE, offset, 1000))
+        ops.append((TXDELTA_NEW, 0, 24))
+    return (0, len(sview), 1024 * len(ops) // 2, 0, ops, os.urandom(24))
+
+
+def target_heavy_window(sview):
+    # A short new fragment that is repeated until the window is full.
+    return (0, 0, DELTA_WINDOW_SIZE, 0,
+            [(TXDELTA_NEW, 0, 1), (TXDELTA_TARGET, 0, DELTA_WINDOW_SIZE - 1)],
+            b"\0")
+
+
+def repeated_lines_window(sview):
+    line = b"    repeated line of text\n"
+    return (0, 0, DELTA_WINDOW_SIZE, 0,
+            [(TXDELTA_NEW, 0, len(line)),
+             (TXDELTA_TARGET, 0, DELTA_WINDOW_SIZE - len(line))],
+            line)
+
+
+def new_heavy_window(sview):
+    return (0, 0, DELTA_WINDOW_SIZE, 0,
+            [(TXDELTA_NEW, 0, DELTA_WINDOW_SIZE)],
+            os.urandom(DELTA_WINDOW_SIZE))
+
+
+def apply_window(txdelta_apply_ops, window, sview, count):
+    (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
+    for i in range(count):
+        txdelta_apply_ops(src_ops, ops, new_data, sview)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--count", type=int, default=100,
+        help="Number of windows to apply per benchmark [default: %default]")
+    options, args = parser.parse_args()
+
+    impls = [("python", delta._txdelta_apply_ops_py)]
+    if _delta is not None:
+        impls.append(("c", _delta.txdelta_apply_ops))
+
+    sview = os.urandom(DELTA_WINDOW_SIZE)
+    for (kind, make_window) in [("source-heavy", source_heavy_window),
+                                ("target-heavy", target_heavy_window),
+                                ("repeated lines", repeated_lines_window),
+                                ("new-heavy", new_heavy_window)]:
+        window = make_window(sview)
+        for (name, apply_ops) in impls:
+            report("%s %s" % (kind, name),
+                   measure(apply_window,
+                           (apply_ops, window, sview, options.count)),
+                   window[2] * options.count)
+
+
+if __name__ == "__main__":
+    main()
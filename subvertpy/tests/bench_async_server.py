@@ -0,0 +1,83 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Load test for the asyncio svn:// server.
+
+Opens many concurrent clients against an AsyncSVNServer serving an
+in-memory repository. Each client connects, runs get-latest-rev and
+fetches the log, and disconnects. Requires Python 3.6.
+"""
+
+import asyncio
+from optparse import OptionParser
+
+from subvertpy.ra_svn_async import (
+    AsyncSVNClient,
+    AsyncSVNServer,
+    )
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+from subvertpy.tests.test_ra_svn import (
+    MemoryBackend,
+    MemoryRepositoryBackend,
+    make_revisions,
+    )
+
+
+async def run_client(url, limit):
+    async with await AsyncSVNClient.connect(url) as client:
+        latest = await client.get_latest_revnum()
+        async for entry in client.log([b""], latest, 1, limit):
+            pass
+
+
+async def run_clients(url, count, limit):
+    await asyncio.gather(*[run_client(url, limit) for i in range(count)])
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--clients", type=int, default=1000,
+        help="Number of concurrent clients [default: %default]")
+    parser.add_option(
+        "--revisions", type=int, default=100,
+        help="Number of revisions in the repository [default: %default]")
+    parser.add_option(
+        "--limit", type=int, default=0,
+        help="Maximum number of log entries to fetch [default: all]")
+    options, args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    server = AsyncSVNServer(MemoryBackend(
+        MemoryRepositoryBackend(make_revisions(options.revisions))))
+    loop.run_until_complete(server.start("127.0.0.1", 0, backlog=1024))
+    url = "svn://%s:%d/repo" % server.server_address
+    try:
+        report("%d clients, get-latest-rev and log of %d revisions" % (
+                    options.clients, options.revisions),
+               measure(loop.run_until_complete,
+                       (run_clients(url, options.clients, options.limit),),
+                       repeat=1))
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
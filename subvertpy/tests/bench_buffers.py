@@ -0,0 +1,129 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for passing bytes-like objects to the C bindings.
+
+Writes a bytearray to a stream and sends it as delta windows to a
+commit editor, once by passing slices of it as memoryviews and once
+by copying every chunk to bytes first, as was necessary before the
+bindings accepted any bytes-like object. Also fetches the committed
+file into a Python object and into an unbuffered file, which bypasses
+Python entirely.
+"""
+
+from optparse import OptionParser
+import os
+import shutil
+import tempfile
+
+from subvertpy import (
+    delta,
+    ra,
+    repos,
+    )
+from subvertpy.tests.bench_svndiff import make_text
+from subvertpy.tests.benchmark import (
+    MB,
+    measure,
+    parse_sizes,
+    report,
+    )
+
+CHUNK_SIZE = 100 * 1024
+
+
+class CountingSink(object):
+
+    def __init__(self):
+        self.length = 0
+
+    def write(self, data):
+        self.length += len(data)
+
+
+def chunks(view, copy):
+    for offset in range(0, len(view), CHUNK_SIZE):
+        chunk = view[offset:offset + CHUNK_SIZE]
+        if copy:
+            chunk = bytes(chunk)
+        yield chunk
+
+
+def write_stream(view, copy):
+    stream = repos.Stream()
+    for chunk in chunks(view, copy):
+        stream.write(chunk)
+    stream.close()
+
+
+def commit(session, view, copy):
+    editor = session.get_commit_editor({"svn:log": "bench"})
+    root = editor.open_root()
+    f = root.add_file("copy" if copy else "view")
+    handler = f.apply_textdelta()
+    for chunk in chunks(view, copy):
+        handler((0, 0, len(chunk), 0, [(delta.TXDELTA_NEW, 0, len(chunk))],
+                 chunk))
+    handler(None)
+    f.close()
+    root.close()
+    editor.close()
+
+
+def get_file(session, size):
+    sink = CountingSink()
+    session.get_file("view", sink)
+    assert sink.length == size
+
+
+def get_file_raw(session, path, size):
+    with open(path, "wb", buffering=0) as f:
+        session.get_file("view", f)
+        assert f.tell() == size
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1,16,64",
+        help="Comma-separated list of sizes in MB [default: %default]")
+    options, args = parser.parse_args()
+
+    for size in parse_sizes(options.sizes):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "repo")
+            repos.create(path)
+            session = ra.RemoteAccess(
+                "file://" + path, auth=ra.Auth([ra.get_username_provider()]))
+            view = memoryview(bytearray(make_text(size)))
+            for (name, copy) in [("memoryview", False), ("bytes copy", True)]:
+                report("Stream.write %d MB, %s" % (size // MB, name),
+                       measure(write_stream, (view, copy)), size)
+                report("commit %d MB, %s" % (size // MB, name),
+                       measure(commit, (session, view, copy), repeat=1),
+                       size)
+            report("get_file %d MB" % (size // MB),
+                   measure(get_file, (session, size)), size)
+            report("get_file %d MB to a raw file" % (size // MB),
+                   measure(get_file_raw, (
+                       session, os.path.join(tmpdir, "fulltext"), size)),
+                   size)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the Python and C svndiff implementations.
+
+Larger deltas can be timed with e.g. ``--sizes=1,64,1024``.
+"""
+
+from optparse import OptionParser
+import os
+
+from subvertpy import delta
+from subvertpy.delta import (
+    DELTA_WINDOW_SIZE,
+    TXDELTA_NEW,
+    TXDELTA_SOURCE,
+    TXDELTA_TARGET,
+    )
+from subvertpy.tests.benchmark import (
+    MB,
+    measure,
+    parse_sizes,
+    report,
+    )
+
+try:
+    from subvertpy import _delta
+except ImportError:
+    _delta = None
+
+
+def make_windows(size, window_size=DELTA_WINDOW_SIZE):
+    """Create a list of windows that describe a delta of the given size.
+
+    Every window copies some data from the source, repeats part of the
+    target and adds new data, so all instruction types are exercised.
+    """
+    new_len = window_size // 2
+    new_data = os.urandom(new_len)
+    ops = [(TXDELTA_SOURCE, 0, window_size // 4),
+           (TXDELTA_NEW, 0, new_len),
+           (TXDELTA_TARGET, 0, window_size // 4)]
+    window = (0, window_size, window_size, len(ops), ops, new_data)
+    return [window] * max(1, size // window_size)
+
+
+def consume(iterator):
+    for item in iterator:
+        pass
+
+
+def apply_all(txdelta_apply_ops, windows, sview):
+    for window in windows:
+        txdelta_apply_ops(window[3], window[4], window[5], sview)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1,16,128",
+        help="Comma-separated list of delta sizes in MB [default: %default]")
+    parser.add_option(
+        "--python-max-size", type=int, default=16,
+        help="Largest delta size in MB to run the pure-Python "
+             "implementation with [default: %default]")
+    options, args = parser.parse_args()
+
+    impls = [("python", delta._pack_svndiff0_py,
+              delta._unpack_svndiff0_py, delta._txdelta_apply_ops_py)]
+    if _delta is not None:
+        impls.append(("c", _delta.pack_svndiff0, _delta.unpack_svndiff0,
+                      _delta.txdelta_apply_ops))
+    else:
+        print("_delta extension not available, only timing Python code")
+
+    sview = os.urandom(DELTA_WINDOW_SIZE)
+    for size in parse_sizes(options.sizes):
+        windows = make_windows(size)
+        packed = delta._pack_svndiff0_py(windows[:1])
+        packed += delta._pack_svndiff0_window_py(windows[0]) * (
+            len(windows) - 1)
+        for (name, pack, unpack, apply_ops) in impls:
+            if name == "python" and size > options.python_max_size * MB:
+                continue
+            label = "%s %dMB" % (name, size // MB)
+            report("pack_svndiff0 %s" % label,
+                   measure(pack, (windows, )), size)
+            report("unpack_svndiff0 %s" % label,
+                   measure(lambda: consume(unpack(packed))), len(packed))
+            report("txdelta_apply_ops %s" % label,
+                   measure(apply_all, (apply_ops, windows, sview)), size)
+
+
+if __name__ == "__main__":
+    main()
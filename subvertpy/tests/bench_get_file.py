@@ -0,0 +1,81 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Throughput benchmark for get-file in ra_svn.
+
+Serves files of various sizes from a stream over a socketpair and
+fetches them with SVNClient.get_file, discarding the contents.
+"""
+
+from optparse import OptionParser
+import socket
+
+from subvertpy.tests.benchmark import (
+    measure,
+    parse_sizes,
+    report,
+    )
+from subvertpy.tests.test_ra_svn import (
+    CountingSink,
+    MemoryBackend,
+    MemoryRepositoryBackend,
+    SocketPairClient,
+    ZeroStream,
+    make_revisions,
+    serve_socket,
+    )
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_file(client, size):
+    sink = CountingSink()
+    client.get_file(b"trunk/file%d" % size, sink)
+    assert sink.length == size
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1,16,256,1024",
+        help="Comma-separated file sizes in MB [default: %default]")
+    options, args = parser.parse_args()
+    sizes = parse_sizes(options.sizes)
+
+    repository = MemoryRepositoryBackend(make_revisions(1))
+    for size in sizes:
+        repository.files[b"trunk/file%d" % size] = (
+            lambda size=size: ZeroStream(size))
+    (server_sock, client_sock) = socket.socketpair()
+    thread = serve_socket(MemoryBackend(repository), server_sock)
+    client = SocketPairClient("svn://localhost/repo", client_sock)
+    try:
+        for size in sizes:
+            report("get_file %d MB" % (size // (1024 * 1024)),
+                   measure(get_file, (client, size)), size)
+    finally:
+        client.close()
+        thread.join()
+    if resource is not None:
+        # Both ends run in this process
+        print("peak RSS: %d MB" % (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Import time benchmark.
+
+Starts a fresh interpreter for each import, and reports the time taken
+on top of starting an interpreter that imports nothing.
+"""
+
+from optparse import OptionParser
+import os
+import subprocess
+import sys
+
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+
+
+def run_python(code, env):
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(
+            [sys.executable, "-c", code], env=env, stderr=devnull)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--repeat", type=int, default=10,
+        help="Number of interpreters to start per import [default: %default]")
+    options, args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    env.pop("SUBVERTPY_DEBUG", None)
+    debug_env = dict(env)
+    debug_env["SUBVERTPY_DEBUG"] = "1"
+
+    baseline = measure(run_python, ("pass", env), repeat=options.repeat)
+    report("python -c pass", baseline)
+    for (name, code, code_env) in [
+            ("import subvertpy", "import subvertpy", env),
+            ("import subvertpy.properties",
+             "import subvertpy.properties", env),
+            ("import subvertpy.ra_svn", "import subvertpy.ra_svn", env),
+            ("import subvertpy.client", "import subvertpy.client", env),
+            ("import subvertpy (SUBVERTPY_DEBUG)",
+             "import subvertpy", debug_env),
+            ("import subvertpy.client (SUBVERTPY_DEBUG)",
+             "import subvertpy.client", debug_env)]:
+        try:
+            seconds = measure(run_python, (code, code_env),
+                              repeat=options.repeat)
+        except subprocess.CalledProcessError:
+            print("%-50s %13s" % (name, "failed"))
+            continue
+        report(name, seconds - baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmarks for marshalling the svn protocol.
+
+Times marshall, unmarshall and the incremental parser used by
+SVNConnection on streams of log entries and editor commands, for both
+the pure-Python and the C implementation.
+"""
+
+from optparse import OptionParser
+
+from subvertpy import marshall
+from subvertpy.marshall import literal
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+
+try:
+    from subvertpy import _marshall
+except ImportError:
+    _marshall = None
+
+
+def log_messages(count):
+    return [[[(b"/trunk/file%d" % i, literal("M"), [])], i,
+             [b"jelmer"], [b"2018-01-01T00:00:00.000000Z"],
+             [b"Commit message for revision %d." % i]]
+            for i in range(count)]
+
+
+def editor_messages(count):
+    msgs = [[literal("open-root"), [[1], b"d0"]]]
+    for i in range(count):
+        path = b"trunk/dir%d/file%d" % (i // 100, i)
+        token = b"f%d" % i
+        msgs.extend([
+            [literal("add-file"), [path, b"d0", token, [], []]],
+            [literal("change-file-prop"), [token, b"svn:eol-style",
+                                           [b"native"]]],
+            [literal("apply-textdelta"), [token, []]],
+            [literal("textdelta-chunk"), [token, b"SVN\0"]],
+            [literal("textdelta-chunk"), [token, b"\0\0\x0c\x01\x0c\x8c" +
+                                          b"file %07d\n" % i]],
+            [literal("textdelta-end"), [token]],
+            [literal("close-file"), [token, [b"0" * 32]]],
+            ])
+    msgs.append([literal("close-dir"), [b"d0"]])
+    msgs.append([literal("close-edit"), []])
+    return msgs
+
+
+def marshall_all(marshall_fn, msgs):
+    for msg in msgs:
+        marshall_fn(msg)
+
+
+def unmarshall_all(unmarshall_fn, data):
+    for text in data:
+        unmarshall_fn(text)
+
+
+def read_stream(read_item, data):
+    pos = 0
+    stack = []
+    while pos < len(data):
+        (pos, item) = read_item(data, pos, stack)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--count", type=int, default=10000,
+        help="Number of log entries and files [default: %default]")
+    options, args = parser.parse_args()
+
+    impls = [("python", marshall._marshall_py, marshall._unmarshall_py,
+              marshall._read_item_py)]
+    if _marshall is not None:
+        impls.append(("c", _marshall.marshall, _marshall.unmarshall,
+                      _marshall.read_item))
+
+    for (kind, msgs) in [("log", log_messages(options.count)),
+                         ("editor", editor_messages(options.count))]:
+        data = [marshall._marshall_py(msg) for msg in msgs]
+        stream = bytearray(b"".join(data))
+        for (name, marshall_fn, unmarshall_fn, read_item) in impls:
+            report("marshall %s %s" % (kind, name),
+                   measure(marshall_all, (marshall_fn, msgs)), len(stream))
+            report("unmarshall %s %s" % (kind, name),
+                   measure(unmarshall_all, (unmarshall_fn, data)),
+                   len(stream))
+            report("read_item %s %s" % (kind, name),
+                   measure(read_stream, (read_item, stream)), len(stream))
+
+
+if __name__ == "__main__":
+    main()
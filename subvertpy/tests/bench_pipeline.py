@@ -0,0 +1,134 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Latency benchmark for pipelined svn:// commands.
+
+Runs a TCPSVNServer behind a local proxy that delays all traffic, and
+times a series of stat calls issued one at a time and on a pipeline.
+"""
+
+from optparse import OptionParser
+import socket
+import threading
+import time
+
+from subvertpy.ra_svn import (
+    RECV_BLOCK_SIZE,
+    SVNClient,
+    )
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+from subvertpy.tests.test_ra_svn import (
+    MemoryBackend,
+    MemoryRepositoryBackend,
+    ServerThread,
+    make_revisions,
+    )
+
+
+class DelayProxy(object):
+    """TCP proxy that delays data in both directions.
+
+    :param target: Address to forward connections to
+    :param delay: Delay to add to each chunk of data, in seconds
+    """
+
+    def __init__(self, target, delay):
+        self.target = target
+        self.delay = delay
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(5)
+        self.address = self._listener.getsockname()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                (client, addr) = self._listener.accept()
+            except socket.error:
+                return
+            server = socket.create_connection(self.target)
+            for (src, dst) in [(client, server), (server, client)]:
+                thread = threading.Thread(
+                    target=self._forward, args=(src, dst))
+                thread.daemon = True
+                thread.start()
+
+    def _forward(self, src, dst):
+        try:
+            while True:
+                data = src.recv(RECV_BLOCK_SIZE)
+                if not data:
+                    break
+                time.sleep(self.delay)
+                dst.sendall(data)
+        except socket.error:
+            pass
+        finally:
+            try:
+                dst.shutdown(socket.SHUT_WR)
+            except socket.error:
+                pass
+
+    def close(self):
+        self._listener.close()
+
+
+def stat_sequential(client, paths):
+    for path in paths:
+        client.stat(path)
+
+
+def stat_pipelined(client, paths):
+    with client.pipeline() as pipeline:
+        futures = [pipeline.stat(path) for path in paths]
+    for future in futures:
+        future.result()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--count", type=int, default=200,
+        help="Number of stat calls [default: %default]")
+    parser.add_option(
+        "--delay", type=float, default=5,
+        help="Delay added in each direction, in ms [default: %default]")
+    options, args = parser.parse_args()
+
+    server = ServerThread(
+        MemoryBackend(MemoryRepositoryBackend(make_revisions(100))))
+    proxy = DelayProxy(server.server.server_address, options.delay / 1000.0)
+    client = SVNClient("svn://%s:%d/repo" % proxy.address)
+    try:
+        paths = [b"trunk/file%d" % (i % 100) for i in range(options.count)]
+        for (name, fn) in [("sequential", stat_sequential),
+                           ("pipelined", stat_pipelined)]:
+            report("%d stat calls %s (%.1f ms delay)" % (
+                        options.count, name, options.delay),
+                   measure(fn, (client, paths)))
+    finally:
+        client.close()
+        proxy.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
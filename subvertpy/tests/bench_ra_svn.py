@@ -0,0 +1,180 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Throughput benchmarks for the svn:// protocol implementation.
+
+Times parsing a stream of log entries with unmarshall() and with the
+incremental Unmarshaller at different read sizes, fetching the log
+from a TCPSVNServer running on localhost and sending an editor drive that
+adds many small files over a socket, with and without send buffering.
+"""
+
+from optparse import OptionParser
+import socket
+import threading
+
+from subvertpy import ra_svn
+from subvertpy.delta import TXDELTA_NEW
+
+from subvertpy.marshall import (
+    Unmarshaller,
+    literal,
+    marshall,
+    unmarshall,
+    )
+from subvertpy.ra_svn import (
+    RECV_BLOCK_SIZE,
+    Editor,
+    SVNClient,
+    SVNConnection,
+    )
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+from subvertpy.tests.test_ra_svn import (
+    MemoryBackend,
+    MemoryRepositoryBackend,
+    ServerThread,
+    make_revisions,
+    )
+
+
+def log_stream(revisions):
+    return b"".join(
+        marshall([[(p, literal(action), ())
+                   for (p, (action, cf, cr)) in paths.items()],
+                  revnum, [author], [date], [message]])
+        for revnum, (author, date, message, paths) in enumerate(revisions))
+
+
+def parse_unmarshall(data):
+    # unmarshall() copies the remainder of the buffer for every item it
+    # parses, even when all data is available up front.
+    items = 0
+    while data:
+        (data, item) = unmarshall(data)
+        items += 1
+    return items
+
+
+def parse_unmarshaller(data, block_size):
+    unmarshaller = Unmarshaller()
+    items = 0
+    for i in range(0, len(data), block_size):
+        unmarshaller.feed(data[i:i+block_size])
+        for item in unmarshaller.read_items():
+            items += 1
+    return items
+
+
+def fetch_log(url, count):
+    client = SVNClient(url)
+    try:
+        revs = 0
+        for rev in client.log([b""], 1, count):
+            revs += 1
+        assert revs == count
+    finally:
+        client.close()
+
+
+def drive_editor(conn, count):
+    editor = Editor(conn)
+    root = editor.open_root(1)
+    for i in range(count):
+        text = b"contents of file %d\n" % i
+        f = root.add_file(b"file%d" % i)
+        handler = f.apply_textdelta()
+        handler((0, 0, len(text), 0, [(TXDELTA_NEW, 0, len(text))], text))
+        handler(None)
+        f.close()
+    root.close()
+    editor.close()
+    conn.flush()
+
+
+def send_editor_drive(count, send_buffer_size):
+    (ours, theirs) = socket.socketpair()
+
+    def drain():
+        while theirs.recv(RECV_BLOCK_SIZE):
+            pass
+    reader = threading.Thread(target=drain)
+    reader.start()
+    writes = []
+
+    def send(data):
+        writes.append(len(data))
+        return ours.send(data)
+    old_send_buffer_size = ra_svn.SEND_BUFFER_SIZE
+    ra_svn.SEND_BUFFER_SIZE = send_buffer_size
+    try:
+        drive_editor(SVNConnection(ours.recv, send), count)
+    finally:
+        ra_svn.SEND_BUFFER_SIZE = old_send_buffer_size
+        ours.shutdown(socket.SHUT_WR)
+        reader.join()
+        ours.close()
+        theirs.close()
+    return len(writes)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--revisions", type=int, default=10000,
+        help="Number of revisions in the log [default: %default]")
+    parser.add_option(
+        "--message-size", type=int, default=200,
+        help="Size of each log message [default: %default]")
+    parser.add_option(
+        "--files", type=int, default=10000,
+        help="Number of files in the editor drive [default: %default]")
+    options, args = parser.parse_args()
+
+    revisions = make_revisions(
+        options.revisions, message=b"x" * options.message_size)
+    data = log_stream(revisions)
+    # unmarshall() is quadratic in the buffer size, so only give it a
+    # fraction of the log.
+    sample = log_stream(revisions[:len(revisions) // 100])
+    report("parse log unmarshall (1% of log)",
+           measure(parse_unmarshall, (sample, )), len(sample))
+    report("parse log Unmarshaller (1% of log)",
+           measure(parse_unmarshaller, (sample, len(sample))), len(sample))
+    for block_size in [1024, RECV_BLOCK_SIZE]:
+        report("parse log Unmarshaller (%d byte reads)" % block_size,
+               measure(parse_unmarshaller, (data, block_size)), len(data))
+
+    server = ServerThread(
+        MemoryBackend(MemoryRepositoryBackend(revisions)))
+    try:
+        report("log over svn:// (%d revisions)" % options.revisions,
+               measure(fetch_log, (server.url, options.revisions)),
+               len(data))
+    finally:
+        server.stop()
+
+    for (name, send_buffer_size) in [
+            ("unbuffered", 0), ("buffered", ra_svn.SEND_BUFFER_SIZE)]:
+        writes = send_editor_drive(options.files, send_buffer_size)
+        report("editor drive %s (%d files, %d writes)" % (
+                    name, options.files, writes),
+               measure(send_editor_drive, (options.files, send_buffer_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for opening svn+ssh:// connections.
+
+Opens a series of clients with SSHVendor and ControlMasterSSHVendor.
+Instead of ssh, a stand-in is run that sleeps to simulate the key
+exchange unless a (fake) control master for the host exists, and then
+serves an in-memory repository over stdio.
+"""
+
+import hashlib
+from optparse import OptionParser
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from subvertpy import (
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    SubversionException,
+    ra_svn,
+    )
+from subvertpy.tests.benchmark import (
+    measure,
+    report,
+    )
+
+
+def serve_stdio():
+    """Serve an in-memory repository on stdin/stdout, like svnserve -t."""
+    from subvertpy.tests.test_ra_svn import (
+        MemoryBackend,
+        MemoryRepositoryBackend,
+        make_revisions,
+        )
+    server = ra_svn.SVNServer(
+        MemoryBackend(MemoryRepositoryBackend(make_revisions(10))),
+        lambda count: os.read(0, count), lambda data: os.write(1, data))
+    try:
+        server.serve()
+    except SubversionException as e:
+        if e.args[1] != ERR_RA_SVN_CONNECTION_CLOSED:
+            raise
+
+
+def fake_ssh(argv):
+    """Pretend to be ssh.
+
+    Understands the options used by SSHVendor and ControlMasterSSHVendor.
+    Every invocation is logged to $FAKE_SSH_LOG.
+    """
+    options = {}
+    port = None
+    control_command = None
+    args = list(argv)
+    while args[0].startswith("-"):
+        opt = args.pop(0)
+        if opt == "-o":
+            (key, value) = args.pop(0).split("=", 1)
+            options[key] = value
+        elif opt == "-p":
+            port = args.pop(0)
+        elif opt == "-O":
+            control_command = args.pop(0)
+    host = args.pop(0)
+    control_path = options.get("ControlPath")
+    if control_path is not None:
+        control_path = control_path.replace("%C", hashlib.sha1(
+            ("%s:%s" % (host, port)).encode("utf-8")).hexdigest())
+    if control_command == "exit":
+        if control_path is not None and os.path.exists(control_path):
+            os.remove(control_path)
+        event = "exit"
+    elif control_path is not None and os.path.exists(control_path):
+        event = "channel"
+    else:
+        time.sleep(float(os.environ.get("FAKE_SSH_DELAY", "0")))
+        if (control_path is not None and
+                options.get("ControlMaster") in ("auto", "yes")):
+            open(control_path, "w").close()
+        event = "handshake"
+    with open(os.environ["FAKE_SSH_LOG"], "a") as f:
+        f.write(event + "\n")
+    if control_command is None:
+        serve_stdio()
+
+
+class FakeSSHMixin(object):
+
+    def ssh_command(self, username, host, port, command):
+        args = super(FakeSSHMixin, self).ssh_command(
+            username, host, port, command)
+        return ([sys.executable, "-m", "subvertpy.tests.bench_ssh", "--ssh"] +
+                args[1:])
+
+
+class FakeSSHVendor(FakeSSHMixin, ra_svn.SSHVendor):
+    pass
+
+
+class FakeControlMasterSSHVendor(FakeSSHMixin,
+                                 ra_svn.ControlMasterSSHVendor):
+    pass
+
+
+def open_clients(url, count):
+    for i in range(count):
+        client = ra_svn.SVNClient(url)
+        client.get_latest_revnum()
+        client.close()
+
+
+def main():
+    if sys.argv[1:2] == ["--ssh"]:
+        fake_ssh(sys.argv[2:])
+        return
+    parser = OptionParser()
+    parser.add_option(
+        "--count", type=int, default=20,
+        help="Number of clients to open [default: %default]")
+    parser.add_option(
+        "--delay", type=float, default=100,
+        help="Time taken by the key exchange, in ms [default: %default]")
+    options, args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    log_path = os.path.join(tmpdir, "ssh.log")
+    os.environ["FAKE_SSH_LOG"] = log_path
+    os.environ["FAKE_SSH_DELAY"] = str(options.delay / 1000.0)
+    url = "svn+ssh://localhost/repo"
+    try:
+        for (name, vendor) in [
+                ("ssh", FakeSSHVendor()),
+                ("ssh with control master",
+                 FakeControlMasterSSHVendor(control_dir=tmpdir))]:
+            ra_svn.get_ssh_vendor = lambda: vendor
+            open(log_path, "w").close()
+            seconds = measure(open_clients, (url, options.count), repeat=1)
+            with open(log_path) as f:
+                handshakes = f.read().split().count("handshake")
+            report("%d clients over %s (%d handshakes)" % (
+                        options.count, name, handshakes), seconds)
+            if isinstance(vendor, ra_svn.ControlMasterSSHVendor):
+                vendor.exit_master(None, "localhost", 22)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the svndiff0, svndiff1 and svndiff2 formats.
+
+For each format this reports the number of bytes that would be sent over
+the wire and the time spent encoding and decoding per megabyte of text.
+"""
+
+from io import BytesIO
+from optparse import OptionParser
+import os
+
+from subvertpy.delta import (
+    SVNDIFF_VERSIONS,
+    pack_svndiff,
+    send_stream,
+    unpack_svndiff,
+    )
+from subvertpy.tests.benchmark import (
+    MB,
+    measure,
+    parse_sizes,
+    report,
+    )
+
+
+def make_text(size):
+    """Create text that compresses roughly like source code."""
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = ("    value_%d = compute(%d, name='item-%d')  # step %d\n" % (
+            i % 97, i, i % 13, i)).encode("ascii")
+        lines.append(line)
+        length += len(line)
+        i += 1
+    return b"".join(lines)[:size]
+
+
+def fulltext_windows(text):
+    windows = []
+    send_stream(BytesIO(text), windows.append)
+    return windows[:-1]
+
+
+def consume(iterator):
+    for item in iterator:
+        pass
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1,16",
+        help="Comma-separated list of text sizes in MB [default: %default]")
+    options, args = parser.parse_args()
+
+    for size in parse_sizes(options.sizes):
+        for (kind, text) in [("text", make_text(size)),
+                             ("binary", os.urandom(size))]:
+            windows = fulltext_windows(text)
+            for version in SVNDIFF_VERSIONS:
+                packed = pack_svndiff(windows, version)
+                label = "svndiff%d %s %dMB" % (version, kind, size // MB)
+                print("%-50s %10d bytes on wire (%.1f%%)" % (
+                    label, len(packed), 100.0 * len(packed) / len(text)))
+                report("  encode", measure(pack_svndiff, (windows, version)),
+                       len(text))
+                report("  decode",
+                       measure(lambda: consume(unpack_svndiff(packed))),
+                       len(text))
+
+
+if __name__ == "__main__":
+    main()
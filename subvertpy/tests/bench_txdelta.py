@@ -0,0 +1,88 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the size of text deltas generated for typical edits.
+
+Compares the svndiff0 size of send_stream (full text) and
+send_stream_delta for a number of common modifications.
+"""
+
+from io import BytesIO
+from optparse import OptionParser
+import os
+
+from subvertpy.delta import (
+    pack_svndiff0,
+    send_stream,
+    send_stream_delta,
+    )
+from subvertpy.tests.bench_svndiff import make_text
+from subvertpy.tests.benchmark import (
+    MB,
+    measure,
+    parse_sizes,
+    report,
+    )
+
+
+def edits(text):
+    """Yield (name, source, target) tuples for typical edits of a text."""
+    middle = len(text) // 2
+    yield "unchanged", text, text
+    yield "one byte changed", text, (
+        text[:middle] + b"X" + text[middle+1:])
+    yield "line inserted at start", text, b"a new first line\n" + text
+    yield "line inserted in middle", text, (
+        text[:middle] + b"a new line\n" + text[middle:])
+    yield "appended", text, text + b"appended text\n" * 100
+    yield "block deleted", text, text[:middle] + text[middle+4096:]
+    yield "every 1000th byte changed", text, bytes(bytearray(
+        (c ^ 1) if i % 1000 == 0 else c
+        for (i, c) in enumerate(bytearray(text))))
+    yield "rewritten", text, os.urandom(len(text))
+
+
+def delta_windows(send, *streams):
+    windows = []
+    send(*(streams + (windows.append, )))
+    return windows[:-1]
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1",
+        help="Comma-separated list of text sizes in MB [default: %default]")
+    options, args = parser.parse_args()
+
+    for size in parse_sizes(options.sizes):
+        for (kind, text) in [("text", make_text(size)),
+                             ("binary", os.urandom(size))]:
+            for (name, source, target) in edits(text):
+                label = "%s %dMB, %s" % (kind, size // MB, name)
+                fulltext = pack_svndiff0(
+                    delta_windows(send_stream, BytesIO(target)))
+                delta = pack_svndiff0(
+                    delta_windows(send_stream_delta, BytesIO(source),
+                                  BytesIO(target)))
+                print("%-50s %10d -> %10d bytes" % (
+                    label, len(fulltext), len(delta)))
+                report("  send_stream_delta", measure(
+                    delta_windows, (send_stream_delta, BytesIO(source),
+                                    BytesIO(target)), repeat=1), len(target))
+
+
+if __name__ == "__main__":
+    main()
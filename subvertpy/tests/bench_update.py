@@ -0,0 +1,163 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Throughput benchmark for receiving text deltas in an update.
+
+Commits a text and a version of it with every 100th byte changed to a
+local repository, so that the delta windows consist of thousands of
+operations, and then updates from the first to the second revision
+through RemoteAccess.do_update. The update is done once with the
+deltas applied in Python and once with them applied in C to files on
+disk, through TxDeltaTarget.
+"""
+
+from io import BytesIO
+from optparse import OptionParser
+import os
+import shutil
+import tempfile
+
+from subvertpy import (
+    delta,
+    ra,
+    repos,
+    )
+from subvertpy.tests.bench_svndiff import make_text
+from subvertpy.tests.benchmark import (
+    MB,
+    measure,
+    parse_sizes,
+    report,
+    )
+
+
+class CountingSink(object):
+
+    def __init__(self):
+        self.length = 0
+
+    def write(self, data):
+        self.length += len(data)
+
+
+class UpdateEditor(object):
+    """Editor that applies the deltas it receives to a known source text."""
+
+    def __init__(self, source):
+        self.source = source
+        self.sink = CountingSink()
+        self.windows = 0
+        self.ops = 0
+
+    def set_target_revision(self, revnum):
+        pass
+
+    def open_root(self, base_revnum=None):
+        return self
+
+    def open_file(self, path, base_revnum):
+        return self
+
+    def change_prop(self, name, value):
+        pass
+
+    def apply_textdelta(self, base_checksum=None):
+        apply_window = delta.apply_txdelta_handler(self.source, self.sink)
+
+        def handle_window(window):
+            if window is not None:
+                self.windows += 1
+                self.ops += len(window[4])
+            apply_window(window)
+        return handle_window
+
+    def close(self, checksum=None):
+        pass
+
+
+class FulltextEditor(UpdateEditor):
+    """Editor that has the deltas applied in C, from one file to another."""
+
+    def __init__(self, base_path, target_path):
+        super(FulltextEditor, self).__init__(None)
+        self.base_path = base_path
+        self.target_path = target_path
+
+    def apply_textdelta(self, base_checksum=None):
+        return ra.TxDeltaTarget(self.target_path, self.base_path)
+
+
+def commit(session, contents, source=None):
+    editor = session.get_commit_editor({"svn:log": "bench"})
+    root = editor.open_root()
+    if source is None:
+        f = root.add_file("file")
+        delta.send_stream(BytesIO(contents), f.apply_textdelta())
+    else:
+        f = root.open_file("file")
+        delta.send_stream_delta(
+            BytesIO(source), BytesIO(contents), f.apply_textdelta())
+    f.close()
+    root.close()
+    editor.close()
+
+
+def update(session, editor):
+    reporter = session.do_update(2, "", True, editor)
+    reporter.set_path("", 1, False)
+    reporter.finish()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option(
+        "--sizes", type=str, default="1,16",
+        help="Comma-separated list of text sizes in MB [default: %default]")
+    options, args = parser.parse_args()
+
+    for size in parse_sizes(options.sizes):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "repo")
+            repos.create(path)
+            session = ra.RemoteAccess(
+                "file://" + path, auth=ra.Auth([ra.get_username_provider()]))
+            source = make_text(size)
+            target = bytes(bytearray(
+                (c ^ 1) if i % 100 == 0 else c
+                for (i, c) in enumerate(bytearray(source))))
+            commit(session, source)
+            commit(session, target, source)
+            editor = UpdateEditor(source)
+            seconds = measure(update, (session, editor), repeat=1)
+            assert editor.sink.length == len(target)
+            report("update %d MB (%d windows, %d ops)" % (
+                        size // MB, editor.windows, editor.ops),
+                   seconds, len(target))
+            base_path = os.path.join(tmpdir, "base")
+            with open(base_path, "wb") as f:
+                f.write(source)
+            target_path = os.path.join(tmpdir, "target")
+            editor = FulltextEditor(base_path, target_path)
+            seconds = measure(update, (session, editor), repeat=1)
+            assert os.path.getsize(target_path) == len(target)
+            report("update %d MB to a file, applied in C" % (size // MB),
+                   seconds, len(target))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
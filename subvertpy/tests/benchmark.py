@@ -0,0 +1,64 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Helpers for the subvertpy micro-benchmarks.
+
+The benchmarks are not part of the test suite. Each of the bench_*
+modules can be run directly, e.g. ``python -m subvertpy.tests.bench_delta``.
+"""
+
+from timeit import default_timer
+
+MB = 1024 * 1024
+
+
+def measure(fn, args=(), repeat=3):
+    """Time a function.
+
+    :param fn: Function to call
+    :param args: Arguments to pass to fn
+    :param repeat: Number of times to run fn
+    :return: Best wall clock time, in seconds
+    """
+    best = None
+    for i in range(repeat):
+        start = default_timer()
+        fn(*args)
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, seconds, nbytes=None):
+    """Print the result of a benchmark.
+
+    :param name: Name of the benchmark
+    :param seconds: Time it took, in seconds
+    :param nbytes: Optional number of bytes processed
+    """
+    line = "%-50s %10.3f ms" % (name, seconds * 1000)
+    if nbytes is not None and seconds > 0:
+        line += " %10.1f MB/s" % (nbytes / float(MB) / seconds)
+    print(line)
+
+
+def parse_sizes(text):
+    """Parse a comma-separated list of sizes in megabytes.
+
+    :param text: Text to parse, e.g. "1,16,1024"
+    :return: List of sizes, in bytes
+    """
+    return [int(s) * MB for s in text.split(",") if s]
@@ -185,6 +185,17 @@ class TestClient(SubversionTestCase):
         self.assertCatEquals(b"bla", revision=1)
         self.assertCatEquals(b"blabla", revision=2)
 
+    def test_cat_raw_file(self):
+        self.build_tree({"dc/foo": b"bla"})
+        self.client.add("dc/foo")
+        self.client.log_msg_func = lambda c: "Commit"
+        self.client.commit(["dc"])
+        with open("cat", "wb", buffering=0) as f:
+            self.client.cat("dc/foo", f)
+            f.write(b"\n")
+        with open("cat", "rb") as f:
+            self.assertEqual(b"bla\n", f.read())
+
     def assertLogEntryChangedPathsEquals(self, expected, entry):
         changed_paths = entry["changed_paths"]
         self.assertIsInstance(changed_paths, dict)
@@ -15,8 +15,16 @@
 
 """Subversion core library tests."""
 
+import os
+import shutil
+import subprocess
+import sys
+
 import subvertpy
-from subvertpy.tests import TestCase
+from subvertpy.tests import (
+    TestCase,
+    TestCaseInTempDir,
+    )
 
 
 class TestCore(TestCase):
@@ -27,3 +35,52 @@ class TestCore(TestCase):
     def test_exc(self):
         self.assertTrue(
             isinstance(subvertpy.SubversionException("foo", 1), Exception))
+
+    def test_lazy_extensions(self):
+        if sys.version_info < (3, 7):
+            self.skipTest("module __getattr__ requires Python 3.7")
+        code = ("import sys, subvertpy, subvertpy.properties; "
+                "print(sorted(m for m in sys.modules "
+                "if m.startswith('subvertpy.')))")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(sys.path)
+        output = subprocess.check_output(
+            [sys.executable, "-c", code], env=env).decode("ascii")
+        self.assertEqual("['subvertpy.properties']", output.strip())
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, subvertpy, "idontexist")
+
+
+class TestStaleExtensions(TestCaseInTempDir):
+
+    def setUp(self):
+        super(TestStaleExtensions, self).setUp()
+        # A copy of the package with a stand-in client extension that is
+        # older than its source.
+        package = os.path.join(self.test_dir, "subvertpy")
+        os.mkdir(package)
+        shutil.copy(subvertpy.__file__.replace(".pyc", ".py"), package)
+        with open(os.path.join(package, "client.py"), "w") as f:
+            f.write("")
+        with open(os.path.join(package, "client.c"), "w") as f:
+            f.write("")
+        os.utime(os.path.join(package, "client.py"), (1000, 1000))
+        os.utime(os.path.join(package, "client.c"), (2000, 2000))
+
+    def import_client(self, debug):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = self.test_dir
+        env.pop("SUBVERTPY_DEBUG", None)
+        if debug:
+            env["SUBVERTPY_DEBUG"] = "1"
+        return subprocess.check_output(
+            [sys.executable, "-B", "-c", "import subvertpy.client"],
+            env=env, stderr=subprocess.STDOUT).decode("ascii")
+
+    def test_debug(self):
+        self.assertIn("subvertpy extensions are outdated",
+                      self.import_client(True))
+
+    def test_no_debug(self):
+        self.assertEqual("", self.import_client(False))
@@ -16,14 +16,30 @@
 """Tests for subvertpy.delta."""
 
 from io import BytesIO
+import mmap
+import os
+import tempfile
+import unittest
 
+from subvertpy import (
+    SubversionException,
+    delta,
+    )
 from subvertpy.delta import (
+    SVNDIFF_VERSIONS,
+    SvndiffDecoder,
     decode_length,
     encode_length,
+    pack_svndiff,
     pack_svndiff0,
     send_stream,
+    send_stream_delta,
+    svndiff_version,
+    unpack_svndiff,
     unpack_svndiff0,
+    unpack_svndiff0_view,
     apply_txdelta_handler,
+    apply_txdelta_handler_stream,
     TXDELTA_NEW, TXDELTA_SOURCE, TXDELTA_TARGET,
     )
 from subvertpy.tests import TestCase
@@ -66,6 +82,129 @@ class DeltaTests(TestCase):
         handler(None)
         self.assertEqual(result, stream.getvalue())
 
+    def apply_delta_windows(self, source, target):
+        windows = []
+        send_stream_delta(BytesIO(source), BytesIO(target), windows.append)
+        return windows
+
+    def test_apply_delta_stream(self):
+        source = os.urandom(250000)
+        target = source[:100000] + b"changed" + source[100000:]
+        stream = BytesIO()
+        source_stream = BytesIO(source)
+        handler = apply_txdelta_handler_stream(source_stream, stream)
+        for window in self.apply_delta_windows(source, target):
+            handler(window)
+        self.assertEqual(target, stream.getvalue())
+
+    def test_apply_delta_mmap(self):
+        source = os.urandom(250000)
+        target = source[:100000] + b"changed" + source[100000:]
+        with tempfile.TemporaryFile() as f:
+            f.write(source)
+            f.flush()
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                stream = BytesIO()
+                handler = apply_txdelta_handler(m, stream)
+                for window in self.apply_delta_windows(source, target):
+                    handler(window)
+            finally:
+                m.close()
+        self.assertEqual(target, stream.getvalue())
+
+
+class SendStreamDeltaTests(TestCase):
+
+    def apply_windows(self, source, windows):
+        stream = BytesIO()
+        handler = apply_txdelta_handler(source, stream)
+        for window in windows:
+            handler(window)
+        handler(None)
+        return stream.getvalue()
+
+    def send_delta(self, source, target):
+        windows = []
+        send_stream_delta(BytesIO(source), BytesIO(target), windows.append)
+        self.assertEqual(None, windows[-1])
+        windows = windows[:-1]
+        self.assertEqual(target, self.apply_windows(source, windows))
+        # The windows survive being encoded as svndiff
+        for version in SVNDIFF_VERSIONS:
+            text = pack_svndiff(windows, version)
+            self.assertEqual(
+                target, self.apply_windows(source, unpack_svndiff(text)))
+            decoded = []
+            decoder = SvndiffDecoder(decoded.append)
+            decoder.feed(text)
+            decoder.close()
+            self.assertEqual(
+                target, self.apply_windows(source, decoded[:-1]))
+        text = pack_svndiff0(windows)
+        self.assertEqual(
+            target, self.apply_windows(source, unpack_svndiff0(text)))
+        self.assertEqual(
+            target, self.apply_windows(source, unpack_svndiff0_view(text)))
+        return windows
+
+    def new_data_len(self, windows):
+        return sum(len(window[5]) for window in windows)
+
+    def test_empty(self):
+        self.assertEqual([], self.send_delta(b"", b""))
+
+    def test_no_source(self):
+        windows = self.send_delta(b"", b"foo")
+        self.assertEqual([(0, 0, 3, 0, [(TXDELTA_NEW, 0, 3)], b"foo")],
+                         windows)
+
+    def test_unchanged(self):
+        text = os.urandom(300000)
+        windows = self.send_delta(text, text)
+        self.assertEqual(0, self.new_data_len(windows))
+        self.assertEqual(3, len(windows))
+
+    def test_one_byte_changed(self):
+        source = os.urandom(200000)
+        target = source[:1000] + b"x" + source[1001:]
+        windows = self.send_delta(source, target)
+        self.assertTrue(self.new_data_len(windows) < 200)
+
+    def test_insert(self):
+        source = b"".join(b"line %d\n" % i for i in range(20000))
+        target = source[:5000] + b"inserted\n" + source[5000:]
+        windows = self.send_delta(source, target)
+        self.assertTrue(self.new_data_len(windows) < 1000)
+
+    def test_several_changes(self):
+        source = b"".join(b"line %d\n" % i for i in range(2000))
+        target = source.replace(b"line 5", b"changed 5")
+        windows = self.send_delta(source, target)
+        self.assertTrue(
+            len([op for op in windows[0][4] if op[0] == TXDELTA_NEW]) > 1)
+
+    def test_target_copy(self):
+        windows = self.send_delta(b"", b"\0" * 10000)
+        self.assertEqual(
+            [(TXDELTA_NEW, 0, 1), (TXDELTA_TARGET, 0, 9999)], windows[0][4])
+
+    def test_unrelated(self):
+        target = os.urandom(300000)
+        windows = self.send_delta(os.urandom(300000), target)
+        self.assertEqual(len(target), self.new_data_len(windows))
+
+    def test_copy_after_unrelated(self):
+        # The copy is found even though unmatched data is being skipped
+        # by the time it starts
+        source = os.urandom(100000)
+        # The byte before the copy must not extend it backwards
+        unrelated = bytearray(os.urandom(50000))
+        unrelated[-1] = bytearray(source)[10022] ^ 1
+        target = bytes(unrelated) + source[10023:30000]
+        windows = self.send_delta(source, target)
+        self.assertEqual(50000, self.new_data_len(windows))
+
 
 class MarshallTests(TestCase):
 
@@ -80,3 +219,177 @@ class MarshallTests(TestCase):
         self.assertEqual(
             [mywindow],
             list(unpack_svndiff0(pack_svndiff0([mywindow]))))
+
+    def test_unpack_view(self):
+        text = pack_svndiff0([(0, 0, 3, 1, [(2, 0, 3)], b'foo'),
+                              (0, 3, 4, 1, [(0, 0, 3), (2, 0, 1)], b'x')])
+        windows = list(unpack_svndiff0_view(text))
+        self.assertEqual(2, len(windows))
+        self.assertIsInstance(windows[0][5], memoryview)
+        self.assertIs(text, windows[0][5].obj)
+        self.assertEqual(
+            (0, 0, 3, 1, [(2, 0, 3)], b'foo'),
+            windows[0][:5] + (windows[0][5].tobytes(), ))
+        self.assertEqual(
+            (0, 3, 4, 2, [(0, 0, 3), (2, 0, 1)], b'x'),
+            windows[1][:5] + (windows[1][5].tobytes(), ))
+
+
+class CompressedSvndiffTests(TestCase):
+
+    windows = [
+        (0, 0, 4000, 2, [(TXDELTA_NEW, 0, 1000), (TXDELTA_TARGET, 0, 3000)],
+         b"abcdefghij" * 100),
+        (0, 3, 4, 2, [(TXDELTA_SOURCE, 0, 3), (TXDELTA_NEW, 0, 1)], b"x"),
+        ]
+
+    def _test_roundtrip(self, version):
+        text = pack_svndiff(self.windows, version)
+        self.assertEqual(version, svndiff_version(text[:4]))
+        self.assertEqual(self.windows, list(unpack_svndiff(text)))
+        return text
+
+    def test_roundtrip_svndiff0(self):
+        self._test_roundtrip(0)
+
+    def test_roundtrip_svndiff1(self):
+        text = self._test_roundtrip(1)
+        self.assertTrue(len(text) < len(pack_svndiff0(self.windows)))
+
+    @unittest.skipIf(2 not in SVNDIFF_VERSIONS, "lz4 not available")
+    def test_roundtrip_svndiff2(self):
+        text = self._test_roundtrip(2)
+        self.assertTrue(len(text) < len(pack_svndiff0(self.windows)))
+
+    def test_decoder_svndiff1(self):
+        text = pack_svndiff(self.windows, 1)
+        windows = []
+        decoder = SvndiffDecoder(windows.append)
+        for i in range(0, len(text), 7):
+            decoder.feed(text[i:i+7])
+        decoder.close()
+        self.assertEqual(1, decoder.version)
+        self.assertEqual(self.windows + [None], windows)
+
+    def test_invalid_version(self):
+        self.assertRaises(SubversionException, svndiff_version, b"SVN\x09")
+
+
+class SvndiffDecoderTests(TestCase):
+
+    def setUp(self):
+        super(SvndiffDecoderTests, self).setUp()
+        self.windows = []
+        self.decoder = SvndiffDecoder(self.windows.append)
+        self.text = pack_svndiff0(
+            [(0, 0, 3, 1, [(2, 0, 3)], b'foo'),
+             (0, 3, 4, 1, [(0, 0, 3), (2, 0, 1)], b'x')])
+
+    def test_feed_all(self):
+        self.decoder.feed(self.text)
+        self.decoder.close()
+        self.assertEqual(list(unpack_svndiff0(self.text)) + [None],
+                         self.windows)
+
+    def test_feed_bytewise(self):
+        for i in range(len(self.text)):
+            self.decoder.feed(self.text[i:i+1])
+            if i == 12:
+                # The first window is complete after 13 bytes.
+                self.assertEqual(1, len(self.windows))
+        self.decoder.close()
+        self.assertEqual(list(unpack_svndiff0(self.text)) + [None],
+                         self.windows)
+
+    def test_close_incomplete(self):
+        self.decoder.feed(self.text[:-1])
+        self.assertRaises(SubversionException, self.decoder.close)
+        self.assertEqual(1, len(self.windows))
+
+    def test_invalid_header(self):
+        self.assertRaises(SubversionException, self.decoder.feed, b"XYZ\0")
+
+
+try:
+    from subvertpy import _delta
+except ImportError:
+    _delta = None
+
+
+class SvndiffImplementationTests(object):
+    """Tests run against both the Python and C svndiff implementations."""
+
+    def test_roundtrip_window(self):
+        mywindow = (0, 0, 3, 1, [(2, 0, 3)], b'foo')
+        self.assertEqual(
+            [mywindow],
+            list(self.unpack_svndiff0(self.pack_svndiff0([mywindow]))))
+
+    def test_roundtrip_large_window(self):
+        new = bytes(bytearray(range(256))) * 400
+        mywindow = (70000, 300, len(new) + 500, 3,
+                    [(TXDELTA_NEW, 0, len(new)),
+                     (TXDELTA_SOURCE, 200, 100),
+                     (TXDELTA_TARGET, 10, 400)], new)
+        self.assertEqual(
+            [mywindow, mywindow],
+            list(self.unpack_svndiff0(
+                self.pack_svndiff0([mywindow, mywindow]))))
+
+    def test_roundtrip_multiple_new(self):
+        mywindow = (0, 5, 10, 3,
+                    [(TXDELTA_NEW, 0, 3), (TXDELTA_SOURCE, 0, 5),
+                     (TXDELTA_NEW, 3, 2)], b'fooba')
+        self.assertEqual(
+            [mywindow],
+            list(self.unpack_svndiff0(self.pack_svndiff0([mywindow]))))
+
+    def test_pack_window(self):
+        self.assertEqual(
+            bytearray(b"\x00\x00\x03\x01\x03\x83foo"),
+            self.pack_svndiff0_window((0, 0, 3, 1, [(2, 0, 3)], b'foo')))
+
+    def test_apply_ops(self):
+        self.assertEqual(
+            bytearray(b"(new)source(new)sou"),
+            self.txdelta_apply_ops(
+                0, [(TXDELTA_NEW, 0, 5), (TXDELTA_SOURCE, 1, 6),
+                    (TXDELTA_TARGET, 0, 8)], b"(new)", b"(source)"))
+
+    def test_apply_ops_target_overlap(self):
+        self.assertEqual(
+            bytearray(b"ab" + b"cde" * 1000 + b"cd"),
+            self.txdelta_apply_ops(
+                0, [(TXDELTA_NEW, 0, 5), (TXDELTA_TARGET, 2, 2999)],
+                b"abcde", b""))
+
+    def test_apply_ops_invalid_target_copy(self):
+        self.assertRaises(
+            IndexError, self.txdelta_apply_ops, 0,
+            [(TXDELTA_NEW, 0, 1), (TXDELTA_TARGET, 1, 1)], b"a", b"")
+
+
+class PythonSvndiffTests(TestCase, SvndiffImplementationTests):
+
+    pack_svndiff0 = staticmethod(delta._pack_svndiff0_py)
+    pack_svndiff0_window = staticmethod(delta._pack_svndiff0_window_py)
+    unpack_svndiff0 = staticmethod(delta._unpack_svndiff0_py)
+    txdelta_apply_ops = staticmethod(delta._txdelta_apply_ops_py)
+
+
+@unittest.skipIf(_delta is None, "_delta extension not available")
+class CSvndiffTests(TestCase, SvndiffImplementationTests):
+
+    def setUp(self):
+        super(CSvndiffTests, self).setUp()
+        self.pack_svndiff0 = _delta.pack_svndiff0
+        self.pack_svndiff0_window = _delta.pack_svndiff0_window
+        self.unpack_svndiff0 = _delta.unpack_svndiff0
+        self.txdelta_apply_ops = _delta.txdelta_apply_ops
+
+    def test_unpack_truncated(self):
+        text = delta._pack_svndiff0_py([(0, 0, 3, 1, [(2, 0, 3)], b'foo')])
+        self.assertRaises(ValueError, list, _delta.unpack_svndiff0(text[:-1]))
+
+    def test_unpack_bad_header(self):
+        self.assertRaises(ValueError, _delta.unpack_svndiff0, b"XYZ\0")
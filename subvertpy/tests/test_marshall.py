@@ -16,8 +16,15 @@
 
 """Tests for subvertpy.marshall."""
 
+import unittest
+
 from subvertpy.marshall import (
     MarshallError,
+    NeedMoreData,
+    Unmarshaller,
+    _marshall_py,
+    _read_item_py,
+    _unmarshall_py,
     literal,
     marshall,
     unmarshall,
@@ -39,6 +46,11 @@ class TestMarshalling(TestCase):
         line = literal("foo bar")
         self.assertEqual("foo bar", line.__repr__())
 
+    def test_literal_eq_str(self):
+        self.assertEqual(literal("foo"), "foo")
+        self.assertNotEqual(literal("foo"), "bar")
+        self.assertIn("foo", [literal("foo")])
+
     def test_marshall_error(self):
         err = MarshallError("bla bla")
         self.assertEqual("bla bla", err.__str__())
@@ -93,3 +105,153 @@ class TestMarshalling(TestCase):
 
     def test_unmarshall_open_list(self):
         self.assertRaises(MarshallError, unmarshall, b"( 3 4 ")
+
+
+class TestUnmarshaller(TestCase):
+
+    def test_read_empty(self):
+        u = Unmarshaller()
+        self.assertRaises(NeedMoreData, u.read_item)
+
+    def test_read_items(self):
+        u = Unmarshaller()
+        u.feed(b"( success ( 2 5:bla l ( ) ) ) 42 x ")
+        self.assertEqual(
+            [[literal("success"), [2, b"bla l", []]], 42, literal("x")],
+            list(u.read_items()))
+        self.assertRaises(NeedMoreData, u.read_item)
+
+    def test_read_bytewise(self):
+        data = marshall([literal("done"), [1, b"some ( text )", []]]) * 2
+        u = Unmarshaller()
+        items = []
+        for i in range(len(data)):
+            u.feed(data[i:i+1])
+            items.extend(u.read_items())
+        self.assertEqual(
+            [[literal("done"), [1, b"some ( text )", []]]] * 2, items)
+
+    def test_string_incomplete(self):
+        u = Unmarshaller()
+        u.feed(b"5:bla")
+        self.assertRaises(NeedMoreData, u.read_item)
+        u.feed(b" l ")
+        self.assertEqual(b"bla l", u.read_item())
+
+    def test_list_incomplete(self):
+        u = Unmarshaller()
+        u.feed(b"( 3 4 ")
+        self.assertRaises(NeedMoreData, u.read_item)
+        u.feed(b") ")
+        self.assertEqual([3, 4], u.read_item())
+
+    def test_number_needs_terminator(self):
+        u = Unmarshaller()
+        u.feed(b"12")
+        self.assertRaises(NeedMoreData, u.read_item)
+        u.feed(b"3 ")
+        self.assertEqual(123, u.read_item())
+
+    def test_nospace(self):
+        u = Unmarshaller()
+        u.feed(b"(3 ")
+        self.assertRaises(MarshallError, u.read_item)
+
+    def test_string_nospace(self):
+        u = Unmarshaller()
+        u.feed(b"3:blaX")
+        self.assertRaises(MarshallError, u.read_item)
+
+    def test_invalid_character(self):
+        u = Unmarshaller()
+        u.feed(b":-3213 ")
+        self.assertRaises(MarshallError, u.read_item)
+
+    def test_unexpected_close(self):
+        u = Unmarshaller()
+        u.feed(b") ")
+        self.assertRaises(MarshallError, u.read_item)
+
+
+try:
+    from subvertpy import _marshall
+except ImportError:
+    _marshall = None
+
+
+class MarshallImplementationTests(object):
+    """Tests run against both the Python and C marshall implementations."""
+
+    def test_marshall_nested(self):
+        self.assertEqual(
+            b"( success ( 2 3:abc ( ) 12345678901234567890 ) ) ",
+            self.marshall([literal("success"),
+                           (2, b"abc", [], 12345678901234567890)]))
+
+    def test_marshall_unicode(self):
+        self.assertEqual(b"2:\xc3\xa9 ", self.marshall(u"\xe9"))
+
+    def test_marshall_invalid(self):
+        self.assertRaises(MarshallError, self.marshall, None)
+        self.assertRaises(MarshallError, self.marshall, [1, {}])
+
+    def test_unmarshall_roundtrip(self):
+        item = [literal("log-entry"), [b"x" * 1000, 42, [literal("a-b2")]]]
+        self.assertEqual((b"5 ", item),
+                         self.unmarshall(self.marshall(item) + b"5 "))
+
+    def test_unmarshall_string_without_space(self):
+        self.assertEqual((b"", b"bla l"), self.unmarshall(b"5:bla l"))
+
+    def test_unmarshall_bytearray(self):
+        (rest, item) = self.unmarshall(bytearray(b"3:abc 4 "))
+        self.assertEqual(bytearray(b"abc"), item)
+        self.assertIsInstance(item, bytearray)
+        self.assertEqual(bytearray(b"4 "), rest)
+
+    def test_unmarshall_incomplete(self):
+        for text in [b"", b"(", b"( 3 4 ", b"12", b"5:abc", b"( a ) "[:5]]:
+            self.assertRaises(NeedMoreData, self.unmarshall, text)
+
+    def test_unmarshall_invalid(self):
+        for text in [b"(3 ", b"3x ", b"abc:", b"( 3 )x", b"%", b"nospace"]:
+            self.assertRaises(MarshallError, self.unmarshall, text)
+
+    def test_read_item(self):
+        data = b"( success ( 1 3:a b ) ) x "
+        stack = []
+        self.assertEqual((24, [literal("success"), [1, b"a b"]]),
+                         self.read_item(data, 0, stack))
+        self.assertEqual((26, literal("x")),
+                         self.read_item(data, 24, stack))
+        self.assertEqual((26, None), self.read_item(data, 26, stack))
+        self.assertEqual([], stack)
+
+    def test_read_item_partial(self):
+        stack = []
+        self.assertEqual((12, None),
+                         self.read_item(b"( ( 1 2 ) 3 4:ab", 0, stack))
+        self.assertEqual([[[1, 2], 3]], stack)
+        self.assertEqual((9, [[1, 2], 3, b"abcd"]),
+                         self.read_item(b"4:abcd ) ", 0, stack))
+
+    def test_read_item_invalid(self):
+        for text in [b") ", b"(x ", b"3:abcX", b"12a ", b"%"]:
+            self.assertRaises(MarshallError, self.read_item, text, 0, [])
+
+
+class PythonMarshallTests(TestCase, MarshallImplementationTests):
+
+    marshall = staticmethod(_marshall_py)
+    unmarshall = staticmethod(_unmarshall_py)
+    read_item = staticmethod(_read_item_py)
+
+
+@unittest.skipIf(_marshall is None, "_marshall extension not available")
+class CMarshallTests(TestCase, MarshallImplementationTests):
+
+    def setUp(self):
+        super(CMarshallTests, self).setUp()
+        self.marshall = _marshall.marshall
+        self.unmarshall = _marshall.unmarshall
+        self.read_item = _marshall.read_item
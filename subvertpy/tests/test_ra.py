@@ -15,11 +15,15 @@
 
 """Subversion ra library tests."""
 
+import hashlib
 from io import BytesIO
+import sys
+import threading
 
 from subvertpy import (
     NODE_DIR, NODE_NONE, NODE_UNKNOWN,
     SubversionException,
+    delta,
     ra,
     )
 from subvertpy.tests import (
@@ -123,6 +127,56 @@ class TestRemoteAccess(SubversionTestCase):
     def test_rev_proplist(self):
         self.assertIsInstance(self.ra.rev_proplist(0), dict)
 
+    def test_iter_log_max_queue_size(self):
+        for i in range(5):
+            dc = self.get_commit_editor(self.repos_url)
+            dc.add_dir("foo%d" % i)
+            dc.close()
+        it = self.ra.iter_log(None, 0, 5, max_queue_size=2)
+        self.assertEqual(2, it.max_queue_size)
+        self.assertEqual(list(range(6)), [entry[1] for entry in it])
+        self.assertEqual(0, it.queue_size)
+        self.assertTrue(0 < it.peak_queue_size <= 2)
+
+    def test_iter_log_abandoned(self):
+        for i in range(5):
+            dc = self.get_commit_editor(self.repos_url)
+            dc.add_dir("foo%d" % i)
+            dc.close()
+        it = self.ra.iter_log(None, 0, 5, max_queue_size=1)
+        self.assertEqual(0, next(it)[1])
+        # Dropping the iterator stops the thread that is waiting for room
+        del it
+        self.assertEqual(5, self.ra.get_latest_revnum())
+
+    def test_iter_log_negative_max_queue_size(self):
+        self.assertRaises(ValueError, self.ra.iter_log, None, 0, 0,
+                          max_queue_size=-1)
+
+    def test_rev_proplist_range(self):
+        self.do_commit()
+        returned = list(self.ra.rev_proplist_range(0, 1))
+        self.assertEqual([0, 1], [revnum for (revnum, props) in returned])
+        self.assertEqual(self.ra.rev_proplist(1), returned[1][1])
+
+    def test_rev_proplist_range_names(self):
+        self.do_commit()
+        returned = list(self.ra.rev_proplist_range(1, 0, ["svn:author"]))
+        self.assertEqual([1, 0], [revnum for (revnum, props) in returned])
+        self.assertEqual(["svn:author"], list(returned[0][1].keys()))
+
+    def test_rev_proplist_range_subdir(self):
+        self.do_commit()
+        cb = self.commit_editor()
+        cb.add_dir("bar")
+        cb.close()
+        subdir = ra.RemoteAccess(
+            self.repos_url + "/foo",
+            auth=ra.Auth([ra.get_username_provider()]))
+        returned = list(subdir.rev_proplist_range(0, 2, ["svn:log"]))
+        self.assertEqual([0, 1, 2], [revnum for (revnum, props) in returned])
+        self.assertEqual(self.repos_url + "/foo", subdir.get_session_url())
+
     def test_do_diff(self):
         self.do_commit()
 
@@ -371,6 +425,216 @@ class TestRemoteAccess(SubversionTestCase):
         stream.seek(0)
         self.assertEqual(b"a", stream.read())
 
+    def test_get_file_raw_file(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents\n" * 1000)
+        cb.close()
+
+        with open("fulltext", "wb", buffering=0) as f:
+            self.ra.get_file("bar", f, 1)
+            self.assertEqual(9000, f.tell())
+        with open("fulltext", "rb") as f:
+            self.assertEqual(b"contents\n" * 1000, f.read())
+
+    def test_get_file_bytes(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"a")
+        cb.close()
+
+        chunks = []
+
+        class Stream(object):
+
+            def write(self, data):
+                chunks.append(data)
+
+        self.ra.get_file("bar", Stream(), 1)
+        # write() gets bytes that it can keep a reference to
+        self.assertIsInstance(chunks[0], bytes)
+        self.assertEqual(b"a", b"".join(chunks))
+
+    def test_commit_bytearray(self):
+        editor = self.ra.get_commit_editor({"svn:log": "foo"})
+        root = editor.open_root()
+        f = root.add_file("bar")
+        handler = f.apply_textdelta()
+        handler((0, 0, 5, 0, [(delta.TXDELTA_NEW, 0, 5)], bytearray(b"hello")))
+        handler(None)
+        f.close()
+        root.close()
+        editor.close()
+
+        stream = BytesIO()
+        self.ra.get_file("bar", stream, 1)
+        self.assertEqual(b"hello", stream.getvalue())
+
+    def test_txdelta_windows(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents\n" * 1000)
+        cb.close()
+
+        windows = []
+
+        class MyFileEditor:
+
+            def apply_textdelta(self, base_checksum=None):
+                return windows.append
+
+            def change_prop(self, name, val): pass
+
+            def close(self, checksum=None): pass
+
+        class MyDirEditor:
+
+            def change_prop(self, name, val): pass
+
+            def add_file(self, *args): return MyFileEditor()
+
+            def close(self): pass
+
+        class MyEditor:
+
+            def open_root(self, base_rev=None): return MyDirEditor()
+
+            def close(self): pass
+
+        self.ra.replay(1, 0, MyEditor())
+        self.assertIs(None, windows[-1])
+        window = windows[0]
+        self.assertIsInstance(window, ra.TxDeltaWindow)
+        (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
+        self.assertIsInstance(ops, list)
+        self.assertIsInstance(new_data, bytes)
+        self.assertEqual(len(ops), window.num_ops)
+        self.assertEqual(ops, list(window.ops))
+        self.assertEqual(new_data, bytes(window.new_data))
+        self.assertEqual(new_data, bytes(memoryview(window)))
+        self.assertEqual(window, window[:5] + (new_data, ))
+        self.assertEqual(window, tuple(window))
+        self.assertEqual(b"contents\n" * 1000,
+                         bytes(delta.apply_txdelta_window(b"", window)))
+
+    def replay_to_targets(self, revnum, make_target):
+        digests = {}
+
+        class MyFileEditor:
+
+            def __init__(self, path):
+                self.path = path
+
+            def apply_textdelta(self, base_checksum=None):
+                return make_target(
+                    self.path, lambda digest: digests.__setitem__(
+                        self.path, digest))
+
+            def change_prop(self, name, val): pass
+
+            def close(self, checksum=None): pass
+
+        class MyDirEditor:
+
+            def change_prop(self, name, val): pass
+
+            def add_file(self, path, *args): return MyFileEditor(path)
+
+            def open_file(self, path, *args): return MyFileEditor(path)
+
+            def close(self): pass
+
+        class MyEditor:
+
+            def open_root(self, base_rev=None): return MyDirEditor()
+
+            def close(self): pass
+
+        self.ra.replay(revnum, 0, MyEditor())
+        return digests
+
+    def test_txdelta_target_path(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents\n" * 1000)
+        cb.close()
+
+        digests = self.replay_to_targets(
+            1, lambda path, callback: ra.TxDeltaTarget(
+                "fulltext", callback=callback))
+        with open("fulltext", "rb") as f:
+            self.assertEqual(b"contents\n" * 1000, f.read())
+        self.assertEqual(
+            {"bar": hashlib.md5(b"contents\n" * 1000).hexdigest()}, digests)
+
+    def test_txdelta_target_base(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents\n" * 1000)
+        cb.close()
+        cb = self.commit_editor()
+        cb.open_file("bar").modify(b"contents\n" * 999 + b"changed\n")
+        cb.close()
+
+        with open("base", "wb") as f:
+            f.write(b"contents\n" * 1000)
+        self.replay_to_targets(
+            2, lambda path, callback: ra.TxDeltaTarget(
+                "fulltext", "base", callback))
+        with open("fulltext", "rb") as f:
+            self.assertEqual(b"contents\n" * 999 + b"changed\n", f.read())
+
+    def test_txdelta_target_stream(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents\n")
+        cb.close()
+
+        class Target(object):
+
+            def __init__(self):
+                self.chunks = []
+                self.closed = False
+
+            def write(self, data):
+                self.chunks.append(data)
+
+            def close(self):
+                self.closed = True
+
+        target = Target()
+        self.replay_to_targets(
+            1, lambda path, callback: ra.TxDeltaTarget(target))
+        self.assertEqual(b"contents\n", b"".join(target.chunks))
+        self.assertTrue(target.closed)
+
+    def test_txdelta_target_call(self):
+        digests = []
+        with open("fulltext", "wb") as f:
+            target = ra.TxDeltaTarget(f.fileno(), callback=digests.append)
+            target((0, 0, 5, 0, [(delta.TXDELTA_NEW, 0, 5)], b"hello"))
+            target(None)
+        with open("fulltext", "rb") as f:
+            self.assertEqual(b"hello", f.read())
+        self.assertEqual([hashlib.md5(b"hello").hexdigest()], digests)
+
+    def test_txdelta_target_call_keyword(self):
+        digests = []
+        target = ra.TxDeltaTarget("fulltext", callback=digests.append)
+        for text in [b"hello", b"world"]:
+            target(window=(0, 0, 5, 0, [(delta.TXDELTA_NEW, 0, 5)], text))
+            target(window=None)
+            with open("fulltext", "rb") as f:
+                self.assertEqual(text, f.read())
+        self.assertEqual([hashlib.md5(b"hello").hexdigest(),
+                          hashlib.md5(b"world").hexdigest()], digests)
+
+    def test_txdelta_target_abandoned(self):
+        def callback(digest):
+            pass
+        refcount = sys.getrefcount(callback)
+        target = ra.TxDeltaTarget("fulltext", callback=callback)
+        target((0, 0, 5, 0, [(delta.TXDELTA_NEW, 0, 5)], b"hello"))
+        del target
+        self.assertEqual(refcount, sys.getrefcount(callback))
+
+    def test_txdelta_target_none(self):
+        self.assertRaises(TypeError, ra.TxDeltaTarget, None)
+
     def test_get_locations_root(self):
         self.assertEqual({0: "/"}, self.ra.get_locations("", 0, [0]))
 
@@ -502,3 +766,168 @@ class AuthTests(TestCase):
 
     def test_platform_auth_providers(self):
         ra.Auth(ra.get_platform_specific_client_providers())
+
+
+class FakeSession(object):
+    """Minimal stand-in for RemoteAccess, for testing SessionPool."""
+
+    def __init__(self, url, root):
+        self.url = url
+        self.root = root
+        self.closed = False
+        self.broken = False
+        self.busy = False
+        self.reparented = []
+
+    def get_repos_root(self):
+        return self.root
+
+    def get_latest_revnum(self):
+        if self.broken:
+            raise SubversionException("Connection closed", 210002)
+        return 0
+
+    def reparent(self, url):
+        self.reparented.append(url)
+        self.url = url
+
+    def close(self):
+        self.closed = True
+
+
+class SessionPoolTests(TestCase):
+
+    def setUp(self):
+        super(SessionPoolTests, self).setUp()
+        self.opened = []
+
+    def factory(self, url):
+        root = "/".join(url.split("/")[:4])
+        session = FakeSession(url, root)
+        self.opened.append(session)
+        return session
+
+    def make_pool(self, **kwargs):
+        return ra.SessionPool(factory=self.factory, **kwargs)
+
+    def test_reuse_same_repository(self):
+        pool = self.make_pool()
+        session = pool.get("svn://example.com/repo/trunk")
+        pool.put(session)
+        self.assertIs(session, pool.get("svn://example.com/repo/branches"))
+        self.assertEqual(["svn://example.com/repo/branches"],
+                         session.reparented)
+        self.assertEqual((1, 1), (pool.hits, pool.misses))
+
+    def test_no_reparent_for_same_url(self):
+        pool = self.make_pool()
+        session = pool.get("svn://example.com/repo")
+        pool.put(session)
+        self.assertIs(session, pool.get(b"svn://example.com/repo"))
+        self.assertEqual([], session.reparented)
+
+    def test_other_repository(self):
+        pool = self.make_pool()
+        session = pool.get("svn://example.com/repo/trunk")
+        pool.put(session)
+        other = pool.get("svn://example.com/repo2/trunk")
+        self.assertIsNot(session, other)
+        self.assertEqual(1, pool.idle_count)
+
+    def test_in_use_not_shared(self):
+        pool = self.make_pool()
+        session = pool.get("svn://example.com/repo")
+        self.assertIsNot(session, pool.get("svn://example.com/repo"))
+
+    def test_lru_eviction(self):
+        pool = self.make_pool(max_idle=2)
+        sessions = [pool.get("svn://example.com/repo%d" % i)
+                    for i in range(3)]
+        for session in sessions:
+            pool.put(session)
+        self.assertEqual(2, pool.idle_count)
+        self.assertEqual([True, False, False],
+                         [session.closed for session in sessions])
+
+    def test_age_eviction(self):
+        pool = self.make_pool(max_age=0)
+        session = pool.get("svn://example.com/repo")
+        pool.put(session)
+        self.assertTrue(session.closed)
+        self.assertEqual(0, pool.idle_count)
+
+    def test_prune(self):
+        pool = self.make_pool(max_age=60)
+        session = pool.get("svn://example.com/repo")
+        pool.put(session)
+        pool.max_age = 0
+        pool.prune()
+        self.assertTrue(session.closed)
+        self.assertEqual(0, pool.idle_count)
+
+    def test_health_check(self):
+        pool = self.make_pool(check_interval=0)
+        session = pool.get("svn://example.com/repo")
+        pool.put(session)
+        session.broken = True
+        other = pool.get("svn://example.com/repo")
+        self.assertIsNot(session, other)
+        self.assertTrue(session.closed)
+
+    def test_busy_session_discarded(self):
+        pool = self.make_pool()
+        session = pool.get("svn://example.com/repo")
+        session.busy = True
+        pool.put(session)
+        self.assertTrue(session.closed)
+        self.assertEqual(0, pool.idle_count)
+
+    def test_session_context(self):
+        pool = self.make_pool()
+        with pool.session("svn://example.com/repo") as session:
+            pass
+        self.assertEqual(1, pool.idle_count)
+        try:
+            with pool.session("svn://example.com/repo") as session:
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertTrue(session.closed)
+        self.assertEqual(0, pool.idle_count)
+
+    def test_threads(self):
+        pool = self.make_pool(max_idle=4)
+        errors = []
+
+        def work():
+            try:
+                for i in range(100):
+                    with pool.session("svn://example.com/repo/%d" % i) as s:
+                        self.assertFalse(s.busy)
+                        s.busy = True
+                        s.busy = False
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertTrue(len(self.opened) <= 4)
+
+
+class SessionPoolRemoteAccessTests(SubversionTestCase):
+
+    def test_reparent(self):
+        repos_url = self.make_repository("d")
+        dc = self.get_commit_editor(repos_url)
+        dc.add_dir("foo")
+        dc.close()
+        pool = ra.SessionPool(auth=ra.Auth([ra.get_username_provider()]))
+        with pool.session(repos_url) as session:
+            self.assertEqual(1, session.get_latest_revnum())
+        with pool.session(repos_url + "/foo") as session:
+            self.assertEqual(repos_url + "/foo", session.url)
+            self.assertEqual(NODE_NONE, session.check_path("bar", 1))
+        self.assertEqual(1, pool.misses)
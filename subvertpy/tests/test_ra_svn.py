@@ -0,0 +1,864 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the pure-Python svn:// client and server."""
+
+from io import BytesIO
+import os
+import socket
+import threading
+import time
+
+from subvertpy import (
+    ERR_FS_NO_SUCH_REVISION,
+    ERR_FS_NOT_FOUND,
+    ERR_RA_CANNOT_CREATE_SESSION,
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    NODE_DIR,
+    NODE_FILE,
+    NODE_NONE,
+    SubversionException,
+    delta,
+    properties,
+    )
+from subvertpy.marshall import (
+    literal,
+    marshall,
+    )
+from subvertpy.ra_svn import (
+    FILE_CHUNK_SIZE,
+    SEND_BUFFER_SIZE,
+    ControlMasterSSHVendor,
+    SSHVendor,
+    SVNClient,
+    SVNConnection,
+    SVNServer,
+    TCPSVNServer,
+    ThreadingTCPSVNServer,
+    )
+from subvertpy.server import (
+    ServerBackend,
+    ServerRepositoryBackend,
+    )
+from subvertpy.tests import TestCase
+
+
+class MemoryRepositoryBackend(ServerRepositoryBackend):
+    """Repository backend that serves a list of revisions from memory.
+
+    :param revisions: List of (author, date, message, changed_paths)
+        tuples, one for each revision after revision 0.
+    :param files: Dictionary mapping paths to file contents, either as
+        bytestrings or as functions that open a stream.
+    """
+
+    def __init__(self, revisions=None, uuid="memory", files=None):
+        self.revisions = [(None, None, None, {})]
+        if revisions is not None:
+            self.revisions.extend(revisions)
+        self.uuid = uuid
+        self.files = files or {}
+
+    def get_uuid(self):
+        return self.uuid
+
+    def get_latest_revnum(self):
+        return len(self.revisions) - 1
+
+    def log(self, send_revision, target_path, start_rev, end_rev,
+            changed_paths, strict_node, limit):
+        if start_rev is None:
+            start_rev = self.get_latest_revnum()
+        if end_rev is None:
+            end_rev = self.get_latest_revnum()
+        if start_rev <= end_rev:
+            revnums = range(start_rev, end_rev + 1)
+        else:
+            revnums = range(start_rev, end_rev - 1, -1)
+        for i, revnum in enumerate(revnums):
+            if limit and i == limit:
+                break
+            (author, date, message, paths) = self.revisions[revnum]
+            send_revision(revnum, author, date, message, paths)
+
+    def _check_revnum(self, revnum):
+        if revnum is None:
+            return self.get_latest_revnum()
+        if revnum < 0 or revnum >= len(self.revisions):
+            raise SubversionException(
+                "No such revision %d" % revnum, ERR_FS_NO_SUCH_REVISION)
+        return revnum
+
+    def _last_changed(self, path, revnum):
+        path = path.strip(b"/")
+        for i in range(revnum, 0, -1):
+            for p in self.revisions[i][3]:
+                if p.strip(b"/") == path:
+                    return i
+        return None
+
+    def check_path(self, path, revnum):
+        revnum = self._check_revnum(revnum)
+        if path.strip(b"/") == b"":
+            return NODE_DIR
+        if self._last_changed(path, revnum) is not None:
+            return NODE_FILE
+        return NODE_NONE
+
+    def stat(self, path, revnum):
+        revnum = self._check_revnum(revnum)
+        created_rev = self._last_changed(path, revnum)
+        if created_rev is None:
+            return None
+        (author, date, message, paths) = self.revisions[created_rev]
+        return {"name": path.rsplit(b"/", 1)[-1], "kind": "file",
+                "size": 0, "has-props": False, "created-rev": created_rev,
+                "created-date": date, "last-author": author}
+
+    def get_file(self, path, revnum, want_props=True, want_contents=True):
+        revnum = self._check_revnum(revnum)
+        path = path.strip(b"/")
+        if path not in self.files:
+            raise SubversionException(
+                "File not found: %r" % path, ERR_FS_NOT_FOUND)
+        return (revnum, {b"svn:eol-style": b"native"}, self._open(path))
+
+    def _open(self, path):
+        contents = self.files[path]
+        if callable(contents):
+            return contents()
+        return BytesIO(contents)
+
+    def get_dir(self, path, revnum, want_props=True, want_contents=True):
+        revnum = self._check_revnum(revnum)
+        prefix = path.strip(b"/")
+        if prefix:
+            prefix += b"/"
+        dirents = []
+        for (name, contents) in sorted(self.files.items()):
+            if not name.startswith(prefix) or b"/" in name[len(prefix):]:
+                continue
+            dirents.append({
+                "name": name[len(prefix):], "kind": "file",
+                "size": len(contents), "has-props": True,
+                "created-rev": revnum})
+        return (revnum, {}, dirents)
+
+    def replay(self, editor, revnum, low_water_mark, send_deltas=True):
+        revnum = self._check_revnum(revnum)
+        changed_paths = self.revisions[revnum][3]
+        # Stack of (path, editor) for the directories that are open
+        dirs = [(b"", editor.open_root(revnum - 1))]
+        for path in sorted(p.strip(b"/") for p in changed_paths):
+            (action, copyfrom_path, copyfrom_rev) = changed_paths[b"/" + path]
+            parent = path.rsplit(b"/", 1)[0] if b"/" in path else b""
+            while not (dirs[-1][0] == b"" or parent == dirs[-1][0] or
+                       parent.startswith(dirs[-1][0] + b"/")):
+                dirs.pop()[1].close()
+            while dirs[-1][0] != parent:
+                end = parent.find(b"/", len(dirs[-1][0]) + 1)
+                child = parent if end == -1 else parent[:end]
+                dirs.append(
+                    (child, dirs[-1][1].open_directory(child, revnum - 1)))
+            dir_editor = dirs[-1][1]
+            if action in ("D", "R"):
+                dir_editor.delete_entry(path, revnum - 1)
+            if action == "D":
+                continue
+            if action == "M":
+                file_editor = dir_editor.open_file(path, revnum - 1)
+            elif copyfrom_path is not None and copyfrom_rev >= low_water_mark:
+                file_editor = dir_editor.add_file(
+                    path, copyfrom_path, copyfrom_rev)
+            else:
+                file_editor = dir_editor.add_file(path)
+            if send_deltas and path in self.files:
+                delta.send_stream(self._open(path),
+                                  file_editor.apply_textdelta())
+            file_editor.close()
+        while dirs:
+            dirs.pop()[1].close()
+
+    def rev_proplist(self, revnum):
+        revnum = self._check_revnum(revnum)
+        (author, date, message, paths) = self.revisions[revnum]
+        return {properties.PROP_REVISION_AUTHOR: author,
+                properties.PROP_REVISION_DATE: date,
+                properties.PROP_REVISION_LOG: message}
+
+
+class MemoryBackend(ServerBackend):
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def open_repository(self, location):
+        return (self.repository, location)
+
+
+def make_revisions(count, message=b"message"):
+    return [(b"jelmer", b"2018-01-01T00:00:00.000000Z", message,
+             {b"/trunk/file%d" % i: ("M", None, -1)})
+            for i in range(count)]
+
+
+class SlowRepositoryBackend(MemoryRepositoryBackend):
+    """Repository backend whose log blocks until it is released."""
+
+    def __init__(self, revisions=None):
+        super(SlowRepositoryBackend, self).__init__(revisions)
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def log(self, *args):
+        self.started.set()
+        self.released.wait()
+        return super(SlowRepositoryBackend, self).log(*args)
+
+
+def wait_until(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class ServerThread(object):
+    """Runs a TCPSVNServer on localhost in a background thread."""
+
+    def __init__(self, backend, server_class=TCPSVNServer, **kwargs):
+        self.server = server_class(backend, ("127.0.0.1", 0), **kwargs)
+        self.thread = threading.Thread(
+            target=self.server.serve, kwargs={"poll_interval": 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "svn://%s:%d/repo" % self.server.server_address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class SSHVendorTests(TestCase):
+
+    def test_ssh_command(self):
+        self.assertEqual(
+            ["ssh", "-x", "-p", "2222", "jelmer@example.com", "svnserve",
+             "-t"],
+            SSHVendor().ssh_command(
+                "jelmer", "example.com", 2222, ["svnserve", "-t"]))
+
+    def test_control_master_command(self):
+        vendor = ControlMasterSSHVendor(control_dir="/tmp/ctl", persist=30)
+        self.assertEqual(
+            ["ssh", "-x", "-o", "ControlMaster=auto",
+             "-o", "ControlPath=/tmp/ctl/%C", "-o", "ControlPersist=30",
+             "example.com", "svnserve", "-t"],
+            vendor.ssh_command(None, "example.com", None,
+                               ["svnserve", "-t"]))
+
+    def test_default_control_dir_shared(self):
+        control_dir = ControlMasterSSHVendor().control_dir
+        self.assertTrue(os.path.isdir(control_dir))
+        self.assertEqual(control_dir, ControlMasterSSHVendor().control_dir)
+
+
+class SVNConnectionTests(TestCase):
+
+    def test_recv_msgs_in_blocks(self):
+        data = [marshall([literal("success"), [i, b"x" * i]])
+                for i in range(100)]
+        chunks = [b"".join(data)]
+        reads = []
+
+        def recv(count):
+            reads.append(count)
+            if not chunks:
+                return b""
+            return chunks.pop()
+        conn = SVNConnection(recv, None)
+        for i in range(100):
+            self.assertEqual([literal("success"), [i, b"x" * i]],
+                             conn.recv_msg())
+        self.assertEqual(1, len(reads))
+        self.assertRaises(SubversionException, conn.recv_msg)
+
+    def test_recv_msgs(self):
+        chunks = [b"( a 1:", b"x ) 3 4", b" "]
+        conn = SVNConnection(lambda count: chunks.pop(0), None)
+        msgs = conn.recv_msgs()
+        self.assertEqual([literal("a"), b"x"], next(msgs))
+        self.assertEqual(3, next(msgs))
+        self.assertEqual(4, next(msgs))
+
+    def test_connection_closed(self):
+        conn = SVNConnection(lambda count: b"( success ", None)
+        conn.recv_fn = lambda count: b""
+        try:
+            conn.recv_msg()
+        except SubversionException as e:
+            self.assertEqual(ERR_RA_SVN_CONNECTION_CLOSED, e.args[1])
+        else:
+            self.fail("connection close not detected")
+
+    def test_send_buffered_until_recv(self):
+        writes = []
+
+        def send(data):
+            writes.append(bytes(data))
+            return len(data)
+        conn = SVNConnection(lambda count: b"( success ( ) ) ", send)
+        conn.send_msg([literal("set-path"), [b"", 1, False]])
+        conn.send_msg([literal("finish-report"), []])
+        self.assertEqual([], writes)
+        conn.recv_msg()
+        self.assertEqual(
+            [b"( set-path ( 0: 1 0 ) ) ( finish-report ( ) ) "], writes)
+
+    def test_send_buffer_full(self):
+        writes = []
+
+        def send(data):
+            writes.append(len(data))
+            return len(data)
+        conn = SVNConnection(None, send)
+        chunk = b"x" * 1000
+        for i in range(SEND_BUFFER_SIZE // 1000 + 1):
+            conn.send_msg(chunk)
+        self.assertEqual(1, len(writes))
+        self.assertTrue(writes[0] >= SEND_BUFFER_SIZE)
+
+    def test_flush_partial_writes(self):
+        writes = []
+
+        def send(data):
+            writes.append(bytes(data[:3]))
+            return min(3, len(data))
+        conn = SVNConnection(None, send)
+        conn.send_msg(b"abcd")
+        conn.flush()
+        self.assertEqual([b"4:a", b"bcd", b" "], writes)
+        conn.flush()
+        self.assertEqual(3, len(writes))
+
+
+class ClientServerTests(TestCase):
+
+    def setUp(self):
+        super(ClientServerTests, self).setUp()
+        self.repository = MemoryRepositoryBackend(make_revisions(10))
+        self.server = ServerThread(MemoryBackend(self.repository))
+        self.addCleanup(self.server.stop)
+        self.client = SVNClient(self.server.url)
+        self.addCleanup(self.client.close)
+
+    def test_uuid(self):
+        self.assertEqual(b"memory", self.client.get_uuid())
+
+    def test_get_latest_revnum(self):
+        self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_log(self):
+        revs = list(self.client.log([b""], 1, 10))
+        self.assertEqual(list(range(1, 11)), [rev[1] for rev in revs])
+        (paths, revnum, revprops, has_children) = revs[0]
+        self.assertEqual({b"/trunk/file0": ("M", None, -1)}, paths)
+        self.assertEqual(b"message",
+                         revprops[properties.PROP_REVISION_LOG])
+
+    def test_log_limit(self):
+        revs = list(self.client.log([b""], 10, 1, limit=3))
+        self.assertEqual([10, 9, 8], [rev[1] for rev in revs])
+
+    def test_rev_proplist_range(self):
+        revs = list(self.client.rev_proplist_range(0, 10))
+        self.assertEqual(list(range(11)), [revnum for (revnum, props) in revs])
+        self.assertEqual({}, revs[0][1])
+        self.assertEqual(b"jelmer",
+                         revs[1][1][properties.PROP_REVISION_AUTHOR])
+
+    def test_rev_proplist_range_names(self):
+        for names in ([properties.PROP_REVISION_LOG],
+                      [properties.PROP_REVISION_LOG.encode("ascii")]):
+            revs = list(self.client.rev_proplist_range(10, 9, names))
+            self.assertEqual(
+                [(10, {properties.PROP_REVISION_LOG: b"message"}),
+                 (9, {properties.PROP_REVISION_LOG: b"message"})], revs)
+
+    def disable_log_revprops(self):
+        # Servers without log-revprops get pipelined rev-proplist commands
+        self.client._server_capabilities = [
+            c for c in self.client._server_capabilities
+            if c != "log-revprops"]
+
+    def test_rev_proplist_range_pipelined(self):
+        self.disable_log_revprops()
+        revs = list(self.client.rev_proplist_range(1, 10))
+        self.assertEqual(list(range(1, 11)),
+                         [revnum for (revnum, props) in revs])
+        self.assertEqual(b"jelmer",
+                         revs[0][1][properties.PROP_REVISION_AUTHOR])
+        self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_rev_proplist_range_pipelined_names(self):
+        self.disable_log_revprops()
+        for names in ([properties.PROP_REVISION_LOG],
+                      [properties.PROP_REVISION_LOG.encode("ascii")]):
+            revs = list(self.client.rev_proplist_range(10, 9, names))
+            self.assertEqual(
+                [(10, {properties.PROP_REVISION_LOG: b"message"}),
+                 (9, {properties.PROP_REVISION_LOG: b"message"})], revs)
+
+    def test_rev_proplist_range_subdir(self):
+        # The log is run against the repository root, since a log of the
+        # session URL only includes the revisions that changed it.
+        root_url = self.client.get_repos_root().decode("utf-8")
+        self.client.reparent(root_url + "/trunk")
+        log_urls = []
+        log = self.client.log
+
+        def recording_log(*args, **kwargs):
+            log_urls.append(self.client.url)
+            return log(*args, **kwargs)
+        self.client.log = recording_log
+        revs = list(self.client.rev_proplist_range(
+            1, 10, [properties.PROP_REVISION_LOG]))
+        self.assertEqual([root_url], log_urls)
+        self.assertEqual(list(range(1, 11)),
+                         [revnum for (revnum, props) in revs])
+        self.assertEqual(root_url + "/trunk", self.client.url)
+        self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_rev_proplist_range_abandoned(self):
+        root_url = self.client.get_repos_root().decode("utf-8")
+        for url in [root_url, root_url + "/trunk"]:
+            self.client.reparent(url)
+            revs = self.client.rev_proplist_range(1, 10)
+            self.assertEqual(1, next(revs)[0])
+            revs.close()
+            self.assertEqual(url, self.client.url)
+            self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_stat(self):
+        self.assertEqual(
+            {"kind": "file", "size": 0, "has-props": False,
+             "created-rev": 3, "created-date": b"2018-01-01T00:00:00.000000Z",
+             "last-author": b"jelmer"},
+            self.client.stat(b"trunk/file2"))
+        self.assertIs(None, self.client.stat(b"trunk/file2", 2))
+
+    def test_stat_response(self):
+        # Like svnserve, the server sends the dirent as an optional tuple
+        self.client.send_msg([literal("stat"), [b"trunk/file2", [2]]])
+        self.client._recv_ack()
+        self.assertEqual([[]], self.client._unpack())
+        self.client.send_msg([literal("stat"), [b"trunk/file2", []]])
+        self.client._recv_ack()
+        ret = self.client._unpack()
+        self.assertEqual(1, len(ret[0]))
+        self.assertEqual(literal("file"), ret[0][0][0])
+
+    def test_check_path(self):
+        self.assertEqual(NODE_FILE, self.client.check_path(b"trunk/file2"))
+        self.assertEqual(NODE_NONE,
+                         self.client.check_path(b"trunk/file2", 1))
+
+    def test_close(self):
+        self.client.close()
+        self.assertRaises(socket.error, self.client.get_latest_revnum)
+
+
+class SocketPairClient(SVNClient):
+    """SVNClient that talks over an already connected socket."""
+
+    def __init__(self, url, sock):
+        self._pair_socket = sock
+        super(SocketPairClient, self).__init__(url)
+
+    def _connect(self, host):
+        self._socket = self._pair_socket
+        return (self._socket.recv, self._socket.send)
+
+
+def serve_socket(backend, sock):
+    """Serve a single connection on a socket in a background thread."""
+    def serve():
+        server = SVNServer(backend, sock.recv, sock.sendall)
+        try:
+            server.serve()
+        except SubversionException as e:
+            if e.args[1] != ERR_RA_SVN_CONNECTION_CLOSED:
+                raise
+        finally:
+            sock.close()
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class ZeroStream(object):
+    """Stream of zero bytes that records the size of each read."""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.reads = []
+
+    def read(self, count):
+        self.reads.append(count)
+        count = min(count, self.remaining)
+        self.remaining -= count
+        return b"\0" * count
+
+
+class CountingSink(object):
+
+    def __init__(self):
+        self.length = 0
+        self.largest = 0
+
+    def write(self, data):
+        self.length += len(data)
+        self.largest = max(self.largest, len(data))
+
+
+class GetFileTests(TestCase):
+
+    def setUp(self):
+        super(GetFileTests, self).setUp()
+        self.repository = MemoryRepositoryBackend(make_revisions(10))
+        (server_sock, client_sock) = socket.socketpair()
+        thread = serve_socket(MemoryBackend(self.repository), server_sock)
+        self.addCleanup(thread.join)
+        self.client = SocketPairClient("svn://localhost/repo", client_sock)
+        self.addCleanup(self.client.close)
+
+    def test_get_file(self):
+        contents = b"".join(b"line %d\n" % i for i in range(100000))
+        self.repository.files[b"trunk/file"] = contents
+        f = BytesIO()
+        self.assertEqual((10, {b"svn:eol-style": b"native"}),
+                         self.client.get_file(b"trunk/file", f))
+        self.assertEqual(contents, f.getvalue())
+
+    def test_get_file_empty(self):
+        self.repository.files[b"trunk/empty"] = b""
+        f = BytesIO()
+        self.assertEqual(3, self.client.get_file(b"trunk/empty", f, 3)[0])
+        self.assertEqual(b"", f.getvalue())
+
+    def test_get_file_missing(self):
+        with self.assertRaises(SubversionException) as cm:
+            self.client.get_file(b"trunk/missing", BytesIO())
+        self.assertEqual(ERR_FS_NOT_FOUND, cm.exception.args[1])
+        self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_get_file_streams_in_chunks(self):
+        stream = ZeroStream(10 * FILE_CHUNK_SIZE + 1)
+        self.repository.files[b"trunk/big"] = lambda: stream
+        sink = CountingSink()
+        self.client.get_file(b"trunk/big", sink)
+        self.assertEqual(10 * FILE_CHUNK_SIZE + 1, sink.length)
+        self.assertEqual(FILE_CHUNK_SIZE, sink.largest)
+        self.assertEqual([FILE_CHUNK_SIZE], list(set(stream.reads)))
+
+    def test_get_dir(self):
+        self.repository.files.update({
+            b"trunk/a": b"aaa", b"trunk/b": b"b", b"trunk/sub/c": b"c",
+            b"README": b"readme"})
+        (dirents, revnum, props) = self.client.get_dir(b"trunk")
+        self.assertEqual(10, revnum)
+        self.assertEqual({}, props)
+        self.assertEqual([b"a", b"b"], sorted(dirents))
+        self.assertEqual(3, dirents[b"a"]["size"])
+        self.assertEqual("file", dirents[b"a"]["kind"])
+
+
+class RecordingEditor(object):
+    """Editor that records the calls made to it as tuples."""
+
+    def __init__(self, log, path=b""):
+        self.log = log
+        self.path = path
+
+    def open_root(self, base_revision=None):
+        self.log.append(("open-root", base_revision))
+        return self
+
+    def open_directory(self, path, base_revision):
+        self.log.append(("open-dir", path))
+        return RecordingEditor(self.log, path)
+
+    def delete_entry(self, path, base_revision):
+        self.log.append(("delete-entry", path))
+
+    def add_file(self, path, copyfrom_path=None, copyfrom_rev=-1):
+        self.log.append(("add-file", path, copyfrom_path, copyfrom_rev))
+        return RecordingEditor(self.log, path)
+
+    def open_file(self, path, base_revision):
+        self.log.append(("open-file", path))
+        return RecordingEditor(self.log, path)
+
+    def apply_textdelta(self, base_checksum=None):
+        stream = BytesIO()
+        self.log.append(("apply-textdelta", self.path, stream))
+        return delta.apply_txdelta_handler(b"", stream)
+
+    def close(self, checksum=None):
+        self.log.append(("close", self.path))
+
+    def abort(self):
+        self.log.append(("abort", ))
+
+
+class ReplayTests(TestCase):
+
+    def setUp(self):
+        super(ReplayTests, self).setUp()
+        self.repository = MemoryRepositoryBackend(make_revisions(50))
+        (server_sock, client_sock) = socket.socketpair()
+        thread = serve_socket(MemoryBackend(self.repository), server_sock)
+        self.addCleanup(thread.join)
+        self.client = SocketPairClient("svn://localhost/repo", client_sock)
+        self.addCleanup(self.client.close)
+
+    def test_replay(self):
+        self.repository.files[b"trunk/file4"] = b"contents\n"
+        log = []
+        self.client.replay(5, 0, RecordingEditor(log))
+        self.assertEqual(
+            [("open-root", 4), ("open-dir", b"trunk"),
+             ("open-file", b"trunk/file4"),
+             ("apply-textdelta", b"trunk/file4", log[3][2]),
+             ("close", b"trunk/file4"), ("close", b"trunk"), ("close", b"")],
+            log)
+        self.assertEqual(b"contents\n", log[3][2].getvalue())
+        # The connection is still usable afterwards
+        self.assertEqual(50, self.client.get_latest_revnum())
+
+    def test_replay_without_deltas(self):
+        self.repository.files[b"trunk/file4"] = b"contents\n"
+        log = []
+        self.client.replay(5, 0, RecordingEditor(log), False)
+        self.assertEqual([], [e for e in log if e[0] == "apply-textdelta"])
+
+    def test_replay_low_water_mark(self):
+        self.repository.revisions.append(
+            (b"jelmer", b"2018-01-01T00:00:00.000000Z", b"copy",
+             {b"/branches/file": ("A", b"/trunk/file9", 10)}))
+        log = []
+        self.client.replay(51, 5, RecordingEditor(log))
+        self.assertIn(("add-file", b"branches/file", b"/trunk/file9", 10),
+                      log)
+        log = []
+        self.client.replay(51, 11, RecordingEditor(log))
+        self.assertIn(("add-file", b"branches/file", None, -1), log)
+
+    def test_replay_missing_revision(self):
+        with self.assertRaises(SubversionException) as cm:
+            self.client.replay(100, 0, RecordingEditor([]))
+        self.assertEqual(ERR_FS_NO_SUCH_REVISION, cm.exception.args[1])
+        self.assertEqual(50, self.client.get_latest_revnum())
+
+    def test_replay_range(self):
+        started = []
+        finished = []
+
+        def revstart(revnum, revprops):
+            started.append((revnum, revprops[b"svn:log"]))
+            return RecordingEditor([])
+
+        def revfinish(revnum, revprops, editor):
+            finished.append((revnum, editor.log[2]))
+
+        self.client.replay_range(1, 50, 0, (revstart, revfinish))
+        self.assertEqual([(i, b"message") for i in range(1, 51)], started)
+        self.assertEqual(
+            [(i, ("open-file", b"trunk/file%d" % (i - 1)))
+             for i in range(1, 51)], finished)
+        self.assertEqual(50, self.client.get_latest_revnum())
+
+    def test_replay_range_streams(self):
+        sent = []
+        send_fn = self.client.send_fn
+
+        def counting_send(data):
+            sent.append(data)
+            return send_fn(data)
+        self.client.send_fn = counting_send
+        self.client.replay_range(
+            1, 50, 0,
+            (lambda revnum, revprops: RecordingEditor([]),
+             lambda revnum, revprops, editor: None))
+        # Only the command itself; no round trip per revision
+        self.assertEqual(1, len(sent))
+
+
+class PipelineTests(TestCase):
+
+    def setUp(self):
+        super(PipelineTests, self).setUp()
+        self.repository = MemoryRepositoryBackend(make_revisions(10))
+        self.server = ServerThread(MemoryBackend(self.repository))
+        self.addCleanup(self.server.stop)
+        self.client = SVNClient(self.server.url)
+        self.addCleanup(self.client.close)
+
+    def test_results_in_order(self):
+        with self.client.pipeline() as pipeline:
+            futures = [pipeline.check_path(b"trunk/file%d" % i, 5)
+                       for i in range(10)]
+            latest = pipeline.get_latest_revnum()
+            self.assertEqual(11, len(pipeline))
+        self.assertEqual([NODE_FILE] * 5 + [NODE_NONE] * 5,
+                         [f.result() for f in futures])
+        self.assertEqual(10, latest.result())
+        self.assertEqual(10, self.client.get_latest_revnum())
+
+    def test_result_reads_up_to_response(self):
+        pipeline = self.client.pipeline()
+        first = pipeline.get_latest_revnum()
+        second = pipeline.stat(b"trunk/file0")
+        self.assertFalse(first.done())
+        self.assertEqual(10, first.result())
+        self.assertFalse(second.done())
+        self.assertEqual(1, len(pipeline))
+        self.assertEqual(1, second.result()["created-rev"])
+        self.assertEqual(0, len(pipeline))
+
+    def test_writes_commands_back_to_back(self):
+        writes = []
+        send_fn = self.client.send_fn
+
+        def send(data):
+            writes.append(len(data))
+            return send_fn(data)
+        self.client.send_fn = send
+        with self.client.pipeline() as pipeline:
+            for i in range(50):
+                pipeline.rev_prop(i % 10, b"svn:log")
+        self.assertEqual(1, len(writes))
+
+    def test_failure(self):
+        with self.client.pipeline() as pipeline:
+            bad = pipeline.rev_proplist(42)
+            good = pipeline.rev_proplist(1)
+        self.assertRaises(SubversionException, bad.result)
+        self.assertEqual(b"message", good.result()[b"svn:log"])
+
+    def test_without_edit_pipeline(self):
+        self.client._server_capabilities.remove("edit-pipeline")
+        with self.client.pipeline() as pipeline:
+            first = pipeline.get_latest_revnum()
+            second = pipeline.get_latest_revnum()
+            self.assertTrue(first.done())
+            self.assertFalse(second.done())
+        self.assertEqual(10, second.result())
+
+
+class ThreadingTCPSVNServerTests(TestCase):
+
+    def setUp(self):
+        super(ThreadingTCPSVNServerTests, self).setUp()
+        self.repository = SlowRepositoryBackend(make_revisions(10))
+
+    def start_server(self, **kwargs):
+        server = ServerThread(
+            MemoryBackend(self.repository), ThreadingTCPSVNServer, **kwargs)
+        self.addCleanup(server.stop)
+        return server
+
+    def connect(self, server):
+        client = SVNClient(server.url)
+        self.addCleanup(client.close)
+        return client
+
+    def start_log(self, client):
+        thread = threading.Thread(
+            target=lambda: list(client.log([b""], 1, 10)))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.repository.released.set)
+        self.repository.started.wait()
+        return thread
+
+    def test_slow_command_does_not_block_others(self):
+        server = self.start_server(max_workers=2)
+        self.start_log(self.connect(server))
+        self.assertEqual(10, self.connect(server).get_latest_revnum())
+        self.assertEqual(2, server.server.busy_workers)
+
+    def test_queue_limit(self):
+        server = self.start_server(max_workers=1, max_queue=1)
+        client = self.connect(server)
+        log = self.start_log(client)
+        queued = []
+        thread = threading.Thread(
+            target=lambda: queued.append(SVNClient(server.url)))
+        thread.start()
+        wait_until(lambda: server.server.queue_depth == 1)
+        with self.assertRaises(SubversionException) as cm:
+            SVNClient(server.url)
+        self.assertEqual(ERR_RA_CANNOT_CREATE_SESSION, cm.exception.args[1])
+        self.assertEqual(1, server.server.refused_connections)
+        # The queued client is served once the worker is done with the
+        # first connection.
+        self.repository.released.set()
+        log.join()
+        client.close()
+        thread.join()
+        self.addCleanup(queued[0].close)
+        self.assertEqual(10, queued[0].get_latest_revnum())
+
+    def test_metrics(self):
+        server = self.start_server()
+        client = self.connect(server)
+        client.get_latest_revnum()
+        client.stat(b"trunk/file1")
+        client.close()
+        wait_until(lambda: server.server.connection_metrics)
+        [metrics] = server.server.connection_metrics
+        self.assertEqual(2, metrics.requests)
+        self.assertTrue(metrics.bytes_in > 0)
+        self.assertTrue(metrics.bytes_out > 0)
+        self.assertTrue(metrics.duration >= metrics.handler_time)
+
+
+class ForkingTCPSVNServerTests(TestCase):
+
+    def setUp(self):
+        super(ForkingTCPSVNServerTests, self).setUp()
+        if not hasattr(os, "fork"):
+            self.skipTest("fork not available")
+
+    def test_metrics(self):
+        from subvertpy.ra_svn import ForkingTCPSVNServer
+        server = ServerThread(
+            MemoryBackend(MemoryRepositoryBackend(make_revisions(10))),
+            ForkingTCPSVNServer, max_workers=2)
+        self.addCleanup(server.stop)
+        clients = [SVNClient(server.url) for i in range(2)]
+        for client in clients:
+            self.assertEqual(10, client.get_latest_revnum())
+            client.close()
+        wait_until(lambda: len(server.server.connection_metrics) == 2)
+        self.assertEqual(
+            [1, 1], [m.requests for m in server.server.connection_metrics])
@@ -0,0 +1,303 @@
+# Copyright (C) 2018 Jelmer Vernooij <jelmer@jelmer.uk>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the asyncio svn:// client."""
+
+import asyncio
+
+from subvertpy import (
+    ERR_RA_CANNOT_CREATE_SESSION,
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    SubversionException,
+    properties,
+    )
+from subvertpy.delta import TXDELTA_NEW
+from subvertpy.ra_svn import (
+    Editor,
+    SVNServer,
+    )
+from subvertpy.ra_svn_async import (
+    AsyncSVNClient,
+    AsyncSVNServer,
+    )
+from subvertpy.tests import TestCase
+from subvertpy.tests.test_ra_svn import (
+    MemoryBackend,
+    MemoryRepositoryBackend,
+    ServerThread,
+    make_revisions,
+    )
+
+
+class RecordingEditor(object):
+    """Editor that records the calls made to it."""
+
+    def __init__(self, log, path=None):
+        self.log = log
+        self.path = path
+
+    def set_target_revision(self, revnum):
+        self.log.append(("set-target-revision", revnum))
+
+    def open_root(self, base_revision=None):
+        self.log.append(("open-root", base_revision))
+        return RecordingEditor(self.log, b"")
+
+    def add_file(self, path, copyfrom_path=None, copyfrom_rev=-1):
+        self.log.append(("add-file", path))
+        return RecordingEditor(self.log, path)
+
+    def apply_textdelta(self, base_checksum=None):
+        windows = []
+        self.log.append(("apply-textdelta", self.path, windows))
+        return windows.append
+
+    def close(self, checksum=None):
+        self.log.append(("close", self.path))
+
+
+class ReplayServer(SVNServer):
+    """Server that replays every revision as adding a single file."""
+
+    def replay(self, revnum, low_water_mark, send_deltas):
+        self.send_ack()
+        editor = Editor(self)
+        root = editor.open_root(revnum - 1)
+        f = root.add_file(b"file%d" % revnum)
+        handler = f.apply_textdelta()
+        handler((0, 0, 5, 1, [(TXDELTA_NEW, 0, 5)], b"text\n"))
+        handler(None)
+        f.close()
+        root.close()
+        editor.close()
+        self.recv_msg()
+        self.send_success()
+
+    commands = dict(SVNServer.commands)
+    commands["replay"] = replay
+
+
+class ReplayServerThread(ServerThread):
+
+    def __init__(self, backend):
+        super(ReplayServerThread, self).__init__(backend)
+        self.server.RequestHandlerClass = self._handler
+
+    def _handler(self, request, client_address, server):
+        conn = ReplayServer(server._backend, request.recv, request.sendall)
+        try:
+            conn.serve()
+        except SubversionException as e:
+            if e.args[1] != ERR_RA_SVN_CONNECTION_CLOSED:
+                raise
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncSVNClientTests(TestCase):
+
+    def setUp(self):
+        super(AsyncSVNClientTests, self).setUp()
+        self.repository = MemoryRepositoryBackend(make_revisions(10))
+        self.server = ServerThread(MemoryBackend(self.repository))
+        self.addCleanup(self.server.stop)
+
+    def test_get_latest_revnum(self):
+        async def check():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                self.assertEqual(b"memory", c.get_uuid())
+                return await c.get_latest_revnum()
+        self.assertEqual(10, run(check()))
+
+    def test_stat(self):
+        async def check():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                return await c.stat(b"trunk/file2")
+        self.assertEqual(3, run(check())["created-rev"])
+
+    def test_rev_proplist(self):
+        async def check():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                return await c.rev_proplist(4)
+        self.assertEqual(b"jelmer", run(check())[b"svn:author"])
+
+    def test_log(self):
+        async def check():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                revs = []
+                async for entry in c.log([b""], 1, 10):
+                    revs.append(entry)
+                return revs
+        revs = run(check())
+        self.assertEqual(list(range(1, 11)), [rev[1] for rev in revs])
+        self.assertEqual(b"message",
+                         revs[0][2][properties.PROP_REVISION_LOG])
+
+    def test_concurrent_clients(self):
+        async def latest():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                return await c.get_latest_revnum()
+
+        async def check():
+            return await asyncio.gather(*[latest() for i in range(5)])
+        # TCPSVNServer handles one connection at a time, so this mostly
+        # checks that the clients don't interfere with each other.
+        self.assertEqual([10] * 5, run(check()))
+
+    def test_commands_on_shared_client(self):
+        async def check():
+            async with await AsyncSVNClient.connect(self.server.url) as c:
+                return await asyncio.gather(
+                    c.get_latest_revnum(), c.stat(b"trunk/file0"),
+                    c.rev_proplist(1))
+        (latest, dirent, revprops) = run(check())
+        self.assertEqual(10, latest)
+        self.assertEqual(1, dirent["created-rev"])
+
+
+class AsyncReplayTests(TestCase):
+
+    def test_replay(self):
+        server = ReplayServerThread(
+            MemoryBackend(MemoryRepositoryBackend(make_revisions(3))))
+        self.addCleanup(server.stop)
+        log = []
+
+        async def check():
+            async with await AsyncSVNClient.connect(server.url) as c:
+                await c.replay(2, 0, RecordingEditor(log))
+                return await c.get_latest_revnum()
+        self.assertEqual(3, run(check()))
+        self.assertEqual([
+            ("open-root", 1),
+            ("add-file", b"file2"),
+            ("apply-textdelta", b"file2",
+             [(0, 0, 5, 1, [(TXDELTA_NEW, 0, 5)], b"text\n"), None]),
+            ("close", b"file2"),
+            ("close", b""),
+            ], log[:5])
+
+
+class AsyncSVNServerTests(TestCase):
+
+    def setUp(self):
+        super(AsyncSVNServerTests, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.backend = MemoryBackend(
+            MemoryRepositoryBackend(make_revisions(10)))
+
+    def start_server(self, **kwargs):
+        server = AsyncSVNServer(self.backend, **kwargs)
+        self.loop.run_until_complete(server.start("127.0.0.1", 0))
+
+        def stop():
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+        self.addCleanup(stop)
+        return (server, "svn://%s:%d/repo" % server.server_address)
+
+    def test_commands(self):
+        (server, url) = self.start_server()
+
+        async def check():
+            async with await AsyncSVNClient.connect(url) as c:
+                self.assertEqual(1, server.active_connections)
+                return (c.get_uuid(), await c.get_latest_revnum(),
+                        (await c.stat(b"trunk/file3"))["created-rev"])
+        self.assertEqual((b"memory", 10, 4),
+                         self.loop.run_until_complete(check()))
+
+    def test_error(self):
+        (server, url) = self.start_server()
+
+        async def check():
+            async with await AsyncSVNClient.connect(url) as c:
+                with self.assertRaises(SubversionException):
+                    await c.rev_proplist(20)
+                return await c.get_latest_revnum()
+        self.assertEqual(10, self.loop.run_until_complete(check()))
+
+    def test_concurrent_clients(self):
+        (server, url) = self.start_server()
+
+        async def fetch_log():
+            async with await AsyncSVNClient.connect(url) as c:
+                return [entry[1] async for entry in c.log([b""], 1, 10)]
+
+        async def check():
+            return await asyncio.gather(*[fetch_log() for i in range(20)])
+        self.assertEqual([list(range(1, 11))] * 20,
+                         self.loop.run_until_complete(check()))
+
+    def test_large_response(self):
+        # Responses bigger than the send buffer are sent by the command
+        # while it is still running.
+        self.backend = MemoryBackend(
+            MemoryRepositoryBackend(make_revisions(2000, b"x" * 100)))
+        (server, url) = self.start_server()
+
+        async def check():
+            async with await AsyncSVNClient.connect(url) as c:
+                return [entry[1] async for entry in c.log([b""], 1, 2000)]
+        self.assertEqual(list(range(1, 2001)),
+                         self.loop.run_until_complete(check()))
+
+    def test_max_connections(self):
+        (server, url) = self.start_server(max_connections=1)
+
+        async def check():
+            async with await AsyncSVNClient.connect(url) as c:
+                with self.assertRaises(SubversionException) as cm:
+                    await AsyncSVNClient.connect(url)
+                self.assertEqual(ERR_RA_CANNOT_CREATE_SESSION,
+                                 cm.exception.args[1])
+                return await c.get_latest_revnum()
+        self.assertEqual(10, self.loop.run_until_complete(check()))
+
+    def test_idle_timeout(self):
+        (server, url) = self.start_server(idle_timeout=0.05)
+
+        async def check():
+            c = await AsyncSVNClient.connect(url)
+            try:
+                self.assertEqual(10, await c.get_latest_revnum())
+                await asyncio.sleep(0.2)
+                self.assertEqual(0, server.active_connections)
+                with self.assertRaises(SubversionException) as cm:
+                    await c.get_latest_revnum()
+                self.assertEqual(ERR_RA_SVN_CONNECTION_CLOSED,
+                                 cm.exception.args[1])
+            finally:
+                c.close()
+        self.loop.run_until_complete(check())
+
+    def test_command_reading_from_client(self):
+        (server, url) = self.start_server()
+        server.connection_class = ReplayServer
+        log = []
+
+        async def check():
+            async with await AsyncSVNClient.connect(url) as c:
+                await c.replay(3, 0, RecordingEditor(log))
+                return await c.get_latest_revnum()
+        self.assertEqual(10, self.loop.run_until_complete(check()))
+        self.assertEqual(("add-file", b"file3"), log[1])
@@ -17,6 +17,7 @@
 
 from io import BytesIO
 import os
+import sys
 import textwrap
 
 from subvertpy import repos, SubversionException
@@ -74,17 +75,8 @@ class TestRepository(TestCaseInTempDir):
         self.assertTrue(
             repos.Repository("foo").fs().revision_root(0) is not None)
 
-    def test_load_fs_invalid(self):
-        r = repos.create(os.path.join(self.test_dir, "foo"))
-        dumpfile = b"Malformed"
-        feedback = BytesIO()
-        self.assertRaises(
-            SubversionException, r.load_fs, BytesIO(dumpfile),
-            feedback, repos.LOAD_UUID_DEFAULT)
-
-    def test_load_fs(self):
-        r = repos.create(os.path.join(self.test_dir, "foo"))
-        dumpfile = textwrap.dedent("""\
+    def dumpfile(self):
+        return textwrap.dedent("""\
         SVN-fs-dump-format-version: 2
 
         UUID: 38f0a982-fd1f-4e00-aa6b-a20720f4b9ca
@@ -99,11 +91,77 @@ class TestRepository(TestCaseInTempDir):
         2011-08-26T13:08:30.187858Z
         PROPS-END
         """).encode("ascii")
+
+    def test_load_fs_invalid(self):
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+        dumpfile = b"Malformed"
+        feedback = BytesIO()
+        self.assertRaises(
+            SubversionException, r.load_fs, BytesIO(dumpfile),
+            feedback, repos.LOAD_UUID_DEFAULT)
+
+    def test_load_fs(self):
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+        dumpfile = self.dumpfile()
         feedback = BytesIO()
         r.load_fs(BytesIO(dumpfile), feedback, repos.LOAD_UUID_DEFAULT)
         self.assertEqual(r.fs().get_uuid(),
                          "38f0a982-fd1f-4e00-aa6b-a20720f4b9ca")
 
+    def test_load_fs_raw_file(self):
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+        with open("dump", "wb") as f:
+            f.write(self.dumpfile())
+        with open("dump", "rb", buffering=0) as f:
+            r.load_fs(f, BytesIO(), repos.LOAD_UUID_DEFAULT)
+        self.assertEqual(r.fs().get_uuid(),
+                         "38f0a982-fd1f-4e00-aa6b-a20720f4b9ca")
+
+    def test_load_fs_readinto(self):
+        if sys.version_info[0] < 3:
+            self.skipTest("readinto is only used on Python 3")
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+
+        class Reader(BytesIO):
+
+            def read(self, size=-1):
+                raise AssertionError("readinto should be used")
+
+        r.load_fs(Reader(self.dumpfile()), BytesIO(),
+                  repos.LOAD_UUID_DEFAULT)
+        self.assertEqual(r.fs().get_uuid(),
+                         "38f0a982-fd1f-4e00-aa6b-a20720f4b9ca")
+
+    def test_load_fs_readinto_error(self):
+        if sys.version_info[0] < 3:
+            self.skipTest("readinto is only used on Python 3")
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+
+        class Reader(object):
+
+            def readinto(self, b):
+                self.buffer = b
+                raise ValueError("read failed")
+
+        reader = Reader()
+        self.assertRaises(ValueError, r.load_fs, reader, BytesIO(),
+                          repos.LOAD_UUID_DEFAULT)
+        # The buffer is no longer accessible once svn is done with it
+        self.assertRaises(ValueError, bytes, reader.buffer)
+
+    def test_load_fs_readinto_nonblocking(self):
+        if sys.version_info[0] < 3:
+            self.skipTest("readinto is only used on Python 3")
+        r = repos.create(os.path.join(self.test_dir, "foo"))
+
+        class Reader(object):
+
+            def readinto(self, b):
+                return None
+
+        self.assertRaises(BlockingIOError, r.load_fs, Reader(), BytesIO(),
+                          repos.LOAD_UUID_DEFAULT)
+
     def test_rev_props(self):
         repos.create(os.path.join(self.test_dir, "foo"))
         self.assertEqual(
@@ -160,3 +218,9 @@ class StreamTests(TestCase):
         self.assertEqual(0, s.write(b""))
         self.assertEqual(2, s.write(b"ab"))
         s.close()
+
+    def test_write_buffer(self):
+        s = repos.Stream()
+        self.assertEqual(2, s.write(bytearray(b"ab")))
+        self.assertEqual(3, s.write(memoryview(b"abc")))
+        s.close()
@@ -847,21 +847,96 @@ apr_array_header_t *revnum_list_to_apr_array(apr_pool_t *pool, PyObject *l)
 }
 
 
+struct py_stream_baton {
+	PyObject *py;
+	/* Set for raw files, which are then read and written without
+	 * going through Python (or taking the GIL) at all */
+	apr_file_t *file;
+	bool readinto;
+};
+
 static svn_error_t *py_stream_read(void *baton, char *buffer, apr_size_t *length)
 {
-	PyObject *self = (PyObject *)baton, *ret;
-	PyGILState_STATE state = PyGILState_Ensure();
+	struct py_stream_baton *b = baton;
+	PyObject *ret;
+	PyGILState_STATE state;
+	Py_buffer view;
+
+	if (b->file != NULL) {
+		apr_status_t status;
+		status = apr_file_read_full(b->file, buffer, *length, length);
+		if (status != APR_SUCCESS && !APR_STATUS_IS_EOF(status))
+			return svn_error_wrap_apr(status, NULL);
+		return NULL;
+	}
+
+	state = PyGILState_Ensure();
+
+#if PY_MAJOR_VERSION >= 3
+	if (b->readinto) {
+		/* Have the object fill svn's buffer directly */
+		PyObject *py_buffer, *exc_type, *exc_value, *exc_tb;
+		Py_ssize_t n = -1;
+
+		py_buffer = PyMemoryView_FromMemory(buffer, *length, PyBUF_WRITE);
+		CB_CHECK_PYRETVAL(py_buffer);
+		ret = PyObject_CallMethod(b->py, "readinto", "O", py_buffer);
+		if (ret == Py_None) {
+			/* No data available on a non-blocking stream; svn streams
+			 * block, and reporting 0 bytes would mean end of file */
+			PyErr_SetString(PyExc_BlockingIOError,
+							"readinto() on a non-blocking stream returned None");
+		} else if (ret != NULL) {
+			n = PyLong_AsSsize_t(ret);
+		}
+		Py_XDECREF(ret);
+
+		/* Release the view on every path, since a traceback could
+		 * otherwise keep it alive after svn has freed the buffer */
+		PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+		ret = PyObject_CallMethod(py_buffer, "release", "");
+		Py_DECREF(py_buffer);
+		if (exc_type != NULL) {
+			Py_XDECREF(ret);
+			PyErr_Restore(exc_type, exc_value, exc_tb);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		CB_CHECK_PYRETVAL(ret);
+		Py_DECREF(ret);
+		if (n < 0 || n > *length) {
+			PyErr_Format(PyExc_ValueError,
+						 "readinto() returned %zd, outside of [0, %lu]",
+						 n, (unsigned long)*length);
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		*length = n;
+		PyGILState_Release(state);
+		return NULL;
+	}
+#endif
 
-	ret = PyObject_CallMethod(self, "read", "i", *length);
+	ret = PyObject_CallMethod(b->py, "read", "i", *length);
 	CB_CHECK_PYRETVAL(ret);
 
-	if (!PyBytes_Check(ret)) {
+	if (PyObject_GetBuffer(ret, &view, PyBUF_SIMPLE) != 0) {
+		Py_DECREF(ret);
 		PyErr_SetString(PyExc_TypeError, "Expected stream read function to return bytes");
 		PyGILState_Release(state);
 		return py_svn_error();
 	}
-	*length = PyBytes_Size(ret);
-	memcpy(buffer, PyBytes_AsString(ret), *length);
+	if (view.len > *length) {
+		PyBuffer_Release(&view);
+		Py_DECREF(ret);
+		PyErr_SetString(PyExc_ValueError,
+						"Stream read function returned more data than requested");
+		PyGILState_Release(state);
+		return py_svn_error();
+	}
+	*length = view.len;
+	memcpy(buffer, view.buf, *length);
+	PyBuffer_Release(&view);
 	Py_DECREF(ret);
 	PyGILState_Release(state);
 	return NULL;
@@ -869,13 +944,25 @@ static svn_error_t *py_stream_read(void *baton, char *buffer, apr_size_t *length
 
 static svn_error_t *py_stream_write(void *baton, const char *data, apr_size_t *len)
 {
-	PyObject *self = (PyObject *)baton, *ret, *py_data;
-	PyGILState_STATE state = PyGILState_Ensure();
+	struct py_stream_baton *b = baton;
+	PyObject *ret, *py_data;
+	PyGILState_STATE state;
+
+	if (b->file != NULL) {
+		apr_status_t status;
+		status = apr_file_write_full(b->file, data, *len, NULL);
+		if (status != APR_SUCCESS)
+			return svn_error_wrap_apr(status, NULL);
+		return NULL;
+	}
+
+	state = PyGILState_Ensure();
 
 	py_data = PyBytes_FromStringAndSize(data, *len);
 	CB_CHECK_PYRETVAL(py_data);
 
-	ret = PyObject_CallMethod(self, "write", "O", py_data);
+	ret = PyObject_CallMethod(b->py, "write", "O", py_data);
+	Py_DECREF(py_data);
 	CB_CHECK_PYRETVAL(ret);
 	Py_DECREF(ret);
 	PyGILState_Release(state);
@@ -884,20 +971,64 @@ static svn_error_t *py_stream_write(void *baton, const char *data, apr_size_t *l
 
 static svn_error_t *py_stream_close(void *baton)
 {
-	PyObject *self = (PyObject *)baton, *ret;
+	struct py_stream_baton *b = baton;
+	PyObject *ret;
 	PyGILState_STATE state = PyGILState_Ensure();
-	ret = PyObject_CallMethod(self, "close", "");
-	Py_DECREF(self);
+	ret = PyObject_CallMethod(b->py, "close", "");
+	Py_DECREF(b->py);
 	CB_CHECK_PYRETVAL(ret);
 	Py_DECREF(ret);
 	PyGILState_Release(state);
 	return NULL;
 }
 
+/* Check whether py is an unbuffered file (io.FileIO), which can be
+ * accessed through its file descriptor without getting out of sync with
+ * Python. Buffered files can not, since they may hold data that has been
+ * read ahead or not been written yet. */
+static int py_is_raw_file(PyObject *py)
+{
+	PyObject *io, *file_io;
+	int ret;
+
+	io = PyImport_ImportModule("io");
+	if (io == NULL)
+		return -1;
+	file_io = PyObject_GetAttrString(io, "FileIO");
+	Py_DECREF(io);
+	if (file_io == NULL)
+		return -1;
+	ret = PyObject_IsInstance(py, file_io);
+	Py_DECREF(file_io);
+	return ret;
+}
+
 svn_stream_t *new_py_stream(apr_pool_t *pool, PyObject *py)
 {
 	svn_stream_t *stream;
-	stream = svn_stream_create((void *)py, pool);
+	struct py_stream_baton *baton;
+	int raw;
+
+	baton = apr_pcalloc(pool, sizeof(struct py_stream_baton));
+	if (baton == NULL) {
+		PyErr_NoMemory();
+		return NULL;
+	}
+	baton->py = py;
+
+	raw = py_is_raw_file(py);
+	if (raw == -1)
+		return NULL;
+	if (raw) {
+		baton->file = apr_file_from_object(py, pool);
+		if (baton->file == NULL) {
+			/* e.g. closed; leave it to Python to complain */
+			PyErr_Clear();
+		}
+	}
+	baton->readinto = PyObject_HasAttrString(py, "readinto");
+
+	stream = svn_stream_create((void *)baton, pool);
 	if (stream == NULL) {
 		PyErr_SetString(PyExc_RuntimeError,
 						"Unable to create a Subversion stream");
@@ -1069,20 +1200,31 @@ static PyObject *stream_close(StreamObject *self)
 
 static PyObject *stream_write(StreamObject *self, PyObject *args)
 {
-	char *buffer;
-	int len;
-	size_t length;
-	if (!PyArg_ParseTuple(args, "s#", &buffer, &len))
+	Py_buffer buffer;
+	apr_size_t length;
+	svn_error_t *err;
+
+	/* Accepts any bytes-like object, without copying it */
+	if (!PyArg_ParseTuple(args, "s*", &buffer))
 		return NULL;
 
 	if (self->closed) {
+		PyBuffer_Release(&buffer);
 		PyErr_SetString(PyExc_RuntimeError, "unable to write: stream already closed");
 		return NULL;
 	}
 
-	length = len;
+	length = buffer.len;
 
-	RUN_SVN(svn_stream_write(self->stream, buffer, &length));
+	Py_BEGIN_ALLOW_THREADS
+	err = svn_stream_write(self->stream, buffer.buf, &length);
+	Py_END_ALLOW_THREADS
+	PyBuffer_Release(&buffer);
+	if (err != NULL) {
+		handle_svn_error(err);
+		svn_error_clear(err);
+		return NULL;
+	}
 
 	return PyLong_FromLong(length);
 }
@@ -2156,6 +2156,15 @@ moduleinit(void)
 	if (PyType_Ready(&TxDeltaWindowHandler_Type) < 0)
 		return NULL;
 
+	if (PyType_Ready(&TxDeltaWindow_Type) < 0)
+		return NULL;
+
+	if (PyType_Ready(&TxDeltaOps_Type) < 0)
+		return NULL;
+
+	if (PyType_Ready(&TxDeltaTarget_Type) < 0)
+		return NULL;
+
 	if (PyType_Ready(&Stream_Type) < 0)
 		return NULL;
 